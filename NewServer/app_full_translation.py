@@ -1,7 +1,7 @@
 # 完整版翻译功能集成后端
 # 基于app_with_translation.py，添加完整的翻译功能
 
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, Response, request, jsonify, send_file, stream_with_context
 from flask_cors import CORS
 from flask_sqlalchemy import SQLAlchemy
 from flask_jwt_extended import JWTManager, jwt_required, create_access_token, get_jwt_identity, get_jwt
@@ -17,10 +17,30 @@ import subprocess
 import argparse
 import sys
 import uuid
+import shutil
+import hashlib
+import tempfile
+import threading
+import signal
+import atexit
+import difflib
+import unicodedata
+import codecs
+from contextlib import contextmanager
+from collections import OrderedDict, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+try:
+    import resource
+except ImportError:
+    # Windows没有resource模块，编译时只保留墙钟时间限制
+    resource = None
 from datetime import datetime, timedelta
 from pathlib import Path
 import requests
 from urllib.parse import urljoin, urlparse
+from html.parser import HTMLParser
+from email.utils import parsedate_to_datetime
 from bs4 import BeautifulSoup
 from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.utils import secure_filename
@@ -43,6 +63,17 @@ try:
 except ImportError:
     SELENIUM_AVAILABLE = False
 
+try:
+    from lxml import etree as lxml_etree
+    LXML_AVAILABLE = True
+except ImportError:
+    LXML_AVAILABLE = False
+
+try:
+    from server_config import LATEX_CONFIG
+except ImportError:
+    LATEX_CONFIG = {}
+
 try:
     from pyppeteer import launch
     from PIL import Image
@@ -57,7 +88,7 @@ CORS(app)
 
 # 配置
 app.config['SECRET_KEY'] = 'your-secret-key-change-this-in-production'
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///translation_platform.db'
+app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL', 'sqlite:///translation_platform.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['JWT_SECRET_KEY'] = 'jwt-secret-key-change-this-in-production'
 app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(hours=24)
@@ -77,6 +108,8 @@ os.makedirs('web_translation_output', exist_ok=True)
 os.makedirs('uploads', exist_ok=True)
 os.makedirs('image_translation_output', exist_ok=True)
 os.makedirs('formula_output', exist_ok=True)
+os.makedirs('latex_format_cache', exist_ok=True)
+os.makedirs('latex_pdf_cache', exist_ok=True)
 
 
 # JWT Token黑名单存储
@@ -249,16 +282,872 @@ class Material(db.Model):
             'latexTranslationError': self.latex_translation_error
         }
 
+# ========== LaTeX编译加速 ==========
+
+_tex_signature_cache = {}
+
+def get_tex_installation_signature(pdflatex_cmd="pdflatex", sandbox=None):
+    """
+    获取TeX安装指纹，用于缓存失效
+
+    指纹由pdflatex版本信息、引擎可执行文件和基础格式文件(pdflatex.fmt)的
+    修改时间与大小组成。TeX发行版升级或重建格式后指纹随之变化。
+    结果与环境检查一样缓存 LATEX_ENV_CHECK_TTL 秒，过期后重新计算。
+    指定 sandbox 时探测命令在与编译相同的资源限制下运行。
+    """
+    cached = _tex_signature_cache.get(pdflatex_cmd)
+    if cached and time.time() - cached[1] < int(os.getenv('LATEX_ENV_CHECK_TTL', '600')):
+        return cached[0]
+
+    def probe(cmd):
+        if sandbox:
+            return sandbox.run(cmd, cwd=None, timeout=10)
+        return subprocess.run(cmd, capture_output=True, text=True, timeout=10)
+
+    parts = []
+    try:
+        proc = probe([pdflatex_cmd, "--version"])
+        parts.append(proc.stdout.split('\n')[0] if proc.stdout else "unknown")
+    except Exception:
+        parts.append("unknown")
+
+    candidate_files = [shutil.which(pdflatex_cmd) or pdflatex_cmd]
+    try:
+        proc = probe(["kpsewhich", "-engine=pdftex", "pdflatex.fmt"])
+        if proc.returncode == 0 and proc.stdout.strip():
+            candidate_files.append(proc.stdout.strip())
+    except Exception:
+        pass
+
+    for path in candidate_files:
+        try:
+            stat = os.stat(path)
+            parts.append(f"{path}:{int(stat.st_mtime)}:{stat.st_size}")
+        except OSError:
+            parts.append(f"{path}:missing")
+
+    signature = hashlib.sha256("\n".join(parts).encode("utf-8")).hexdigest()
+    _tex_signature_cache[pdflatex_cmd] = (signature, time.time())
+    return signature
+
+class LaTeXFormatCache:
+    """
+    预编译导言区格式缓存
+
+    海报的导言区（geometry、tabularx、array等宏包）在每次编译时都要重新加载。
+    这里按导言区内容哈希，用 pdflatex -ini + mylatexformat 转储出自定义格式文件，
+    之后使用 -fmt 直接加载格式编译正文，跳过导言区的宏包加载。
+    指定 sandbox 时格式构建和探测命令与编译使用相同的资源限制。
+    构建格式可能耗时很久，只按格式名加锁；self.lock 只保护失败记录、失效检查和淘汰，
+    不同导言区可以同时构建，命中缓存的编译也不会等待正在进行的构建。
+    """
+
+    def __init__(self, cache_dir='latex_format_cache', max_formats=20, sandbox=None):
+        self.cache_dir = os.path.abspath(cache_dir)
+        self.max_formats = max_formats
+        self.sandbox = sandbox
+        self.failed_formats = set()
+        self.lock = threading.Lock()
+        self.build_locks = {}  # 格式名 -> 构建锁，构建结束后移除
+        self._checked_signature = None
+        self._mylatexformat_available = None
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    @staticmethod
+    def split_preamble(latex_code):
+        """拆分导言区与正文，返回 (preamble, body)；没有 \\begin{document} 时返回 (None, latex_code)"""
+        match = re.search(r'^[^%\n]*?\\begin\{document\}', latex_code, flags=re.MULTILINE)
+        if not match:
+            return None, latex_code
+        start = latex_code.index('\\begin{document}', match.start())
+        return latex_code[:start], latex_code[start:]
+
+    def _run(self, cmd, cwd, timeout):
+        """执行探测或构建命令；没有沙箱时直接运行"""
+        if self.sandbox:
+            return self.sandbox.run(cmd, cwd=cwd, timeout=timeout)
+        result = subprocess.run(cmd, capture_output=True, text=True, errors='ignore', cwd=cwd, timeout=timeout)
+        result.limit_reason = None
+        return result
+
+    def _check_mylatexformat(self):
+        """检查 mylatexformat 是否可用（TeX Live latex-extra 提供）"""
+        if self._mylatexformat_available is None:
+            try:
+                proc = self._run(["kpsewhich", "mylatexformat.ltx"], cwd=None, timeout=10)
+                self._mylatexformat_available = proc.returncode == 0 and bool(proc.stdout.strip())
+            except Exception:
+                self._mylatexformat_available = False
+            if not self._mylatexformat_available:
+                log_message("未找到 mylatexformat.ltx，预编译导言区功能已停用", "WARNING")
+        return self._mylatexformat_available
+
+    def _invalidate_if_needed(self, signature):
+        """TeX安装变化时清空已缓存的格式文件"""
+        if self._checked_signature == signature:
+            return
+        marker = os.path.join(self.cache_dir, 'tex_signature.txt')
+        previous = None
+        if os.path.exists(marker):
+            with open(marker, 'r', encoding='utf-8') as f:
+                previous = f.read().strip()
+        if previous != signature:
+            removed = 0
+            for name in os.listdir(self.cache_dir):
+                if name.endswith('.fmt'):
+                    os.remove(os.path.join(self.cache_dir, name))
+                    removed += 1
+            with open(marker, 'w', encoding='utf-8') as f:
+                f.write(signature)
+            self.failed_formats.clear()
+            if previous is not None:
+                log_message(f"TeX安装已变化，清理 {removed} 个旧格式文件", "INFO")
+        self._checked_signature = signature
+
+    def _evict_old_formats(self):
+        """按最近使用时间淘汰超出数量上限的格式文件"""
+        formats = [os.path.join(self.cache_dir, name)
+                   for name in os.listdir(self.cache_dir) if name.endswith('.fmt')]
+        if len(formats) <= self.max_formats:
+            return
+        formats.sort(key=os.path.getmtime)
+        for path in formats[:len(formats) - self.max_formats]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def get_format(self, pdflatex_cmd, tex_filename):
+        """
+        获取（必要时构建）与该LaTeX文件导言区对应的格式文件
+
+        Returns:
+            str: 格式名（配合 -fmt 使用），不可用时返回None
+        """
+        try:
+            with open(tex_filename, 'r', encoding='utf-8', errors='ignore') as f:
+                preamble, _ = self.split_preamble(f.read())
+        except OSError:
+            return None
+
+        if not preamble or '\\documentclass' not in preamble:
+            return None
+
+        signature = get_tex_installation_signature(pdflatex_cmd, self.sandbox)
+        preamble_hash = hashlib.sha256(f"{signature}\n{preamble}".encode('utf-8')).hexdigest()
+        fmt_name = f"preamble_{preamble_hash[:16]}"
+        fmt_path = os.path.join(self.cache_dir, f"{fmt_name}.fmt")
+
+        with self.lock:
+            self._invalidate_if_needed(signature)
+            cached = self._lookup(fmt_name, fmt_path)
+            if cached is not False:
+                return cached
+            build_lock = self.build_locks.setdefault(fmt_name, threading.Lock())
+
+        # 同一导言区只构建一次，其他请求等待后重新检查结果
+        with build_lock:
+            with self.lock:
+                cached = self._lookup(fmt_name, fmt_path)
+            if cached is not False:
+                return cached
+
+            built = self._check_mylatexformat() and self._build_format(pdflatex_cmd, fmt_name, preamble)
+            with self.lock:
+                self.build_locks.pop(fmt_name, None)
+                if built:
+                    self._evict_old_formats()
+                    return fmt_name
+                if self._mylatexformat_available:
+                    self.failed_formats.add(fmt_name)
+                return None
+
+    def _lookup(self, fmt_name, fmt_path):
+        """在 self.lock 内检查缓存：已失败返回None，已存在返回格式名，需要构建返回False"""
+        if fmt_name in self.failed_formats:
+            return None
+        if os.path.exists(fmt_path):
+            os.utime(fmt_path, None)
+            log_message(f"命中预编译导言区格式: {fmt_name}", "DEBUG")
+            return fmt_name
+        return False
+
+    def _build_format(self, pdflatex_cmd, fmt_name, preamble):
+        """使用 pdflatex -ini 转储导言区格式文件"""
+        build_name = f"{fmt_name}_build"
+        source_file = f"{build_name}.tex"
+        source_path = os.path.join(self.cache_dir, source_file)
+        log_message(f"构建预编译导言区格式: {fmt_name}", "INFO")
+        start_time = time.time()
+
+        try:
+            with open(source_path, 'w', encoding='utf-8') as f:
+                f.write(preamble)
+                f.write("\\begin{document}\n\\end{document}\n")
+
+            result = self._run(
+                [pdflatex_cmd, "-ini", "-interaction=nonstopmode", "-halt-on-error",
+                 f"-jobname={build_name}", "&pdflatex", "mylatexformat.ltx", source_file],
+                cwd=self.cache_dir, timeout=120
+            )
+            if result.limit_reason:
+                log_message(f"格式文件构建超出资源限制: {result.limit_reason}，该导言区将使用标准编译", "WARNING")
+                return False
+
+            built_path = os.path.join(self.cache_dir, f"{build_name}.fmt")
+            if result.returncode != 0 or not os.path.exists(built_path):
+                log_message(f"格式文件构建失败 (返回码 {result.returncode})，该导言区将使用标准编译", "WARNING")
+                return False
+
+            os.replace(built_path, os.path.join(self.cache_dir, f"{fmt_name}.fmt"))
+            log_message(f"格式文件构建完成: {fmt_name} ({time.time() - start_time:.2f}秒)", "SUCCESS")
+            return True
+
+        except subprocess.TimeoutExpired:
+            log_message("格式文件构建超时，该导言区将使用标准编译", "WARNING")
+            return False
+        finally:
+            for ext in ("tex", "log", "aux", "fmt"):
+                leftover = os.path.join(self.cache_dir, f"{build_name}.{ext}")
+                if os.path.exists(leftover):
+                    try:
+                        os.remove(leftover)
+                    except OSError:
+                        pass
+
+    def mark_failed(self, fmt_name):
+        """记录无法使用的格式，后续同一导言区直接走标准编译"""
+        with self.lock:
+            self.failed_formats.add(fmt_name)
+
+    def compile_env(self):
+        """返回让kpathsea能找到缓存格式文件的环境变量"""
+        env = os.environ.copy()
+        existing = env.get('TEXFORMATS', '')
+        # 末尾的路径分隔符表示追加TeX默认搜索路径
+        env['TEXFORMATS'] = f"{self.cache_dir}{os.pathsep}{existing}"
+        return env
+
+class CompiledPDFCache:
+    """
+    编译结果PDF缓存（内容寻址 + LRU）
+
+    以规范化后的LaTeX源码（去掉注释和行尾空白）与TeX引擎指纹的哈希为键。
+    用户在编辑器中未修改或只修改了空白就保存时，直接复用之前的PDF而不必重新编译。
+    """
+
+    # 含有逐字环境或URL时注释字符有实际含义，此时不去除注释
+    VERBATIM_PATTERN = re.compile(
+        r'\\verb|\\url|\\href|\\begin\{(?:verbatim|Verbatim|lstlisting|minted|comment)\*?\}'
+    )
+
+    def __init__(self, cache_dir='latex_pdf_cache', max_entries=500, max_bytes=512 * 1024 * 1024):
+        self.cache_dir = os.path.abspath(cache_dir)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._load_index()
+
+    def _load_index(self):
+        """按最近使用时间从磁盘恢复LRU顺序"""
+        files = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith('.pdf'):
+                path = os.path.join(self.cache_dir, name)
+                stat = os.stat(path)
+                files.append((stat.st_mtime, name[:-4], stat.st_size))
+        for _, key, size in sorted(files):
+            self.entries[key] = size
+            self.total_bytes += size
+
+    @classmethod
+    def normalize_source(cls, latex_code):
+        """规范化LaTeX源码：统一换行符，去除注释内容和行尾空白"""
+        text = latex_code.replace('\r\n', '\n').replace('\r', '\n')
+        if not cls.VERBATIM_PATTERN.search(text):
+            # 只去掉注释内容，保留 % 和换行：% 吞掉行尾（foo%\nbar 与 foo\nbar 排版不同），
+            # 其后的空行仍然表示分段，两者都必须体现在缓存键中；% 之后下一行的行首空白被TeX忽略
+            text = re.sub(r'(?<!\\)((?:\\\\)*)%[^\n]*', r'\1%', text)
+            text = re.sub(r'%\n[ \t]+', '%\n', text)
+        text = re.sub(r'[ \t]+$', '', text, flags=re.MULTILINE)
+        return text.rstrip() + '\n'
+
+    def make_key(self, latex_code, engine_signature):
+        """根据规范化源码和引擎指纹计算缓存键"""
+        normalized = self.normalize_source(latex_code)
+        return hashlib.sha256(f"{engine_signature}\0{normalized}".encode('utf-8')).hexdigest()
+
+    def _entry_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.pdf")
+
+    def get(self, key, target_path):
+        """命中时把缓存的PDF复制到target_path并返回True"""
+        with self.lock:
+            if key not in self.entries or not os.path.exists(self._entry_path(key)):
+                if key in self.entries:
+                    self.total_bytes -= self.entries.pop(key)
+                self.misses += 1
+                return False
+            self.entries.move_to_end(key)
+            self.hits += 1
+            entry_path = self._entry_path(key)
+            os.utime(entry_path, None)
+
+        target_dir = os.path.dirname(os.path.abspath(target_path))
+        os.makedirs(target_dir, exist_ok=True)
+        tmp_path = os.path.join(target_dir, f".{os.path.basename(target_path)}.{uuid.uuid4().hex}.tmp")
+        try:
+            shutil.copyfile(entry_path, tmp_path)
+            os.replace(tmp_path, target_path)
+        except FileNotFoundError:
+            # 释放锁之后该条目被并发的 put 淘汰，按未命中处理
+            with self.lock:
+                self.hits -= 1
+                self.misses += 1
+            return False
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return True
+
+    def put(self, key, pdf_path):
+        """缓存一份编译结果，并按数量和总大小上限淘汰最久未使用的条目"""
+        size = os.path.getsize(pdf_path)
+        if size > self.max_bytes:
+            return
+        tmp_path = os.path.join(self.cache_dir, f".{key}.{uuid.uuid4().hex}.tmp")
+        shutil.copyfile(pdf_path, tmp_path)
+        os.replace(tmp_path, self._entry_path(key))
+
+        with self.lock:
+            if key in self.entries:
+                self.total_bytes -= self.entries.pop(key)
+            self.entries[key] = size
+            self.total_bytes += size
+            while self.entries and (len(self.entries) > self.max_entries or self.total_bytes > self.max_bytes):
+                old_key, old_size = self.entries.popitem(last=False)
+                self.total_bytes -= old_size
+                self.evictions += 1
+                try:
+                    os.remove(self._entry_path(old_key))
+                except OSError:
+                    pass
+
+    def stats(self):
+        """返回缓存命中率等指标"""
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self.entries),
+                'total_bytes': self.total_bytes,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0
+            }
+
+class PersistentBuildDirs:
+    """
+    按材料保留的持久构建目录（辅助文件和latexmk状态），供同一材料增量重新编译
+
+    目录默认放在磁盘上而不是内存文件系统。超过TTL未使用，或总数、总大小超出上限时，
+    按最近使用时间淘汰，被淘汰的材料下次编译时做一次完整编译；材料删除时目录随之删除。
+    调试时保留的一次性构建目录（kept_前缀）也放在这里，按同样的规则淘汰。
+    """
+
+    SWEEP_INTERVAL = 60
+
+    def __init__(self, root=None, max_dirs=None, max_bytes=None, ttl=None):
+        self.root = os.path.abspath(root or os.getenv('LATEX_PERSISTENT_BUILD_DIR') or 'latex_persistent_builds')
+        self.max_dirs = max_dirs if max_dirs is not None else int(os.getenv('LATEX_PERSISTENT_BUILD_MAX_DIRS', '200'))
+        self.max_bytes = (max_bytes if max_bytes is not None
+                          else int(os.getenv('LATEX_PERSISTENT_BUILD_MAX_MB', '1024')) * 1024 * 1024)
+        self.ttl = ttl if ttl is not None else int(os.getenv('LATEX_PERSISTENT_BUILD_TTL', str(7 * 24 * 3600)))
+        self.guard = threading.Lock()
+        # 键 -> 可重入锁；目录被淘汰或删除时一并移除，等待旧锁的线程拿到锁后改用新锁（见 _lock）
+        self.locks = {}
+        self.evictions = 0
+        self._last_sweep = 0
+        os.makedirs(self.root, exist_ok=True)
+
+    @staticmethod
+    def safe_key(build_key):
+        return re.sub(r'[^0-9A-Za-z_-]+', '_', str(build_key))
+
+    def _lock(self, key, timeout=-1):
+        """
+        持有某个键当前的锁并返回；timeout秒内取不到时返回None
+
+        等待期间目录可能被淘汰、锁已从 self.locks 移除，此时释放旧锁改用新锁，
+        保证同一个键同一时间只有一个持有者。
+        """
+        while True:
+            with self.guard:
+                lock = self.locks.setdefault(key, threading.RLock())
+            if not lock.acquire(timeout=timeout):
+                return None
+            with self.guard:
+                if self.locks.get(key) is lock:
+                    return lock
+            lock.release()
+
+    def _delete(self, key, lock):
+        """持有锁时删除目录并移除锁，然后释放锁"""
+        try:
+            shutil.rmtree(os.path.join(self.root, key), ignore_errors=True)
+            with self.guard:
+                if self.locks.get(key) is lock:
+                    del self.locks[key]
+        finally:
+            lock.release()
+
+    def acquire(self, build_key):
+        """
+        占用某个键的构建目录，返回 (构建目录, 锁)；锁已持有，用完后调用方 release()
+
+        同一目录同一时间只允许一个编译（可重入）。
+        """
+        key = self.safe_key(build_key)
+        build_dir = os.path.join(self.root, key)
+        lock = self._lock(key)
+        os.makedirs(build_dir, exist_ok=True)
+        os.utime(build_dir, None)
+        with self.guard:
+            due = time.time() - self._last_sweep > self.SWEEP_INTERVAL
+            if due:
+                self._last_sweep = time.time()
+        if due:
+            self.sweep(exclude=key)
+        return build_dir, lock
+
+    @contextmanager
+    def hold(self, build_key):
+        """with build_dirs.hold(key) as build_dir: ... 期间独占该构建目录"""
+        build_dir, lock = self.acquire(build_key)
+        try:
+            yield build_dir
+        finally:
+            lock.release()
+
+    def create_kept_dir(self):
+        """创建调试时需要保留的一次性构建目录"""
+        return tempfile.mkdtemp(prefix='kept_', dir=self.root)
+
+    def remove(self, build_key, timeout=10):
+        """删除某个键的构建目录；正在编译时最多等待timeout秒，超时则留给淘汰处理"""
+        key = self.safe_key(build_key)
+        lock = self._lock(key, timeout=timeout)
+        if lock is None:
+            log_message(f"构建目录正在使用，稍后由淘汰清理: {os.path.join(self.root, key)}", "WARNING")
+            return False
+        self._delete(key, lock)
+        return True
+
+    @staticmethod
+    def _dir_size(path):
+        total = 0
+        for dirpath, _, filenames in os.walk(path):
+            for name in filenames:
+                try:
+                    total += os.path.getsize(os.path.join(dirpath, name))
+                except OSError:
+                    pass
+        return total
+
+    def sweep(self, exclude=None):
+        """淘汰过期目录，再按最近使用时间淘汰超出数量和大小上限的目录；正在编译的目录跳过"""
+        with self.guard:
+            self._last_sweep = time.time()
+        entries = []
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if name == exclude or not os.path.isdir(path):
+                continue
+            try:
+                entries.append((os.path.getmtime(path), name, self._dir_size(path)))
+            except OSError:
+                continue
+        entries.sort()
+
+        now = time.time()
+        count = len(entries) + (1 if exclude else 0)
+        total = sum(size for _, _, size in entries)
+        for mtime, name, size in entries:
+            if now - mtime <= self.ttl and count <= self.max_dirs and total <= self.max_bytes:
+                break
+            lock = self._lock(name, timeout=0)
+            if lock is None:
+                continue
+            self._delete(name, lock)
+            count -= 1
+            total -= size
+            self.evictions += 1
+            log_message(f"淘汰持久构建目录: {name}", "DEBUG")
+
+class PDFThumbnailer:
+    """
+    PDF预览缩略图生成器
+
+    编译完成后用 pdftoppm 将首页（可选全部页面）栅格化一次，再用PIL缩放为几个固定宽度的
+    WebP/PNG缩略图。输出目录以PDF内容的哈希命名，内容相同的PDF共用同一组缩略图，
+    URL可以作为不可变资源长期缓存。
+    """
+
+    SIZES = {'small': 200, 'medium': 480, 'large': 1024}
+
+    def __init__(self, output_dir=None, image_format='webp', all_pages=False, max_pages=20):
+        self.output_dir = os.path.abspath(output_dir or PDF_THUMBNAIL_DIR)
+        self.image_format = image_format.lower()
+        self.all_pages = all_pages
+        self.max_pages = max_pages
+        configured = LATEX_CONFIG.get('pdftoppm_path')
+        self.pdftoppm = str(configured) if configured and os.path.exists(str(configured)) else shutil.which('pdftoppm')
+        os.makedirs(self.output_dir, exist_ok=True)
+
+    @staticmethod
+    def pdf_digest(pdf_path):
+        """计算PDF内容哈希，作为缩略图目录名"""
+        sha = hashlib.sha256()
+        with open(pdf_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                sha.update(chunk)
+        return sha.hexdigest()[:32]
+
+    def _extension(self):
+        return 'webp' if self.image_format == 'webp' else 'png'
+
+    def thumbnail_path(self, digest, page=1, size='small'):
+        return os.path.join(self.output_dir, digest, f"p{page}_{size}.{self._extension()}")
+
+    def _rasterize(self, pdf_path, work_dir):
+        """用pdftoppm按最大尺寸栅格化页面，返回 [(页码, PNG路径)]"""
+        last_page = self.max_pages if self.all_pages else 1
+        prefix = os.path.join(work_dir, 'page')
+        cmd = [
+            self.pdftoppm, '-png', '-f', '1', '-l', str(last_page),
+            '-scale-to-x', str(max(self.SIZES.values())), '-scale-to-y', '-1',
+            pdf_path, prefix
+        ]
+        subprocess.run(cmd, check=True, capture_output=True, timeout=60)
+        pages = []
+        for name in os.listdir(work_dir):
+            match = re.match(r'page-0*(\d+)\.png$', name)
+            if match:
+                pages.append((int(match.group(1)), os.path.join(work_dir, name)))
+        return sorted(pages)
+
+    def generate(self, pdf_path):
+        """
+        为PDF生成缩略图
+
+        Returns:
+            dict: {'digest', 'format', 'pages', 'sizes'}，不可用或失败时返回None
+        """
+        if not self.pdftoppm:
+            log_message("未找到pdftoppm，跳过PDF缩略图生成", "WARNING")
+            return None
+        try:
+            from PIL import Image as PILImage
+        except ImportError:
+            log_message("PIL未安装，跳过PDF缩略图生成", "WARNING")
+            return None
+
+        try:
+            digest = self.pdf_digest(pdf_path)
+            target_dir = os.path.join(self.output_dir, digest)
+            manifest_path = os.path.join(target_dir, 'manifest.json')
+            if os.path.exists(manifest_path):
+                with open(manifest_path, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+
+            os.makedirs(target_dir, exist_ok=True)
+            work_dir = tempfile.mkdtemp(prefix='thumb_')
+            try:
+                pages = self._rasterize(pdf_path, work_dir)
+                for page_number, png_path in pages:
+                    with PILImage.open(png_path) as page_image:
+                        page_image = page_image.convert('RGB')
+                        for size_name, width in self.SIZES.items():
+                            thumb = page_image.copy()
+                            thumb.thumbnail((width, width * 4), PILImage.LANCZOS)
+                            out_path = self.thumbnail_path(digest, page_number, size_name)
+                            tmp_path = f"{out_path}.{uuid.uuid4().hex}.tmp"
+                            if self.image_format == 'webp':
+                                thumb.save(tmp_path, 'WEBP', quality=80, method=4)
+                            else:
+                                thumb.save(tmp_path, 'PNG', optimize=True)
+                            os.replace(tmp_path, out_path)
+            finally:
+                shutil.rmtree(work_dir, ignore_errors=True)
+
+            manifest = {
+                'digest': digest,
+                'format': self._extension(),
+                'pages': len(pages),
+                'sizes': list(self.SIZES.keys())
+            }
+            # manifest最后写入，作为该目录已生成完整的标志
+            tmp_manifest = f"{manifest_path}.{uuid.uuid4().hex}.tmp"
+            with open(tmp_manifest, 'w', encoding='utf-8') as f:
+                json.dump(manifest, f)
+            os.replace(tmp_manifest, manifest_path)
+            log_message(f"PDF缩略图已生成: {digest} ({len(pages)} 页)", "SUCCESS")
+            return manifest
+        except Exception as e:
+            log_message(f"PDF缩略图生成失败: {str(e)}", "WARNING")
+            return None
+
+PDF_THUMBNAIL_DIR = 'pdf_thumbnails'
+
+def build_thumbnail_urls(manifest):
+    """根据缩略图清单生成可长期缓存的URL，返回 {'pages': n, 'urls': {页码: {尺寸: url}}}"""
+    if not manifest:
+        return None
+    urls = {}
+    for page in range(1, manifest['pages'] + 1):
+        urls[str(page)] = {
+            size: f"/preview/thumbnail/{manifest['digest']}/p{page}_{size}.{manifest['format']}"
+            for size in manifest['sizes']
+        }
+    return {'pages': manifest['pages'], 'format': manifest['format'], 'urls': urls}
+
+class LaTeXBackend:
+    """
+    LaTeX编译后端接口
+
+    后端负责生成编译命令并统计实际编译遍数。manages_reruns 为 True 的后端
+    （如latexmk）自己决定需要编译几遍；否则由调用方读取.log决定是否重新编译。
+    """
+
+    name = "base"
+    manages_reruns = False
+    timeout = 60
+
+    def __init__(self, executable):
+        self.executable = executable
+
+    def build_command(self, tex_basename, fmt_name=None):
+        """返回在构建目录中编译 tex_basename 的命令"""
+        raise NotImplementedError
+
+    def count_passes(self, result):
+        """根据一次运行的输出统计实际执行的引擎遍数"""
+        return 1
+
+class PdflatexBackend(LaTeXBackend):
+    """直接调用pdflatex，每次运行一遍"""
+
+    name = "pdflatex"
+
+    def build_command(self, tex_basename, fmt_name=None):
+        cmd = [self.executable, "-interaction=nonstopmode", "-halt-on-error"]
+        if fmt_name:
+            cmd.append(f"-fmt={fmt_name}")
+        cmd.append(tex_basename)
+        return cmd
+
+class LatexmkBackend(LaTeXBackend):
+    """
+    latexmk后端
+
+    latexmk在构建目录中保存 .fdb_latexmk 等状态，同一材料反复编辑时
+    只在源文件或依赖发生变化时才重新运行pdflatex，并自动处理交叉引用的重新编译。
+    """
+
+    name = "latexmk"
+    manages_reruns = True
+
+    def __init__(self, executable, pdflatex_cmd, max_passes=3):
+        super().__init__(executable)
+        self.pdflatex_cmd = pdflatex_cmd
+        self.max_passes = max_passes
+        self.timeout = 60 * max_passes
+
+    def build_command(self, tex_basename, fmt_name=None):
+        engine = f'"{self.pdflatex_cmd}"' if ' ' in self.pdflatex_cmd else self.pdflatex_cmd
+        engine += " %O"
+        if fmt_name:
+            engine += f" -fmt={fmt_name}"
+        engine += " %S"
+        return [
+            self.executable, "-pdf", f"-pdflatex={engine}",
+            "-interaction=nonstopmode", "-halt-on-error",
+            "-e", f"$max_repeat={self.max_passes};",
+            tex_basename
+        ]
+
+    def count_passes(self, result):
+        output = (result.stdout or "") + (result.stderr or "")
+        return len(re.findall(r"Run number \d+ of rule '(?:pdf)?latex", output))
+
+class LaTeXSandbox:
+    """
+    带资源限制的编译子进程执行器
+
+    在子进程中设置CPU时间、地址空间、输出文件大小和进程数上限，并在独立的进程组中运行，
+    超出墙钟时间时连同latexmk派生的pdflatex一起终止。触发限制的原因记录在
+    返回结果的 limit_reason 中，并计入统计。
+
+    服务端在多个线程中同时编译，fork之后再执行Python代码（preexec_fn）可能死锁，
+    因此资源限制由 prlimit 包装命令设置；没有 prlimit 时改用一个新启动的单线程
+    Python进程设置限制后 exec 编译命令。
+    """
+
+    # 没有prlimit时使用的包装程序：argv[1] 为 "名称:软限制:硬限制,..."，其后为要执行的命令
+    RLIMIT_WRAPPER = (
+        "import os, resource, sys\n"
+        "for item in filter(None, sys.argv[1].split(',')):\n"
+        "    name, soft, hard = item.split(':')\n"
+        "    resource.setrlimit(getattr(resource, 'RLIMIT_' + name), (int(soft), int(hard)))\n"
+        "os.execvp(sys.argv[2], sys.argv[2:])\n"
+    )
+    PRLIMIT_OPTIONS = {'CPU': '--cpu', 'AS': '--as', 'FSIZE': '--fsize', 'NPROC': '--nproc'}
+
+    def __init__(self, cpu_seconds=60, memory_mb=1024, max_file_mb=100, max_processes=0, wall_seconds=None):
+        self.cpu_seconds = cpu_seconds
+        self.memory_mb = memory_mb
+        self.max_file_mb = max_file_mb
+        self.max_processes = max_processes
+        self.wall_seconds = wall_seconds
+        self.lock = threading.Lock()
+        self.runs = 0
+        self.limit_hits = {}
+        self.prlimit = shutil.which('prlimit')
+
+    @classmethod
+    def from_env(cls):
+        wall = int(os.getenv('LATEX_WALL_SECONDS', '0'))
+        return cls(
+            cpu_seconds=int(os.getenv('LATEX_CPU_SECONDS', '60')),
+            memory_mb=int(os.getenv('LATEX_MEMORY_MB', '1024')),
+            max_file_mb=int(os.getenv('LATEX_MAX_FILE_MB', '100')),
+            max_processes=int(os.getenv('LATEX_MAX_PROCESSES', '0')),
+            wall_seconds=wall or None
+        )
+
+    def _limits(self):
+        """返回 [(名称, 软限制, 硬限制)]，0表示不限制该项"""
+        limits = []
+        if self.cpu_seconds:
+            # 软限制触发SIGXCPU，硬限制留出余量后SIGKILL
+            limits.append(('CPU', self.cpu_seconds, self.cpu_seconds + 5))
+        if self.memory_mb:
+            limit = self.memory_mb * 1024 * 1024
+            limits.append(('AS', limit, limit))
+        if self.max_file_mb:
+            limit = self.max_file_mb * 1024 * 1024
+            limits.append(('FSIZE', limit, limit))
+        if self.max_processes:
+            limits.append(('NPROC', self.max_processes, self.max_processes))
+        return limits
+
+    def wrap_command(self, cmd):
+        """给命令加上设置资源限制的包装"""
+        limits = self._limits()
+        if not limits:
+            return list(cmd)
+        if self.prlimit:
+            return ([self.prlimit] + [f"{self.PRLIMIT_OPTIONS[name]}={soft}:{hard}" for name, soft, hard in limits]
+                    + ['--'] + list(cmd))
+        spec = ','.join(f"{name}:{soft}:{hard}" for name, soft, hard in limits)
+        return [sys.executable, '-I', '-S', '-c', self.RLIMIT_WRAPPER, spec] + list(cmd)
+
+    def _limit_reason(self, returncode, output):
+        if returncode == 0:
+            return None
+        if returncode > 0:
+            if re.search(r'Cannot allocate memory|out of memory|memory exhausted', output, re.IGNORECASE):
+                return 'memory'
+            if re.search(r'Resource temporarily unavailable|fork.*failed', output, re.IGNORECASE):
+                return 'processes'
+            if re.search(r'File too large', output):
+                return 'file_size'
+            return None
+        sig = -returncode
+        if sig == getattr(signal, 'SIGXCPU', None):
+            return 'cpu_time'
+        if sig == getattr(signal, 'SIGXFSZ', None):
+            return 'file_size'
+        if sig == getattr(signal, 'SIGKILL', None):
+            return 'killed'
+        if sig == getattr(signal, 'SIGSEGV', None) and self.memory_mb:
+            return 'memory'
+        return None
+
+    def _record(self, reason):
+        with self.lock:
+            self.runs += 1
+            if reason:
+                self.limit_hits[reason] = self.limit_hits.get(reason, 0) + 1
+
+    def run(self, cmd, cwd, env=None, timeout=60):
+        """
+        执行命令，返回 subprocess.CompletedProcess，额外带有 limit_reason 属性
+        """
+        wall_seconds = self.wall_seconds or timeout
+        posix = resource is not None and os.name == 'posix'
+        proc = subprocess.Popen(
+            self.wrap_command(cmd) if posix else cmd, cwd=cwd, env=env,
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            text=True, errors='ignore',
+            start_new_session=posix
+        )
+
+        reason = None
+        try:
+            stdout, stderr = proc.communicate(timeout=wall_seconds)
+        except subprocess.TimeoutExpired:
+            reason = 'wall_clock'
+            if posix:
+                try:
+                    os.killpg(proc.pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+            else:
+                proc.kill()
+            stdout, stderr = proc.communicate()
+
+        result = subprocess.CompletedProcess(cmd, proc.returncode, stdout, stderr)
+        result.limit_reason = reason or self._limit_reason(proc.returncode, (stdout or '') + (stderr or ''))
+        self._record(result.limit_reason)
+        if result.limit_reason:
+            log_message(f"编译进程触发资源限制: {result.limit_reason} (返回码 {proc.returncode})", "WARNING")
+        return result
+
+    def stats(self):
+        with self.lock:
+            return {
+                'runs': self.runs,
+                'limit_hits': dict(self.limit_hits),
+                'limits': {
+                    'cpu_seconds': self.cpu_seconds,
+                    'memory_mb': self.memory_mb,
+                    'max_file_mb': self.max_file_mb,
+                    'max_processes': self.max_processes,
+                    'wall_seconds': self.wall_seconds
+                }
+            }
+
 class PosterTranslator:
     """海报翻译类，处理从图像到PDF的完整流程（增强版）"""
     
-    def __init__(self, api_key=None, pdflatex_path=None):
+    def __init__(self, api_key=None, pdflatex_path=None, use_format_cache=None, backend=None):
         """
         初始化海报翻译器
         
         Args:
             api_key (str): OpenAI API密钥
             pdflatex_path (str): pdflatex.exe的路径，如果为None则使用默认路径
+            use_format_cache (bool): 是否使用预编译导言区格式，None时读取环境变量 LATEX_FORMAT_CACHE
+            backend (str): 编译后端 pdflatex/latexmk，None时读取 LATEX_BACKEND 或 server_config
         """
         # 配置API密钥
         self.api_key = api_key or self._load_api_key()
@@ -272,6 +1161,51 @@ class PosterTranslator:
         # 智能检测pdflatex路径
         self.pdflatex_path = self._detect_pdflatex_path(pdflatex_path)
         
+        # 编译后端（按部署配置选择）
+        self.backend = self._create_backend(
+            backend or os.getenv('LATEX_BACKEND') or LATEX_CONFIG.get('backend', 'pdflatex')
+        )
+        
+        # 编译子进程的资源限制
+        self.sandbox = LaTeXSandbox.from_env()
+        
+        # 预编译导言区格式缓存
+        if use_format_cache is None:
+            use_format_cache = os.getenv('LATEX_FORMAT_CACHE', '1') != '0'
+        self.format_cache = LaTeXFormatCache(sandbox=self.sandbox) if use_format_cache else None
+        
+        # 每次编译使用独立的临时构建目录；按材料编译时使用持久构建目录保留辅助文件
+        self.scratch_root = self._resolve_scratch_root()
+        self.build_dirs = PersistentBuildDirs()
+        
+        # 按版面复杂度选择生成模型（设为0时始终使用gpt-4o）
+        self.router = PosterModelRouter() if os.getenv('POSTER_MODEL_ROUTING', '1') != '0' else None
+        
+        # 生成方式：vision 上传图像给视觉模型；text 只把OCR文本块的版面描述发给文本模型；
+        # structured 让视觉模型只返回内容JSON，再用本地模板渲染
+        self.generation_mode = os.getenv('POSTER_GENERATION_MODE', 'vision')
+        self.template_renderer = LaTeXTemplateRenderer()
+        self.text_model = os.getenv('POSTER_TEXT_MODEL', 'gpt-4o-mini')
+        self.generation_stats = GenerationStats()
+        
+        # 编译结果PDF缓存（设为0关闭）
+        if os.getenv('LATEX_PDF_CACHE', '1') != '0':
+            self.pdf_cache = CompiledPDFCache(
+                max_entries=int(os.getenv('LATEX_PDF_CACHE_MAX_ENTRIES', '500')),
+                max_bytes=int(os.getenv('LATEX_PDF_CACHE_MAX_MB', '512')) * 1024 * 1024
+            )
+        else:
+            self.pdf_cache = None
+        
+        # 编译完成后生成预览缩略图（设为0关闭）
+        if os.getenv('PDF_THUMBNAILS', '1') != '0':
+            self.thumbnailer = PDFThumbnailer(
+                image_format=os.getenv('PDF_THUMBNAIL_FORMAT', 'webp'),
+                all_pages=os.getenv('PDF_THUMBNAIL_ALL_PAGES', '0') == '1'
+            )
+        else:
+            self.thumbnailer = None
+        
         # 定义海报转LaTeX的详细提示词
         self.custom_prompt = """
 Upload a poster image and generate \"directly compilable LaTeX code\" that faithfully reproduces the layout of the poster, including all poster information. The requirements are as follows:
@@ -314,46 +1248,96 @@ Only return the raw LaTeX code. Do not enclose it in triple backticks, markdown,
 
 Output Requirement:
 Output complete LaTeX source code that the user can compile directly without any modifications. The layout must be compact and aesthetically pleasing, while also exuding a sense of grandeur and elegance. Ensure refined margins, minimal whitespace, and balanced spacing so that the final design is both tight and visually imposing.
+"""
+        
+        # 纯文本模式的提示词：版面信息来自OCR文本块，不上传图像
+        self.layout_prompt = """
+You are given the OCR layout of a poster as a list of text blocks. Each block has its position as percentages of the page (x, y = top-left corner, w, h = size) and its already translated English text. Generate "directly compilable LaTeX code" that reproduces this layout. The requirements are as follows:
+
+- Keep every block's text exactly as given (do not re-translate, summarise or omit anything); only fix obvious OCR spacing.
+- Preserve the reading order and the relative placement: blocks sharing the same y range belong on the same line or row, blocks at different x ranges form columns. Use tabular, minipage or multicols to reproduce rows and columns.
+- Use the block height as a font size hint: the tallest blocks are titles (use \\large or \\Large, never \\huge or \\Huge), ordinary blocks are body text.
+- If the blocks describe guests or speakers, add a rectangular placeholder drawn with \\fbox containing the word "Photo" next to each of them.
+- The code must be self-contained: no \\includegraphics, no external files, no color commands.
+- Escape LaTeX special characters in the text (&, %, $, #, _, {, }).
+- Keep the layout compact and balanced on a single page.
+
+Only return the raw LaTeX code, starting with \\documentclass and ending with \\end{document}, without markdown fences or explanations.
+"""
+        
+        # 结构化模式的提示词：模型只返回内容JSON，由本地LaTeX模板负责排版
+        self.structured_prompt = """
+Read the poster image and return its content, translated into English, as a single JSON object. Do not produce LaTeX; the layout is rendered locally from templates. Use this schema (omit fields that do not apply):
+
+{
+  "template": "event" | "certificate" | "document",
+  "title": "main title",
+  "subtitle": "optional subtitle or slogan",
+  "recipient": "certificate recipient name (certificate only)",
+  "info": [{"label": "Date", "value": "..."}, {"label": "Venue", "value": "..."}],
+  "sections": [{"heading": "optional heading", "paragraphs": ["..."]}],
+  "agenda": {"heading": "Agenda", "columns": ["Time", "Topic", "Speaker"], "rows": [["09:00", "...", "..."]]},
+  "guests_heading": "Guests",
+  "guests": [{"name": "...", "title": "...", "details": "optional"}],
+  "signatures": [{"name": "...", "title": "..."}],
+  "qr_code": true,
+  "footer": ["organizer, contact or other small print"]
+}
+
+Choose "event" for event, conference and activity posters, "certificate" for certificates and awards, and "document" for notices and other text documents. Keep every piece of information from the poster, in reading order, and keep each value as plain text without any LaTeX or markdown. Set "qr_code" to true only if the poster contains a QR code. Every guest with a photo on the poster must appear in "guests".
 """
 
     def _detect_pdflatex_path(self, custom_path=None):
-        """智能检测pdflatex路径"""
+        """检测pdflatex路径（只检查文件和PATH，不启动子进程）"""
         self.log("正在检测pdflatex路径...", "DEBUG")
         
-        # 如果提供了自定义路径，先尝试
-        if custom_path and os.path.exists(custom_path):
-            self.log(f"使用自定义pdflatex路径: {custom_path}", "SUCCESS")
-            return custom_path
-        
-        # 常见的MiKTeX安装路径（Windows）
-        common_paths = [
-            r"F:\\tex\\miktex\\bin\\x64\\pdflatex.exe",  # 原始路径
-            r"C:\\Program Files\\MiKTeX\\miktex\\bin\\x64\\pdflatex.exe",
-            r"C:\\Users\\{}\\AppData\\Local\\Programs\\MiKTeX\\miktex\\bin\\x64\\pdflatex.exe".format(os.getenv('USERNAME', '')),
-            r"C:\\Program Files (x86)\\MiKTeX\\miktex\\bin\\pdflatex.exe",
-            r"D:\\MiKTeX\\miktex\\bin\\x64\\pdflatex.exe",
-            r"E:\\MiKTeX\\miktex\\bin\\x64\\pdflatex.exe"
-        ]
-        
-        # 检查常见路径
-        for path in common_paths:
-            if os.path.exists(path):
-                self.log(f"找到pdflatex: {path}", "SUCCESS")
+        # 依次尝试：参数、环境变量、server_config 中配置的路径
+        for path in (custom_path, os.getenv('PDFLATEX_PATH'), LATEX_CONFIG.get('pdflatex_path')):
+            if path and os.path.exists(path):
+                self.log(f"使用配置的pdflatex路径: {path}", "SUCCESS")
                 return path
         
         # 检查系统PATH
-        try:
-            result = subprocess.run(["pdflatex", "--version"], 
-                                 check=True, capture_output=True, text=True, timeout=10)
-            self.log("在系统PATH中找到pdflatex", "SUCCESS")
-            return "pdflatex"
-        except (subprocess.CalledProcessError, FileNotFoundError, subprocess.TimeoutExpired):
-            pass
+        system_path = shutil.which("pdflatex")
+        if system_path:
+            self.log(f"在系统PATH中找到pdflatex: {system_path}", "SUCCESS")
+            return system_path
+        
+        # Windows下检查常见的MiKTeX安装路径
+        if os.name == 'nt':
+            common_paths = [
+                r"F:\\tex\\miktex\\bin\\x64\\pdflatex.exe",  # 原始路径
+                r"C:\\Program Files\\MiKTeX\\miktex\\bin\\x64\\pdflatex.exe",
+                r"C:\\Users\\{}\\AppData\\Local\\Programs\\MiKTeX\\miktex\\bin\\x64\\pdflatex.exe".format(os.getenv('USERNAME', '')),
+                r"C:\\Program Files (x86)\\MiKTeX\\miktex\\bin\\pdflatex.exe",
+                r"D:\\MiKTeX\\miktex\\bin\\x64\\pdflatex.exe",
+                r"E:\\MiKTeX\\miktex\\bin\\x64\\pdflatex.exe"
+            ]
+            for path in common_paths:
+                if os.path.exists(path):
+                    self.log(f"找到pdflatex: {path}", "SUCCESS")
+                    return path
         
-        # 如果都找不到，返回默认路径并记录警告
-        default_path = r"F:\\tex\\miktex\\bin\\x64\\pdflatex.exe"
-        self.log(f"未找到pdflatex，使用默认路径: {default_path}", "WARNING")
-        return default_path
+        self.log("未找到pdflatex，编译时将再次从系统PATH查找", "WARNING")
+        return "pdflatex"
+
+    def _create_backend(self, backend_name):
+        """根据名称创建编译后端，latexmk不可用时回退到pdflatex"""
+        backend_name = (backend_name or 'pdflatex').lower()
+        max_passes = int(os.getenv('LATEX_MAX_PASSES', '3'))
+        
+        if backend_name == 'latexmk':
+            latexmk_path = LATEX_CONFIG.get('latexmk_path')
+            if not (latexmk_path and os.path.exists(str(latexmk_path))):
+                latexmk_path = shutil.which('latexmk')
+            if latexmk_path:
+                self.log(f"使用latexmk编译后端: {latexmk_path}", "SUCCESS")
+                return LatexmkBackend(str(latexmk_path), self.pdflatex_path, max_passes)
+            self.log("未找到latexmk，回退到pdflatex编译后端", "WARNING")
+        elif backend_name != 'pdflatex':
+            self.log(f"未知的编译后端 {backend_name}，使用pdflatex", "WARNING")
+        
+        return PdflatexBackend(self.pdflatex_path)
 
     def log(self, message, level="INFO"):
         """详细状态日志"""
@@ -796,22 +1780,8 @@ Output complete LaTeX source code that the user can compile directly without any
             self.log(f"图像编码失败: {str(e)}", "ERROR")
             raise Exception(f"图像编码失败: {str(e)}")
 
-    def poster_to_latex(self, image_path, output_tex_file="output.tex"):
-        """
-        将海报图像转换为LaTeX代码
-        
-        Args:
-            image_path (str): 海报图像路径
-            output_tex_file (str): 输出的LaTeX文件名
-            
-        Returns:
-            str: 生成的LaTeX代码
-        """
-        self.log(f"开始分析海报图像: {image_path}", "INFO")
-        
-        if not self.client:
-            raise Exception("OpenAI API密钥未设置，无法生成LaTeX代码")
-        
+    def _build_image_payload(self, image_path):
+        """把图像编码为对话消息中的 image_url 内容"""
         # 编码图像
         image_base64 = self.encode_image_to_base64(image_path)
         
@@ -827,85 +1797,253 @@ Output complete LaTeX source code that the user can compile directly without any
         self.log(f"图像类型: {mime_type}", "DEBUG")
         
         # 构建图像payload
-        image_payload = {
+        return {
             "type": "image_url",
             "image_url": {
                 "url": f"data:{mime_type};base64,{image_base64}"
             }
         }
-        
-        # 调用OpenAI API
-        self.log("调用OpenAI API生成LaTeX代码...", "INFO")
+
+    def _build_poster_messages(self, image_path):
+        """构建海报转LaTeX的对话消息（同步调用和批量提交共用）"""
+        image_payload = self._build_image_payload(image_path)
+        return [
+            {
+                "role": "system",
+                "content": "You are a helpful assistant that outputs complete LaTeX code for poster layout recreation."
+            },
+            {"role": "user", "content": self.custom_prompt},
+            {"role": "user", "content": [image_payload]}
+        ]
+
+    def _extract_latex(self, raw_response):
+        """清理模型返回内容，提取 \\documentclass 到 \\end{document} 之间的LaTeX代码"""
+        self.log("正在清理AI返回的LaTeX代码...", "DEBUG")
+        
+        # 首先尝试移除Markdown代码块标记
+        cleaned_code = re.sub(r'^```(latex)?\s*', '', raw_response, flags=re.MULTILINE)
+        cleaned_code = re.sub(r'```\s*$', '', cleaned_code, flags=re.MULTILINE)
+        
+        # 如果AI返回的内容包含说明文字，尝试提取LaTeX代码部分
+        # 查找 \documentclass 开始的位置
+        documentclass_match = re.search(r'\\documentclass', cleaned_code)
+        if documentclass_match:
+            # 从 \documentclass 开始提取
+            latex_start = documentclass_match.start()
+            cleaned_code = cleaned_code[latex_start:]
+            self.log("检测到说明文字，已提取LaTeX代码部分", "DEBUG")
+        
+        # 查找 \end{document} 结束的位置
+        end_document_match = re.search(r'\\end\{document\}', cleaned_code)
+        if end_document_match:
+            # 提取到 \end{document} 结束
+            latex_end = end_document_match.end()
+            cleaned_code = cleaned_code[:latex_end]
+            self.log("已截取到LaTeX代码结束位置", "DEBUG")
+        
+        # 移除开头和结尾可能存在的任何空白字符
+        return cleaned_code.strip()
+
+    def _save_latex(self, latex_code, output_tex_file):
+        """保存LaTeX代码到文件"""
         try:
-            response = self.client.chat.completions.create(
-                model="gpt-4o",
+            self._write_text_atomic(output_tex_file, latex_code)
+            self.log(f"LaTeX代码已保存到: {output_tex_file}", "SUCCESS")
+        except Exception as e:
+            self.log(f"保存LaTeX文件失败: {e}", "ERROR")
+            raise
+
+    def poster_to_latex(self, image_path, output_tex_file="output.tex", model="gpt-4o"):
+        """
+        将海报图像转换为LaTeX代码
+        
+        Args:
+            image_path (str): 海报图像路径
+            output_tex_file (str): 输出的LaTeX文件名
+            model (str): 使用的模型
+            
+        Returns:
+            str: 生成的LaTeX代码
+        """
+        self.log(f"开始分析海报图像: {image_path}", "INFO")
+        
+        if not self.client:
+            raise Exception("OpenAI API密钥未设置，无法生成LaTeX代码")
+        
+        messages = self._build_poster_messages(image_path)
+        
+        # 调用OpenAI API
+        self.log(f"调用OpenAI API生成LaTeX代码 ({model})...", "INFO")
+        try:
+            response = self.client.chat.completions.create(
+                model=model,
+                messages=messages
+            )
+            
+            latex_code = self._extract_latex(response.choices[0].message.content)
+            self.log("LaTeX代码生成成功!", "SUCCESS")
+            
+            self._save_latex(latex_code, output_tex_file)
+            return latex_code
+            
+        except Exception as e:
+            self.log(f"OpenAI API调用失败: {str(e)}", "ERROR")
+            raise Exception(f"OpenAI API调用失败: {str(e)}")
+
+    def _describe_layout(self, text_info, image_path):
+        """把OCR文本块整理成紧凑的版面描述（位置按页面百分比，按阅读顺序排列）"""
+        blocks = [block for block in text_info.get('translated_texts', []) if block.get('text', '').strip()]
+        
+        width = height = 0
+        try:
+            from PIL import Image as PILImage
+            with PILImage.open(image_path) as image:
+                width, height = image.size
+        except Exception:
+            pass
+        if not width or not height:
+            # 无法读取图像尺寸时用文本块的外接范围代替
+            width = max((b['position']['left'] + b['position']['width'] for b in blocks), default=0) or 1
+            height = max((b['position']['top'] + b['position']['height'] for b in blocks), default=0) or 1
+        
+        lines = [f"Page aspect ratio (width:height) = {width}:{height}", "Blocks (x%, y%, w%, h%): text"]
+        for block in sorted(blocks, key=lambda b: (b['position']['top'], b['position']['left'])):
+            pos = block['position']
+            lines.append(
+                f"({pos['left'] * 100 // width}, {pos['top'] * 100 // height}, "
+                f"{pos['width'] * 100 // width}, {pos['height'] * 100 // height}): {block['text'].strip()}"
+            )
+        return "\n".join(lines)
+
+    def layout_to_latex(self, text_info, image_path, output_tex_file="output.tex", model=None):
+        """
+        根据OCR文本块的版面信息用文本模型生成LaTeX代码（不上传图像）
+        
+        Args:
+            text_info (dict): 百度OCR文本信息（含译文和位置）
+            image_path (str): 海报图像路径，仅用于读取页面尺寸
+            output_tex_file (str): 输出的LaTeX文件名
+            model (str): 使用的模型，None时使用 POSTER_TEXT_MODEL
+            
+        Returns:
+            str: 生成的LaTeX代码
+        """
+        if not self.client:
+            raise Exception("OpenAI API密钥未设置，无法生成LaTeX代码")
+        
+        model = model or self.text_model
+        layout = self._describe_layout(text_info, image_path)
+        self.log(f"根据 {layout.count(chr(10)) - 1} 个文本块生成LaTeX代码 ({model})...", "INFO")
+        
+        try:
+            response = self.client.chat.completions.create(
+                model=model,
                 messages=[
                     {
                         "role": "system",
                         "content": "You are a helpful assistant that outputs complete LaTeX code for poster layout recreation."
                     },
-                    {"role": "user", "content": self.custom_prompt},
-                    {"role": "user", "content": [image_payload]}
+                    {"role": "user", "content": self.layout_prompt},
+                    {"role": "user", "content": layout}
                 ]
             )
             
-            # latex_code = response.choices[0].message.content
-            raw_response = response.choices[0].message.content
-
-            # --- START: 这是我们新增的清理代码 ---
-            self.log("正在清理AI返回的LaTeX代码...", "DEBUG")
-            
-            # 首先尝试移除Markdown代码块标记
-            cleaned_code = re.sub(r'^```(latex)?\s*', '', raw_response, flags=re.MULTILINE)
-            cleaned_code = re.sub(r'```\s*$', '', cleaned_code, flags=re.MULTILINE)
-            
-            # 如果AI返回的内容包含说明文字，尝试提取LaTeX代码部分
-            # 查找 \documentclass 开始的位置
-            documentclass_match = re.search(r'\\documentclass', cleaned_code)
-            if documentclass_match:
-                # 从 \documentclass 开始提取
-                latex_start = documentclass_match.start()
-                cleaned_code = cleaned_code[latex_start:]
-                self.log("检测到说明文字，已提取LaTeX代码部分", "DEBUG")
-            
-            # 查找 \end{document} 结束的位置
-            end_document_match = re.search(r'\\end\{document\}', cleaned_code)
-            if end_document_match:
-                # 提取到 \end{document} 结束
-                latex_end = end_document_match.end()
-                cleaned_code = cleaned_code[:latex_end]
-                self.log("已截取到LaTeX代码结束位置", "DEBUG")
-            
-            # 移除开头和结尾可能存在的任何空白字符
-            latex_code = cleaned_code.strip()
-            # --- END: 清理代码结束 ---
+            latex_code = self._extract_latex(response.choices[0].message.content)
             self.log("LaTeX代码生成成功!", "SUCCESS")
             
-            # 保存LaTeX代码到文件
-            try:
-                with open(output_tex_file, "w", encoding="utf-8") as f:
-                    f.write(latex_code)
-                self.log(f"LaTeX代码已保存到: {output_tex_file}", "SUCCESS")
-            except Exception as e:
-                self.log(f"保存LaTeX文件失败: {e}", "ERROR")
-                raise
-            
+            self._save_latex(latex_code, output_tex_file)
             return latex_code
             
         except Exception as e:
             self.log(f"OpenAI API调用失败: {str(e)}", "ERROR")
             raise Exception(f"OpenAI API调用失败: {str(e)}")
 
-    def compile_tex_to_pdf(self, tex_filename):
+    def poster_to_structured_latex(self, image_path, output_tex_file="output.tex", model="gpt-4o", text_info=None):
+        """
+        让视觉模型返回结构化内容JSON，再用本地模板渲染为LaTeX
+        
+        Args:
+            image_path (str): 海报图像路径
+            output_tex_file (str): 输出的LaTeX文件名，同名 .json 文件保存模型返回的结构化内容
+            model (str): 使用的模型
+            text_info (dict): 百度OCR文本信息，有译文时作为参考一并发送
+            
+        Returns:
+            str: 渲染得到的LaTeX代码
+        """
+        if not self.client:
+            raise Exception("OpenAI API密钥未设置，无法生成LaTeX代码")
+        
+        messages = [
+            {"role": "system", "content": "You extract poster content into JSON for LaTeX templates."},
+            {"role": "user", "content": self.structured_prompt},
+            {"role": "user", "content": [self._build_image_payload(image_path)]}
+        ]
+        translations = [block['text'] for block in (text_info or {}).get('translated_texts', []) if block.get('text')]
+        if translations:
+            messages.append({"role": "user", "content": "OCR translations of the text blocks (prefer this wording):\n"
+                             + "\n".join(translations)})
+        
+        self.log(f"调用OpenAI API生成结构化内容 ({model})...", "INFO")
+        try:
+            response = self.client.chat.completions.create(
+                model=model,
+                messages=messages,
+                response_format={"type": "json_object"}
+            )
+            raw_content = response.choices[0].message.content
+        except Exception as e:
+            self.log(f"OpenAI API调用失败: {str(e)}", "ERROR")
+            raise Exception(f"OpenAI API调用失败: {str(e)}")
+        
+        try:
+            content = json.loads(raw_content)
+        except json.JSONDecodeError as e:
+            raise Exception(f"结构化内容不是有效的JSON: {str(e)}")
+        
+        self._write_text_atomic(os.path.splitext(output_tex_file)[0] + ".json",
+                                json.dumps(content, ensure_ascii=False, indent=2))
+        latex_code = self.template_renderer.render(content)
+        self.log(f"已使用模板 {content.get('template', 'event')} 渲染LaTeX代码", "SUCCESS")
+        
+        self._save_latex(latex_code, output_tex_file)
+        return latex_code
+
+    def compile_tex_to_pdf(self, tex_filename, keep_build_dir=False, build_key=None):
         """
         编译LaTeX文件为PDF（增强版）
         
         Args:
             tex_filename (str): LaTeX文件名
+            keep_build_dir (bool): 是否保留构建目录（用于调试，放在持久构建目录下并按同样规则淘汰）
+            build_key (str): 持久构建目录的键（如材料ID）
             
         Returns:
             str: 生成的PDF文件路径
         """
+        return self.compile_tex_with_report(tex_filename, keep_build_dir, build_key)["pdf_file"]
+
+    def compile_tex_with_report(self, tex_filename, keep_build_dir=False, build_key=None):
+        """
+        编译LaTeX文件为PDF，并返回编译报告
+        
+        编译在独立的临时构建目录中进行（可位于内存文件系统），
+        只有最终的PDF会被原子地移动到LaTeX文件所在的持久目录。
+        每遍编译后读取.log，只有TeX明确要求重新运行时才进行下一遍。
+        指定 build_key 时改用该键对应的持久构建目录，保留辅助文件和latexmk状态，
+        同一材料再次编译时可以复用。
+        
+        Args:
+            tex_filename (str): LaTeX文件名
+            keep_build_dir (bool): 是否保留构建目录（用于调试，放在持久构建目录下并按同样规则淘汰）
+            build_key (str): 持久构建目录的键（如材料ID），None时使用一次性临时目录
+            
+        Returns:
+            dict: pdf_file（PDF路径）、passes（编译遍数，命中缓存时为0）、
+                  rerun_reasons（重新编译原因）、cache_hit（是否命中PDF缓存）
+        """
+        build_dir = None
+        build_lock = None
         try:
             self.log(f"开始编译LaTeX文件: {tex_filename}", "INFO")
             
@@ -922,40 +2060,78 @@ Output complete LaTeX source code that the user can compile directly without any
             # 确定pdflatex命令
             pdflatex_cmd = self._get_pdflatex_command()
             
-            # 编译LaTeX文件 - 获取文件所在目录
-            tex_dir = os.path.dirname(os.path.abspath(tex_filename))
-            tex_basename = os.path.basename(tex_filename)
+            pdf_filename = os.path.splitext(tex_filename)[0] + ".pdf"
+            
+            # 先查询编译结果缓存（源码未变或只改了注释/空白时直接复用）
+            cache_key = None
+            if self.pdf_cache:
+                with open(tex_filename, 'r', encoding='utf-8', errors='ignore') as f:
+                    cache_key = self.pdf_cache.make_key(f.read(), get_tex_installation_signature(pdflatex_cmd, self.sandbox))
+                if self.pdf_cache.get(cache_key, pdf_filename):
+                    self.log(f"命中PDF缓存，跳过编译: {pdf_filename}", "SUCCESS")
+                    return {
+                        "pdf_file": pdf_filename,
+                        "passes": 0,
+                        "rerun_reasons": [],
+                        "cache_hit": True
+                    }
+            
+            # 在独立的构建目录中编译，避免并发编译互相覆盖
+            if build_key:
+                # 持久目录中使用固定文件名，使辅助文件和latexmk状态在多次编译间保持有效
+                # 持有锁后才创建目录，等待期间目录被淘汰时这里得到的是新目录，本次做一次完整编译
+                build_dir, build_lock = self.build_dirs.acquire(build_key)
+                tex_basename = "main.tex"
+            else:
+                build_dir = self.build_dirs.create_kept_dir() if keep_build_dir else self._create_build_dir()
+                tex_basename = os.path.basename(tex_filename)
+            staged_tex = os.path.join(build_dir, tex_basename)
+            shutil.copyfile(tex_filename, staged_tex)
             
-            self.log("执行pdflatex编译...", "DEBUG")
-            self.log(f"工作目录: {tex_dir}", "DEBUG")
+            self.log(f"执行{self.backend.name}编译...", "DEBUG")
+            self.log(f"构建目录: {build_dir}", "DEBUG")
             self.log(f"编译文件: {tex_basename}", "DEBUG")
-            self.log(f"使用命令: {pdflatex_cmd}", "DEBUG")
+            self.log(f"使用命令: {self.backend.executable}", "DEBUG")
             
-            # 清理之前的辅助文件
-            self._cleanup_before_compile(tex_filename)
+            # 预编译导言区格式（可选）
+            fmt_name = None
+            if self.format_cache:
+                fmt_name = self.format_cache.get_format(pdflatex_cmd, tex_filename)
+                if fmt_name:
+                    self.log(f"使用预编译导言区格式: {fmt_name}", "DEBUG")
             
-            # 尝试编译（可能需要多次）
-            max_attempts = 2
-            for attempt in range(max_attempts):
-                self.log(f"编译尝试 {attempt + 1}/{max_attempts}", "INFO")
+            # 按日志决定是否需要再次编译（交叉引用、标签变化等）
+            max_passes = int(os.getenv('LATEX_MAX_PASSES', '3'))
+            passes = 0
+            rerun_reasons = []
+            packages_installed = False
+            while True:
+                passes += 1
+                self.log(f"{self.backend.name} 第 {passes} 次运行", "INFO")
                 
                 try:
-                    result = subprocess.run(
-                        [pdflatex_cmd, "-interaction=nonstopmode", "-halt-on-error", tex_basename], 
-                        capture_output=True, text=True, cwd=tex_dir, timeout=60
-                    )
-                except UnicodeDecodeError:
-                    # 如果出现编码问题，使用错误忽略模式
-                    result = subprocess.run(
-                        [pdflatex_cmd, "-interaction=nonstopmode", "-halt-on-error", tex_basename], 
-                        capture_output=True, text=True, cwd=tex_dir, errors='ignore', timeout=60
-                    )
+                    result = self._run_latex(tex_basename, build_dir, fmt_name)
+                    if result.limit_reason:
+                        # 触发资源限制的文档不再回退重试，避免同一坏文档占用两倍资源
+                        raise Exception(f"{self.backend.name}编译超出资源限制: {result.limit_reason}")
+                    if result.returncode != 0 and fmt_name:
+                        # 格式文件与该文档不兼容时回退到完整导言区编译
+                        self.log("使用预编译格式编译失败，回退到标准编译", "WARNING")
+                        format_load_error = self.FORMAT_LOAD_ERROR.search(result.stdout or '')
+                        self._cleanup_before_compile(staged_tex)
+                        result = self._run_latex(tex_basename, build_dir)
+                        if result.limit_reason:
+                            raise Exception(f"{self.backend.name}编译超出资源限制: {result.limit_reason}")
+                        # 正文本身有错误时两种方式都会失败，此时不停用共用同一导言区的格式
+                        if result.returncode == 0 or format_load_error:
+                            self.format_cache.mark_failed(fmt_name)
+                        fmt_name = None
                 except subprocess.TimeoutExpired:
-                    raise Exception("pdflatex编译超时（60秒）")
+                    raise Exception(f"{self.backend.name}编译超时（{self.backend.timeout}秒）")
                 
                 # 详细的错误分析
                 if result.returncode != 0:
-                    self.log(f"编译尝试 {attempt + 1} 失败，返回码: {result.returncode}", "ERROR")
+                    self.log(f"第 {passes} 遍编译失败，返回码: {result.returncode}", "ERROR")
                     
                     # 分析错误类型
                     error_analysis = self._analyze_compilation_error(result.stdout, result.stderr)
@@ -970,57 +2146,181 @@ Output complete LaTeX source code that the user can compile directly without any
                             f"详细错误: {error_analysis['error_message']}"
                         )
                     
+                    # 只有MiKTeX环境（存在mpm）才能自动安装缺失包
                     if error_analysis["is_missing_package"]:
                         self.log(f"检测到缺失包: {error_analysis['missing_packages']}", "WARNING")
-                        if attempt < max_attempts - 1:
+                        if not packages_installed and shutil.which("mpm"):
                             self.log("尝试自动安装缺失包...", "INFO")
                             self._install_missing_packages(error_analysis['missing_packages'])
+                            packages_installed = True
                             continue
                     
-                    if attempt == max_attempts - 1:
-                        # 最后一次尝试失败，输出详细错误
-                        self._output_detailed_error(result.stdout, result.stderr, tex_filename)
-                        raise Exception(f"pdflatex编译失败，返回码: {result.returncode}")
-                else:
-                    self.log("pdflatex编译成功!", "SUCCESS")
-                    if result.stdout:
-                        self.log(f"编译输出摘要: {result.stdout[:200]}...", "DEBUG")
+                    self._output_detailed_error(result.stdout, result.stderr, staged_tex)
+                    raise Exception(f"{self.backend.name}编译失败，返回码: {result.returncode}")
+                
+                if result.stdout:
+                    self.log(f"编译输出摘要: {result.stdout[:200]}...", "DEBUG")
+                
+                if self.backend.manages_reruns:
+                    # latexmk自行处理重新编译，这里只统计实际运行的遍数
+                    passes = self.backend.count_passes(result)
+                    break
+                
+                rerun_reason = self._get_rerun_reason(os.path.splitext(staged_tex)[0] + ".log")
+                if not rerun_reason:
                     break
+                if passes >= max_passes:
+                    self.log(f"已达到最大编译遍数 {max_passes}，仍提示: {rerun_reason}", "WARNING")
+                    break
+                self.log(f"TeX要求重新编译: {rerun_reason}", "INFO")
+                rerun_reasons.append(rerun_reason)
             
-            # 检查PDF是否生成
-            pdf_filename = tex_filename.replace(".tex", ".pdf")
-            if os.path.exists(pdf_filename):
-                pdf_size = os.path.getsize(pdf_filename)
-                self.log(f"PDF编译成功: {pdf_filename} ({pdf_size} bytes)", "SUCCESS")
-                return pdf_filename
-            else:
+            self.log(f"{self.backend.name}编译成功! 共 {passes} 遍", "SUCCESS")
+            
+            # 检查PDF是否生成，并移动到持久目录
+            staged_pdf = os.path.splitext(staged_tex)[0] + ".pdf"
+            if not os.path.exists(staged_pdf):
                 raise Exception("PDF文件未生成，即使编译返回成功")
             
+            if cache_key:
+                self.pdf_cache.put(cache_key, staged_pdf)
+            # 持久构建目录保留PDF，供latexmk判断产物是否最新
+            self._publish_file(staged_pdf, pdf_filename, copy=bool(build_key))
+            pdf_size = os.path.getsize(pdf_filename)
+            self.log(f"PDF编译成功: {pdf_filename} ({pdf_size} bytes)", "SUCCESS")
+            return {
+                "pdf_file": pdf_filename,
+                "passes": passes,
+                "rerun_reasons": rerun_reasons,
+                "cache_hit": False
+            }
+            
         except subprocess.CalledProcessError as e:
             self.log(f"编译过程出错: {e}", "ERROR")
             raise Exception(f"编译 {tex_filename} 时出错: {e}")
+        finally:
+            if build_lock:
+                build_lock.release()
+            elif build_dir:
+                if keep_build_dir:
+                    self.log(f"保留构建目录: {build_dir}", "DEBUG")
+                else:
+                    shutil.rmtree(build_dir, ignore_errors=True)
+
+    def _resolve_scratch_root(self):
+        """
+        确定临时构建目录的根路径
+        
+        优先使用环境变量 LATEX_SCRATCH_DIR；否则在可用时使用内存文件系统 /dev/shm
+        （可通过 LATEX_USE_TMPFS=0 关闭），最后回退到系统临时目录。
+        """
+        configured = os.getenv('LATEX_SCRATCH_DIR')
+        if configured:
+            root = configured
+        elif (os.getenv('LATEX_USE_TMPFS', '1') != '0'
+              and os.path.isdir('/dev/shm') and os.access('/dev/shm', os.W_OK)):
+            root = os.path.join('/dev/shm', 'latex_builds')
+        else:
+            root = os.path.join(tempfile.gettempdir(), 'latex_builds')
+        
+        os.makedirs(root, exist_ok=True)
+        self.log(f"LaTeX构建目录根路径: {root}", "DEBUG")
+        return root
+
+    def _create_build_dir(self):
+        """为一次编译创建唯一的临时构建目录"""
+        return tempfile.mkdtemp(prefix='job_', dir=self.scratch_root)
+
+    def _publish_file(self, source_path, target_path, copy=False):
+        """
+        将构建产物原子地移动（copy=True时复制）到持久目录
+        
+        跨文件系统（如 /dev/shm -> 磁盘）时先复制到目标目录下的临时文件，
+        再用 os.replace 原子替换，保证读取方不会看到写了一半的文件。
+        """
+        target_dir = os.path.dirname(os.path.abspath(target_path))
+        os.makedirs(target_dir, exist_ok=True)
+        try:
+            if copy:
+                raise OSError("copy requested")
+            os.replace(source_path, target_path)
+        except OSError:
+            tmp_path = os.path.join(target_dir, f".{os.path.basename(target_path)}.{uuid.uuid4().hex}.tmp")
+            try:
+                shutil.copyfile(source_path, tmp_path)
+                os.replace(tmp_path, target_path)
+            finally:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+        return target_path
+
+    def _write_text_atomic(self, path, content):
+        """原子写入文本文件（先写临时文件再替换）"""
+        target_dir = os.path.dirname(os.path.abspath(path))
+        os.makedirs(target_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix=f".{os.path.basename(path)}.", suffix='.tmp', dir=target_dir)
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(content)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    # pdftex无法加载格式文件时的输出（文件缺失、由其他版本生成或已损坏）
+    FORMAT_LOAD_ERROR = re.compile(
+        r"can't find the format file|Fatal format file error|---! .*\.fmt (?:was written by|doesn't match|made by)"
+    )
+
+    def _run_latex(self, tex_basename, build_dir, fmt_name=None):
+        """用当前编译后端执行一次编译，fmt_name不为空时加载预编译导言区格式"""
+        cmd = self.backend.build_command(tex_basename, fmt_name)
+        env = self.format_cache.compile_env() if fmt_name else None
+        return self.sandbox.run(cmd, cwd=build_dir, env=env, timeout=self.backend.timeout)
 
     def _get_pdflatex_command(self):
         """获取可用的pdflatex命令"""
-        if self.pdflatex_path == "pdflatex":
-            return "pdflatex"
-        elif os.path.exists(self.pdflatex_path):
+        if os.path.exists(self.pdflatex_path):
             return self.pdflatex_path
-        else:
-            # 最后尝试系统PATH
-            try:
-                subprocess.run(["pdflatex", "--version"], 
-                             check=True, capture_output=True, text=True, timeout=5)
-                return "pdflatex"
-            except:
-                raise FileNotFoundError(
-                    f"pdflatex未找到。请检查MiKTeX安装或路径配置。\n" 
-                    f"当前配置路径: {self.pdflatex_path}\n" 
-                    "建议：\n" 
-                    "1. 重新安装MiKTeX\n" 
-                    "2. 确保MiKTeX添加到系统PATH\n" 
-                    "3. 或者手动指定pdflatex.exe的完整路径"
-                )
+        found = shutil.which(self.pdflatex_path)
+        if found:
+            return found
+        raise FileNotFoundError(
+            f"pdflatex未找到。请检查MiKTeX安装或路径配置。\n" 
+            f"当前配置路径: {self.pdflatex_path}\n" 
+            "建议：\n" 
+            "1. 重新安装MiKTeX\n" 
+            "2. 确保MiKTeX添加到系统PATH\n" 
+            "3. 或者手动指定pdflatex.exe的完整路径"
+        )
+
+    # TeX及常见宏包在.log中要求重新编译时输出的提示
+    RERUN_PATTERNS = [
+        r"Label\(s\) may have changed\. Rerun to get cross-references right",
+        r"Table widths have changed\. Rerun LaTeX",
+        r"\(rerunfilecheck\).*Rerun",
+        r"Rerun to get (?:cross-references|outlines|citations|the bars) right",
+        r"Please rerun LaTeX",
+        r"Rerun LaTeX",
+    ]
+
+    def _get_rerun_reason(self, log_file):
+        """读取.log，返回TeX要求重新编译的提示；不需要重新编译时返回None"""
+        if not os.path.exists(log_file):
+            return None
+        try:
+            with open(log_file, 'r', encoding='utf-8', errors='ignore') as f:
+                log_content = f.read()
+        except Exception as e:
+            self.log(f"无法读取LaTeX日志文件: {e}", "WARNING")
+            return None
+        
+        for pattern in self.RERUN_PATTERNS:
+            match = re.search(pattern, log_content, flags=re.IGNORECASE)
+            if match:
+                return match.group(0)
+        return None
 
     def _cleanup_before_compile(self, tex_filename):
         """编译前清理辅助文件"""
@@ -1122,37 +2422,226 @@ Output complete LaTeX source code that the user can compile directly without any
             except Exception as e:
                 self.log(f"无法读取LaTeX日志文件: {e}", "WARNING")
 
-    def clean_auxiliary_files(self, tex_filename):
+    def parse_log_errors(self, log_file):
         """
-        清理编译过程中产生的辅助文件
+        从.log中提取结构化错误
         
-        Args:
-            tex_filename (str): LaTeX文件名
+        TeX的错误以 "! 错误信息" 开头，随后的 "l.<行号> 上下文" 给出出错位置。
+        
+        Returns:
+            list: [{'line': 行号或None, 'message': 错误信息, 'context': 出错处源码}]
         """
-        base_name = tex_filename.replace(".tex", "")
-        auxiliary_extensions = ["aux", "log", "out", "toc", "nav", "snm"]
+        if not os.path.exists(log_file):
+            return []
+        with open(log_file, 'r', encoding='utf-8', errors='ignore') as f:
+            lines = f.read().splitlines()
+        
+        errors = []
+        for index, line in enumerate(lines):
+            if not line.startswith('! '):
+                continue
+            error = {'line': None, 'message': line[2:].strip(), 'context': ''}
+            # 出错位置一般在错误信息后的十几行之内
+            for follow in lines[index + 1:index + 20]:
+                match = re.match(r'l\.(\d+)\s?(.*)', follow)
+                if match:
+                    error['line'] = int(match.group(1))
+                    error['context'] = match.group(2).strip()
+                    break
+                if follow.startswith('! '):
+                    break
+            errors.append(error)
+        return errors
+
+    def recompile_with_patch(self, tex_filename, start_line, end_line, replacement, build_key, base_hash=None):
+        """
+        将一段行范围替换应用到已保存的.tex并在持久构建目录中重新编译
         
-        cleaned_files = []
-        for ext in auxiliary_extensions:
-            aux_file = f"{base_name}.{ext}"
+        Args:
+            tex_filename (str): 已保存的LaTeX文件
+            start_line (int): 起始行（从1开始）
+            end_line (int): 结束行（包含；为 start_line-1 时表示在 start_line 前插入）
+            replacement (str): 替换内容
+            build_key (str): 持久构建目录的键（如材料ID）
+            base_hash (str): 客户端编辑所基于的源码哈希，不一致时拒绝应用
+            
+        Returns:
+            dict: 成功时包含 pdf_file/passes 等，incremental 表示是否复用了已有构建目录；失败时包含 errors，其中 in_patch 标记错误是否落在本次修改的行内
+        """
+        with self.build_dirs.hold(build_key) as build_dir:
+            # 构建目录随材料删除，或超过TTL未使用被淘汰；没有辅助文件时本次是一次完整编译
+            incremental = os.path.exists(os.path.join(build_dir, "main.aux"))
+            if not incremental:
+                self.log("没有可复用的构建目录，执行完整编译", "INFO")
+            
+            with open(tex_filename, 'r', encoding='utf-8') as f:
+                source = f.read()
+            
+            current_hash = hashlib.sha256(source.encode('utf-8')).hexdigest()
+            if base_hash and base_hash != current_hash:
+                return {"success": False, "conflict": True, "source_hash": current_hash,
+                        "error": "LaTeX源码已被修改，请刷新后重试"}
+            
+            lines = source.splitlines(keepends=True)
+            if not (1 <= start_line <= len(lines) + 1 and start_line - 1 <= end_line <= len(lines)):
+                return {"success": False, "source_hash": current_hash,
+                        "error": f"行范围无效: {start_line}-{end_line}（共 {len(lines)} 行）"}
+            
+            new_lines = replacement.splitlines(keepends=True)
+            if new_lines and not new_lines[-1].endswith('\n') and end_line < len(lines):
+                new_lines[-1] += '\n'
+            patched = ''.join(lines[:start_line - 1] + new_lines + lines[end_line:])
+            self._write_text_atomic(tex_filename, patched)
+            
+            patched_range = [start_line, start_line + len(new_lines) - 1]
+            patched_hash = hashlib.sha256(patched.encode('utf-8')).hexdigest()
+            self.log(f"已应用修改: 第 {start_line}-{end_line} 行 -> {len(new_lines)} 行", "INFO")
+            
             try:
-                if os.path.exists(aux_file):
-                    os.remove(aux_file)
-                    cleaned_files.append(aux_file)
+                report = self.compile_tex_with_report(tex_filename, build_key=build_key)
             except Exception as e:
-                self.log(f"清理文件 {aux_file} 时出错: {e}", "WARNING")
+                errors = self.parse_log_errors(os.path.join(build_dir, "main.log"))
+                for error in errors:
+                    error['in_patch'] = (error['line'] is not None
+                                         and patched_range[0] <= error['line'] <= patched_range[1])
+                return {"success": False, "error": str(e), "errors": errors,
+                        "patched_range": patched_range, "source_hash": patched_hash}
+        
+        thumbnails = self.thumbnailer.generate(report["pdf_file"]) if self.thumbnailer else None
+        return {
+            "success": True,
+            "pdf_file": report["pdf_file"],
+            "compile_passes": report["passes"],
+            "pdf_cache_hit": report["cache_hit"],
+            "incremental": incremental,
+            "thumbnails": build_thumbnail_urls(thumbnails),
+            "patched_range": patched_range,
+            "source_hash": patched_hash
+        }
+
+    def compile_generated_latex(self, latex_code, tex_filename, image_path, clean_aux=True, build_key=None):
+        """
+        编译已保存的LaTeX代码并生成缩略图（同步流程和批量流程共用）
+        
+        Returns:
+            dict: 与 translate_poster_complete 相同格式的成功结果，编译失败时抛出异常
+        """
+        # 在独立构建目录中编译PDF（辅助文件随构建目录一起清理）
+        self.log("编译PDF", "INFO")
+        compile_report = self.compile_tex_with_report(
+            tex_filename, keep_build_dir=not clean_aux, build_key=build_key
+        )
+        pdf_filename = compile_report["pdf_file"]
+        
+        # 生成预览缩略图（失败不影响翻译结果）
+        thumbnails = self.thumbnailer.generate(pdf_filename) if self.thumbnailer else None
+        
+        result = {
+            "success": True,
+            "tex_file": tex_filename,
+            "pdf_file": pdf_filename,
+            "image_file": image_path,
+            "latex_code_length": len(latex_code),
+            "compile_passes": compile_report["passes"],
+            "pdf_cache_hit": compile_report["cache_hit"],
+            "thumbnails": build_thumbnail_urls(thumbnails)
+        }
+        
+        self.log("🎉 海报翻译完成!", "SUCCESS")
+        self.log(f"   输入图像: {image_path}", "INFO")
+        self.log(f"   LaTeX文件: {tex_filename}", "INFO")
+        self.log(f"   PDF文件: {pdf_filename}", "INFO")
+        self.log(f"   编译遍数: {compile_report['passes']}", "INFO")
+        
+        return result
+
+    def render_draft(self, image_path, output_base_name):
+        """
+        生成草稿预览：把百度翻译后的图片直接转成单页PDF（不调用模型、不编译LaTeX）
+
+        正式的LaTeX版本在后台生成，完成后替换草稿。
+
+        Returns:
+            dict: {'success', 'draft', 'pdf_file', 'image_file', 'thumbnails'}
+        """
+        from PIL import Image as PILImage
+
+        pdf_filename = f"{output_base_name}.pdf"
+        os.makedirs(os.path.dirname(os.path.abspath(pdf_filename)), exist_ok=True)
+        with PILImage.open(image_path) as image:
+            if image.mode != 'RGB':
+                image = image.convert('RGB')
+            image.save(pdf_filename, 'PDF', resolution=150.0)
+
+        thumbnails = self.thumbnailer.generate(pdf_filename) if self.thumbnailer else None
+        self.log(f"草稿预览已生成: {pdf_filename}", "SUCCESS")
+        return {
+            "success": True,
+            "draft": True,
+            "tex_file": None,
+            "pdf_file": pdf_filename,
+            "image_file": image_path,
+            "thumbnails": build_thumbnail_urls(thumbnails)
+        }
+
+    def route_poster(self, image_path, text_info=None, mode=None):
+        """
+        选择生成方式和模型
+        
+        纯文本模式需要OCR译文，缺少时回退到视觉模式；视觉模式下未启用路由时固定使用gpt-4o。
+        """
+        mode = mode or self.generation_mode
+        if mode == 'text':
+            if text_info and text_info.get('translated_texts'):
+                return {'mode': 'text', 'route': 'text', 'model': self.text_model, 'score': None, 'features': {}}
+            self.log("没有OCR译文，纯文本模式回退到视觉模式", "WARNING")
+        
+        mode = 'structured' if mode == 'structured' else 'vision'
+        if not self.router:
+            return {'mode': mode, 'route': 'default', 'model': 'gpt-4o', 'score': None, 'features': {}}
+        return dict(self.router.assess(image_path, text_info), mode=mode)
+
+    def _generate_and_compile(self, image_path, tex_filename, decision, clean_aux, build_key, text_info=None):
+        """按路由决策生成并编译，同时按“生成方式/路由”记录时延、失败阶段和译文覆盖率"""
+        stats_key = f"{decision['mode']}/{decision['route']}"
+        start_time = time.time()
+        try:
+            if decision['mode'] == 'text':
+                latex_code = self.layout_to_latex(text_info, image_path, tex_filename, model=decision['model'])
+            elif decision['mode'] == 'structured':
+                latex_code = self.poster_to_structured_latex(image_path, tex_filename, decision['model'], text_info)
+            else:
+                latex_code = self.poster_to_latex(image_path, tex_filename, model=decision['model'])
+        except Exception:
+            self.generation_stats.record(stats_key, time.time() - start_time, 'generation')
+            raise
+        latency = time.time() - start_time
+        coverage = GenerationStats.text_coverage(latex_code, text_info)
+        
+        try:
+            result = self.compile_generated_latex(latex_code, tex_filename, image_path, clean_aux, build_key)
+        except Exception:
+            self.generation_stats.record(stats_key, latency, 'compile', coverage)
+            raise
         
-        if cleaned_files:
-            self.log(f"已清理辅助文件: {', '.join(cleaned_files)}", "SUCCESS")
+        self.generation_stats.record(stats_key, latency, coverage=coverage)
+        result.update({'generation_mode': decision['mode'], 'model': decision['model'], 'route': decision['route'],
+                       'complexity': decision['score'], 'generation_seconds': round(latency, 2),
+                       'text_coverage': coverage})
+        return result
 
-    def translate_poster_complete(self, image_path, output_base_name="output", clean_aux=True):
+    def translate_poster_complete(self, image_path, output_base_name="output", clean_aux=True, build_key=None,
+                                  text_info=None, generation_mode=None):
         """
         完整的海报翻译流程：图像 -> LaTeX -> PDF
         
         Args:
             image_path (str): 海报图像路径
             output_base_name (str): 输出文件基础名称
-            clean_aux (bool): 是否清理辅助文件
+            clean_aux (bool): 是否清理辅助文件（为False时保留临时构建目录）
+            build_key (str): 持久构建目录的键（如材料ID），便于后续增量重新编译
+            text_info (dict): 百度OCR文本信息，用于评估版面复杂度选择模型
+            generation_mode (str): vision、text 或 structured，None时使用 POSTER_GENERATION_MODE
             
         Returns:
             dict: 包含生成文件信息的字典
@@ -1164,34 +2653,21 @@ Output complete LaTeX source code that the user can compile directly without any
             if not self.validate_image_file(image_path):
                 raise FileNotFoundError(f"图像文件无效: {image_path}")
             
-            # 第一步：生成LaTeX代码
+            # 第一步：按复杂度选择模型并生成LaTeX代码；第二步：编译PDF并生成缩略图
             tex_filename = f"{output_base_name}.tex"
             self.log("第1步: 生成LaTeX代码", "INFO")
-            latex_code = self.poster_to_latex(image_path, tex_filename)
-            
-            # 第二步：编译PDF
-            self.log("第2步: 编译PDF", "INFO")
-            pdf_filename = self.compile_tex_to_pdf(tex_filename)
-            
-            # 第三步：清理辅助文件（可选）
-            if clean_aux:
-                self.log("第3步: 清理辅助文件", "INFO")
-                self.clean_auxiliary_files(tex_filename)
-            
-            result = {
-                "success": True,
-                "tex_file": tex_filename,
-                "pdf_file": pdf_filename,
-                "image_file": image_path,
-                "latex_code_length": len(latex_code)
-            }
-            
-            self.log("🎉 海报翻译完成!", "SUCCESS")
-            self.log(f"   输入图像: {image_path}", "INFO")
-            self.log(f"   LaTeX文件: {tex_filename}", "INFO")
-            self.log(f"   PDF文件: {pdf_filename}", "INFO")
+            decision = self.route_poster(image_path, text_info, generation_mode)
             
-            return result
+            try:
+                return self._generate_and_compile(image_path, tex_filename, decision, clean_aux, build_key, text_info)
+            except Exception as e:
+                if decision['route'] not in ('simple', 'text') and decision['mode'] != 'structured':
+                    raise
+                # 小模型、纯文本或结构化模式的结果无法生成或编译时，改用视觉大模型重试一次
+                complex_model = self.router.complex_model if self.router else 'gpt-4o'
+                self.log(f"{decision['model']} 生成失败（{str(e)}），改用 {complex_model} 重试", "WARNING")
+                decision = dict(decision, mode='vision', route='escalated', model=complex_model)
+                return self._generate_and_compile(image_path, tex_filename, decision, clean_aux, build_key, text_info)
             
         except Exception as e:
             self.log(f"海报翻译失败: {str(e)}", "ERROR")
@@ -1201,50 +2677,636 @@ Output complete LaTeX source code that the user can compile directly without any
                 "image_file": image_path
             }
 
-# ========== 百度图片翻译类 ========== 
+# ========== 海报生成模型路由 ==========
 
-class BaiduImageTranslator:
-    """百度图片翻译API封装类"""
+class PosterModelRouter:
+    """
+    按版面复杂度为海报选择生成模型
 
-    def __init__(self, api_key=None, secret_key=None):
-        self.api_key = api_key or self._load_key_from_config('BAIDU_API_KEY')
-        self.secret_key = secret_key or self._load_key_from_config('BAIDU_SECRET_KEY')
-        self.access_token = None
+    复杂度由百度OCR的文本块信息（块数、字数、版面列数）和图像统计（边缘密度、灰度熵）
+    加权得到，范围0~1。低于阈值的简单文档（如只有几行字的证书）使用较快较便宜的模型，
+    其余仍使用大模型。各路由的时延和失败率记录在 GenerationStats 中，用于调整阈值。
+    """
 
-    def _load_key_from_config(self, key_name):
-        """从配置文件加载密钥（按照老后端的方式）"""
-        # 按照老后端的方式，从单独的文本文件读取
-        file_mapping = {
-            'BAIDU_API_KEY': 'config/baidu_api_key.txt',
-            'BAIDU_SECRET_KEY': 'config/baidu_secret_key.txt'
-        }
-        
-        file_path = file_mapping.get(key_name)
-        if file_path and os.path.exists(file_path):
-            try:
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    key = f.read().strip()
-                    if key:
-                        log_message(f"✅ 成功从 {file_path} 加载密钥", "INFO")
-                        return key
-            except Exception as e:
-                log_message(f"⚠️ 警告: 无法从 {file_path} 读取密钥: {e}", "WARNING")
-        
-        # 如果文件读取失败，尝试从config.env读取
-        config_path = "config.env"
-        if os.path.exists(config_path):
-            try:
-                with open(config_path, 'r', encoding='utf-8') as f:
-                    for line in f:
-                        line = line.strip()
-                        if '=' in line and not line.startswith('#') and line:
-                            key, value = line.split('=', 1)
-                            if key.strip() == key_name:
-                                return value.strip()
-            except Exception:
-                pass
-        
-        return ''
+    def __init__(self, simple_model=None, complex_model=None, threshold=None):
+        self.simple_model = simple_model or os.getenv('POSTER_MODEL_SIMPLE', 'gpt-4o-mini')
+        self.complex_model = complex_model or os.getenv('POSTER_MODEL_COMPLEX', 'gpt-4o')
+        self.threshold = threshold if threshold is not None else float(os.getenv('POSTER_ROUTE_THRESHOLD', '0.45'))
+
+    @staticmethod
+    def _text_features(text_info, image_width):
+        """从OCR结果提取块数、字数和版面列数"""
+        blocks = text_info.get('detected_texts') or text_info.get('translated_texts') or []
+        block_count = text_info.get('total_blocks') or len(blocks)
+        char_count = sum(len(block.get('text', '')) for block in blocks)
+
+        # 按文本块左边界把版面分成10个竖条，统计有文字的竖条构成的连续列数
+        columns = 0
+        if blocks and image_width:
+            occupied = sorted({min(9, int(block['position']['left'] * 10 / image_width)) for block in blocks})
+            columns = 1 + sum(1 for a, b in zip(occupied, occupied[1:]) if b - a > 1)
+        return {'blocks': block_count, 'chars': char_count, 'columns': columns}
+
+    @staticmethod
+    def _image_features(image_path):
+        """计算缩小后灰度图的边缘密度和熵"""
+        try:
+            from PIL import Image as PILImage, ImageFilter, ImageStat
+        except ImportError:
+            return {'width': 0, 'edge_density': 0.0, 'entropy': 0.0}
+
+        with PILImage.open(image_path) as image:
+            width = image.size[0]
+            gray = image.convert('L')
+            gray.thumbnail((512, 512))
+            edges = gray.filter(ImageFilter.FIND_EDGES)
+            edge_density = ImageStat.Stat(edges).mean[0] / 255
+            entropy = gray.entropy()
+        return {'width': width, 'edge_density': round(edge_density, 4), 'entropy': round(entropy, 3)}
+
+    def assess(self, image_path, text_info=None):
+        """
+        评估海报复杂度并选择模型
+
+        Returns:
+            dict: {'route': 'simple'/'complex', 'model', 'score', 'features'}
+        """
+        if not text_info:
+            # 没有OCR数据时无法判断文字量，保守地使用大模型
+            return {'route': 'complex', 'model': self.complex_model, 'score': None, 'features': {}}
+
+        try:
+            features = self._image_features(image_path)
+        except Exception as e:
+            log_message(f"图像复杂度统计失败，使用大模型: {str(e)}", "WARNING")
+            return {'route': 'complex', 'model': self.complex_model, 'score': None, 'features': {}}
+        features.update(self._text_features(text_info, features['width']))
+
+        score = (
+            0.30 * min(features['blocks'] / 30, 1.0)
+            + 0.20 * min(features['chars'] / 600, 1.0)
+            + 0.20 * min(features['columns'] / 4, 1.0)
+            + 0.20 * min(features['edge_density'] / 0.15, 1.0)
+            + 0.10 * min(features['entropy'] / 7.5, 1.0)
+        )
+        route = 'simple' if score < self.threshold else 'complex'
+        model = self.simple_model if route == 'simple' else self.complex_model
+        log_message(f"海报复杂度 {score:.3f}（阈值 {self.threshold}），使用 {model}", "INFO")
+        return {'route': route, 'model': model, 'score': round(score, 4), 'features': features}
+
+    def describe(self):
+        return {'threshold': self.threshold, 'simple_model': self.simple_model, 'complex_model': self.complex_model}
+
+class GenerationStats:
+    """
+    海报LaTeX生成指标
+
+    按“生成方式/路由”分别统计请求数、生成和编译失败次数、生成时延，
+    以及译文覆盖率（译文文本块出现在生成的LaTeX中的比例，作为质量的粗略指标），
+    便于比较视觉模式与纯文本模式、大小模型之间的差异。
+    """
+
+    def __init__(self, window=500):
+        self.window = window
+        self.lock = threading.Lock()
+        self.buckets = {}
+
+    def record(self, key, latency=None, failure=None, coverage=None):
+        """
+        记录一次生成结果
+
+        Args:
+            key (str): 统计分组，如 vision/simple、text/text
+            latency (float): 生成耗时（秒）
+            failure (str): None表示成功；'generation' 或 'compile' 表示失败阶段
+            coverage (float): 译文覆盖率（0~1）
+        """
+        with self.lock:
+            bucket = self.buckets.setdefault(key, {
+                'requests': 0, 'generation_failures': 0, 'compile_failures': 0,
+                'latencies': deque(maxlen=self.window), 'coverages': deque(maxlen=self.window)
+            })
+            bucket['requests'] += 1
+            if failure:
+                bucket[f'{failure}_failures'] += 1
+            if latency is not None:
+                bucket['latencies'].append(latency)
+            if coverage is not None:
+                bucket['coverages'].append(coverage)
+
+    def stats(self):
+        with self.lock:
+            result = {}
+            for key, bucket in self.buckets.items():
+                latencies = sorted(bucket['latencies'])
+                coverages = bucket['coverages']
+                failures = bucket['generation_failures'] + bucket['compile_failures']
+                result[key] = {
+                    'requests': bucket['requests'],
+                    'generation_failures': bucket['generation_failures'],
+                    'compile_failures': bucket['compile_failures'],
+                    'failure_rate': round(failures / bucket['requests'], 4) if bucket['requests'] else 0.0,
+                    'latency_avg': round(sum(latencies) / len(latencies), 3) if latencies else None,
+                    'latency_p95': round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 3) if latencies else None,
+                    'coverage_avg': round(sum(coverages) / len(coverages), 4) if coverages else None
+                }
+            return result
+
+    @staticmethod
+    def text_coverage(latex_code, text_info):
+        """统计译文文本块出现在LaTeX源码中的比例（忽略大小写、空白和LaTeX转义）"""
+        blocks = [block.get('text', '') for block in (text_info or {}).get('translated_texts', [])]
+        blocks = [block for block in blocks if len(block.strip()) >= 3]
+        if not blocks:
+            return None
+
+        def normalize(text):
+            return re.sub(r'[^0-9a-z]+', '', text.lower())
+
+        source = normalize(re.sub(r'\\[a-zA-Z]+\*?', ' ', latex_code))
+        found = sum(1 for block in blocks if normalize(block) and normalize(block) in source)
+        return round(found / len(blocks), 4)
+
+# ========== 结构化海报模板 ==========
+
+class LaTeXTemplateRenderer:
+    """
+    把模型返回的结构化海报内容（JSON）渲染为LaTeX
+
+    模板位于 latex_templates/ 目录，使用 \\BLOCK{...}、\\VAR{...} 和 %% 行语句作为Jinja2分隔符，
+    避免与LaTeX的花括号冲突。所有文本字段在渲染前统一转义，模板中只输出转义后的内容，
+    模型无法注入任意LaTeX命令，生成的代码几乎总能一次编译通过。
+    """
+
+    TEMPLATES = ('event', 'certificate', 'document')
+
+    LATEX_SPECIAL_CHARS = {
+        '\\': r'\textbackslash{}', '&': r'\&', '%': r'\%', '$': r'\$', '#': r'\#',
+        '_': r'\_', '{': r'\{', '}': r'\}', '~': r'\textasciitilde{}', '^': r'\textasciicircum{}',
+        '<': r'\textless{}', '>': r'\textgreater{}'
+    }
+    # pdflatex默认编码能处理的常见排版符号
+    TYPOGRAPHIC_CHARS = {
+        '‘': '`', '’': "'", '“': '``', '”': "''", '–': '--', '—': '---',
+        '…': r'\ldots{}', '•': r'\textbullet{}', '·': r'\textperiodcentered{}',
+        '×': r'$\times$', '°': r'\textdegree{}', '€': 'EUR', ' ': '~',
+        '　': ' ', '：': ':', '，': ', ', '（': '(', '）': ')'
+    }
+    # 没有ASCII基本字母、T1编码中有对应字形的字母
+    T1_LETTERS = {
+        'Ł': r'\L{}', 'ł': r'\l{}', 'Œ': r'\OE{}', 'œ': r'\oe{}', 'Đ': r'\DJ{}', 'đ': r'\dj{}',
+        'Ŋ': r'\NG{}', 'ŋ': r'\ng{}', 'ı': r'\i{}', 'ȷ': r'\j{}', 'ẞ': r'\SS{}'
+    }
+    # 组合附加符号对应的LaTeX重音命令（č -> \v{c}、ő -> \H{o}、ą -> \k{a}）
+    ACCENT_COMMANDS = {
+        '\u0300': '`', '\u0301': "'", '\u0302': '^', '\u0303': '~', '\u0304': '=', '\u0306': 'u',
+        '\u0307': '.', '\u0308': '"', '\u030a': 'r', '\u030b': 'H', '\u030c': 'v', '\u0323': 'd',
+        '\u0327': 'c', '\u0328': 'k', '\u0331': 'b'
+    }
+    ACCENTS_BELOW = ('c', 'k', 'd', 'b')
+
+    def __init__(self, template_dir=None):
+        self.template_dir = template_dir or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'latex_templates')
+        self.env = None
+
+    def _get_env(self):
+        if self.env is None:
+            import jinja2
+            self.env = jinja2.Environment(
+                loader=jinja2.FileSystemLoader(self.template_dir),
+                block_start_string=r'\BLOCK{', block_end_string='}',
+                variable_start_string=r'\VAR{', variable_end_string='}',
+                comment_start_string=r'\#{', comment_end_string='}',
+                line_statement_prefix='%%', line_comment_prefix='%#',
+                trim_blocks=True, lstrip_blocks=True, autoescape=False,
+                undefined=jinja2.ChainableUndefined
+            )
+        return self.env
+
+    @classmethod
+    def _accented(cls, char):
+        """把带附加符号的拉丁字母写成重音命令，无法表示时返回None"""
+        decomposed = unicodedata.normalize('NFD', char)
+        base, marks = decomposed[0], decomposed[1:]
+        if not marks or not ('a' <= base.lower() <= 'z') or any(mark not in cls.ACCENT_COMMANDS for mark in marks):
+            return None
+        result = base
+        for mark in marks:
+            command = cls.ACCENT_COMMANDS[mark]
+            if base in 'ij' and result == base and command not in cls.ACCENTS_BELOW:
+                result = '\\' + base  # 上方加重音的 i、j 使用无点字形
+            result = f"\\{command}{{{result}}}"
+        return result
+
+    @classmethod
+    def escape(cls, value):
+        """
+        转义LaTeX特殊字符
+
+        排版符号（含不换行空格、全角空格）先于空白合并替换；控制字符和零宽字符直接去掉；
+        utf8/T1只保证ASCII和Latin-1，其余拉丁字母写成T1字母命令（Ł -> \\L{}）或重音命令（č -> \\v{c}），
+        连字、全角字母等退化为兼容的ASCII字符；仍无法表示的字符（如残留的中文）替换为 ? 并记录警告。
+        """
+        if value is None:
+            return ''
+        out = []
+        unmappable = []
+        for char in unicodedata.normalize('NFC', str(value)):
+            code = ord(char)
+            if char in cls.LATEX_SPECIAL_CHARS:
+                out.append(cls.LATEX_SPECIAL_CHARS[char])
+            elif char in cls.TYPOGRAPHIC_CHARS:
+                out.append(cls.TYPOGRAPHIC_CHARS[char])
+            elif char.isspace():
+                out.append(' ')
+            elif unicodedata.category(char) in ('Cc', 'Cf') and code != 0xAD:
+                continue
+            elif code < 0x80 or 0xA0 <= code < 0x100:
+                out.append(char)
+            elif char in cls.T1_LETTERS:
+                out.append(cls.T1_LETTERS[char])
+            else:
+                accented = cls._accented(char)
+                if accented is None:
+                    compatible = unicodedata.normalize('NFKD', char)
+                    if compatible != char and all(ord(c) < 0x80 for c in compatible):
+                        accented = ''.join(cls.LATEX_SPECIAL_CHARS.get(c, c) for c in compatible)
+                if accented is None:
+                    unmappable.append(char)
+                    accented = '?'
+                out.append(accented)
+        if unmappable:
+            log_message(f"LaTeX模板无法表示的字符已替换为 ?: {''.join(sorted(set(unmappable)))}", "WARNING")
+        return re.sub(r' {2,}', ' ', ''.join(out)).strip()
+
+    def normalize(self, data):
+        """校验并规整模型返回的结构，所有文本字段在这里完成转义"""
+        if not isinstance(data, dict):
+            raise ValueError("结构化内容必须是JSON对象")
+        esc = self.escape
+
+        def as_list(value):
+            return value if isinstance(value, list) else ([] if value in (None, '') else [value])
+
+        template = str(data.get('template') or 'event').lower()
+        if template not in self.TEMPLATES:
+            template = 'event'
+
+        info = []
+        for item in as_list(data.get('info')):
+            if isinstance(item, dict):
+                info.append({'label': esc(item.get('label')), 'value': esc(item.get('value'))})
+            else:
+                info.append({'label': '', 'value': esc(item)})
+
+        sections = []
+        for section in as_list(data.get('sections')):
+            if isinstance(section, dict):
+                paragraphs = [esc(p) for p in as_list(section.get('paragraphs')) if esc(p)]
+                sections.append({'heading': esc(section.get('heading')), 'paragraphs': paragraphs})
+            elif esc(section):
+                sections.append({'heading': '', 'paragraphs': [esc(section)]})
+
+        agenda_data = data.get('agenda') if isinstance(data.get('agenda'), dict) else {}
+        columns = [esc(c) for c in as_list(agenda_data.get('columns'))]
+        rows = [[esc(cell) for cell in as_list(row)] for row in as_list(agenda_data.get('rows'))]
+        rows = [row for row in rows if any(row)]
+        width = max([len(columns)] + [len(row) for row in rows]) if rows else 0
+        columns = (columns + [''] * width)[:width]
+        rows = [(row + [''] * width)[:width] for row in rows]
+        agenda = {
+            'heading': esc(agenda_data.get('heading')),
+            'columns': columns,
+            'has_header': any(columns),
+            'rows': rows,
+            'colspec': ('l' + 'Y' * (width - 1)) if width > 1 else 'Y'
+        }
+
+        guests = []
+        for guest in as_list(data.get('guests')):
+            if isinstance(guest, dict) and (guest.get('name') or guest.get('title')):
+                guests.append({'name': esc(guest.get('name')), 'title': esc(guest.get('title')),
+                               'details': esc(guest.get('details'))})
+        guests_per_row = min(4, len(guests)) or 1
+
+        signatures = []
+        for signature in as_list(data.get('signatures')):
+            if isinstance(signature, dict):
+                signatures.append({'name': esc(signature.get('name')), 'title': esc(signature.get('title'))})
+            elif esc(signature):
+                signatures.append({'name': esc(signature), 'title': ''})
+
+        return {
+            'template': template,
+            'title': esc(data.get('title')) or 'Untitled',
+            'subtitle': esc(data.get('subtitle')),
+            'recipient': esc(data.get('recipient')),
+            'info': info,
+            'sections': sections,
+            'agenda': agenda,
+            'guests_heading': esc(data.get('guests_heading')),
+            'guests': guests,
+            'guests_per_row': guests_per_row,
+            'guest_width': f"{0.96 / guests_per_row - 0.02:.3f}",
+            'signatures': signatures,
+            'signature_width': f"{0.9 / max(1, len(signatures)) - 0.02:.3f}",
+            'qr_code': bool(data.get('qr_code')),
+            'footer': [esc(line) for line in as_list(data.get('footer')) if esc(line)]
+        }
+
+    def render(self, data):
+        """渲染结构化内容，返回完整的LaTeX源码"""
+        context = self.normalize(data)
+        template = self._get_env().get_template(f"{context['template']}.tex.j2")
+        return template.render(**context).strip() + '\n'
+
+# ========== 海报离线批量生成 ==========
+
+class PosterBatchProcessor:
+    """
+    海报LaTeX离线批量生成（OpenAI Batch API）
+
+    把一个任务中所有海报的请求写入JSONL批量文件，通过 files/batches 接口提交，
+    轮询直到批量任务结束，再把每条结果交给编译流程。适合对时延不敏感的大批量任务，
+    吞吐更高、费用更低。设置 OPENAI_BATCH_BASE_URL 可指向本地替身服务
+    （见 mock_openai_batch_server.py）。
+    任务状态保存在 job.json 中，服务重启后 resume_pending 会继续轮询未处理完的任务；
+    过期或取消的批量任务仍会下载已完成部分的结果。
+    """
+
+    TERMINAL_STATUSES = {'completed', 'failed', 'expired', 'cancelled'}
+    # 这些状态下批量任务可能只完成了一部分，已完成的结果仍然可以下载
+    PARTIAL_STATUSES = {'expired', 'cancelled'}
+
+    def __init__(self, translator, work_dir='batch_jobs', model='gpt-4o'):
+        self.translator = translator
+        self.work_dir = os.path.abspath(work_dir)
+        self.model = model
+        self.poll_interval = int(os.getenv('OPENAI_BATCH_POLL_SECONDS', '30'))
+        self.max_wait = int(os.getenv('OPENAI_BATCH_MAX_WAIT_SECONDS', str(26 * 3600)))
+        self.lock = threading.Lock()
+        self.jobs = {}
+        self.running = set()
+        os.makedirs(self.work_dir, exist_ok=True)
+
+        base_url = os.getenv('OPENAI_BATCH_BASE_URL')
+        if base_url and OPENAI_AVAILABLE:
+            self.client = OpenAI(api_key=translator.api_key or 'local-batch', base_url=base_url)
+        else:
+            self.client = translator.client
+
+    def _job_dir(self, job_id):
+        return os.path.join(self.work_dir, job_id)
+
+    def _save_job(self, job):
+        """把任务状态写入 job.json，便于排查和查询"""
+        with self.lock:
+            self.jobs[job['id']] = job
+            snapshot = json.dumps(job, ensure_ascii=False, indent=2)
+        self.translator._write_text_atomic(os.path.join(self._job_dir(job['id']), 'job.json'), snapshot)
+
+    def get_job(self, job_id):
+        with self.lock:
+            job = self.jobs.get(job_id)
+        if job:
+            return job
+        job_file = os.path.join(self._job_dir(os.path.basename(job_id)), 'job.json')
+        if os.path.exists(job_file):
+            with open(job_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        return None
+
+    def submit(self, items, owner=None):
+        """
+        写入批量文件并提交
+
+        Args:
+            items (list): [{'custom_id', 'image_path', 'output_base_name', 'build_key'}]
+            owner (str): 提交任务的用户ID，查询任务时用于权限校验
+
+        Returns:
+            dict: 任务信息（id、batch_id、状态、各条目）
+        """
+        if not self.client:
+            raise Exception("OpenAI API密钥未设置，无法提交批量任务")
+
+        job_id = f"batch_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}"
+        job_dir = self._job_dir(job_id)
+        os.makedirs(job_dir, exist_ok=True)
+
+        requests_file = os.path.join(job_dir, 'requests.jsonl')
+        with open(requests_file, 'w', encoding='utf-8') as f:
+            for item in items:
+                f.write(json.dumps({
+                    "custom_id": item['custom_id'],
+                    "method": "POST",
+                    "url": "/v1/chat/completions",
+                    "body": {
+                        "model": item.get('model', self.model),
+                        "messages": self.translator._build_poster_messages(item['image_path'])
+                    }
+                }, ensure_ascii=False) + "\n")
+
+        with open(requests_file, 'rb') as f:
+            input_file = self.client.files.create(file=f, purpose="batch")
+        batch = self.client.batches.create(
+            input_file_id=input_file.id,
+            endpoint="/v1/chat/completions",
+            completion_window="24h",
+            metadata={"job_id": job_id}
+        )
+
+        job = {
+            'id': job_id,
+            'batch_id': batch.id,
+            'owner': owner,
+            'status': batch.status,
+            'created_at': datetime.now().isoformat(),
+            'items': {item['custom_id']: dict(item, status='pending') for item in items}
+        }
+        self._save_job(job)
+        log_message(f"批量任务已提交: {job_id} ({len(items)} 个海报, batch={batch.id})", "SUCCESS")
+        return job
+
+    def wait(self, job):
+        """轮询批量任务直到结束；等待时间从提交时算起，重启后恢复的任务不会重新计时"""
+        deadline = datetime.fromisoformat(job['created_at']).timestamp() + self.max_wait
+        while True:
+            batch = self.client.batches.retrieve(job['batch_id'])
+            if batch.status != job['status']:
+                job['status'] = batch.status
+                self._save_job(job)
+                log_message(f"批量任务 {job['id']} 状态: {batch.status}", "INFO")
+            if batch.status in self.TERMINAL_STATUSES:
+                return batch
+            if time.time() > deadline:
+                raise Exception(f"批量任务等待超时: {job['id']}")
+            time.sleep(self.poll_interval)
+
+    def _read_file_lines(self, file_id):
+        if not file_id:
+            return []
+        content = self.client.files.content(file_id)
+        return [json.loads(line) for line in content.text.splitlines() if line.strip()]
+
+    def fetch_results(self, batch):
+        """下载输出文件和错误文件，返回 {custom_id: {'content': ...} 或 {'error': ...}}"""
+        results = {}
+        for record in self._read_file_lines(getattr(batch, 'output_file_id', None)):
+            response = record.get('response') or {}
+            body = response.get('body') or {}
+            if response.get('status_code') == 200 and body.get('choices'):
+                results[record['custom_id']] = {'content': body['choices'][0]['message']['content']}
+            else:
+                error = record.get('error') or body.get('error') or {'message': f"HTTP {response.get('status_code')}"}
+                results[record['custom_id']] = {'error': error.get('message', str(error))}
+        for record in self._read_file_lines(getattr(batch, 'error_file_id', None)):
+            error = record.get('error') or {}
+            results.setdefault(record['custom_id'], {'error': error.get('message', '批量请求失败')})
+        return results
+
+    def run(self, job, on_result):
+        """
+        等待批量任务完成并逐条编译
+
+        Args:
+            job (dict): submit 返回的任务
+            on_result (callable): on_result(item, result)，result 与 translate_poster_complete 返回格式相同
+        """
+        try:
+            batch = self.wait(job)
+            results = {}
+            if batch.status == 'completed' or batch.status in self.PARTIAL_STATUSES:
+                results = self.fetch_results(batch)
+                if batch.status in self.PARTIAL_STATUSES:
+                    log_message(f"批量任务 {job['id']} 已{batch.status}，处理已完成的 {len(results)} 条结果", "WARNING")
+        except Exception as e:
+            log_message(f"批量任务失败: {job['id']} - {str(e)}", "ERROR")
+            job['status'] = 'failed'
+            job['error'] = str(e)
+            results = {}
+
+        for custom_id, item in job['items'].items():
+            if item['status'] != 'pending':
+                # 重启前已经处理过的条目
+                continue
+            output = results.get(custom_id)
+            if not output:
+                result = {"success": False, "error": job.get('error') or f"批量任务未返回结果（{job['status']}）"}
+            elif 'error' in output:
+                result = {"success": False, "error": output['error']}
+            else:
+                try:
+                    latex_code = self.translator._extract_latex(output['content'])
+                    tex_filename = f"{item['output_base_name']}.tex"
+                    self.translator._save_latex(latex_code, tex_filename)
+                    result = self.translator.compile_generated_latex(
+                        latex_code, tex_filename, item['image_path'], build_key=item.get('build_key')
+                    )
+                except Exception as e:
+                    result = {"success": False, "error": str(e)}
+
+            try:
+                on_result(item, result)
+            except Exception as e:
+                log_message(f"批量结果处理失败: {custom_id} - {str(e)}", "ERROR")
+            item['status'] = 'completed' if result['success'] else 'failed'
+            item['error'] = result.get('error')
+            # 逐条保存，重启后不会重复处理已写回材料的条目
+            self._save_job(job)
+
+        if job['status'] == 'completed':
+            job['status'] = 'compiled'
+        job['finished_at'] = datetime.now().isoformat()
+        self._save_job(job)
+        with self.lock:
+            self.running.discard(job['id'])
+        log_message(f"批量任务处理完成: {job['id']}", "SUCCESS")
+
+    def _run_in_background(self, job, on_result):
+        with self.lock:
+            if job['id'] in self.running:
+                return False
+            self.running.add(job['id'])
+        threading.Thread(target=self.run, args=(job, on_result), name=f"poster-{job['id']}", daemon=True).start()
+        return True
+
+    def start(self, items, on_result, owner=None):
+        """提交并在后台线程中等待和编译，立即返回任务信息"""
+        job = self.submit(items, owner)
+        self._run_in_background(job, on_result)
+        return job
+
+    def resume_pending(self, on_result):
+        """服务启动时扫描任务目录，继续轮询和处理重启前尚未处理完的任务"""
+        if not self.client:
+            return 0
+        resumed = 0
+        for job_id in sorted(os.listdir(self.work_dir)):
+            job_file = os.path.join(self._job_dir(job_id), 'job.json')
+            if not os.path.exists(job_file):
+                continue
+            try:
+                with open(job_file, 'r', encoding='utf-8') as f:
+                    job = json.load(f)
+            except (OSError, ValueError) as e:
+                log_message(f"无法读取批量任务状态: {job_file} - {str(e)}", "WARNING")
+                continue
+            if job.get('finished_at'):
+                continue
+            with self.lock:
+                if job['id'] in self.running:
+                    continue
+                self.jobs[job['id']] = job
+            log_message(f"恢复批量任务: {job['id']} (batch={job['batch_id']}, 状态 {job['status']})", "INFO")
+            if self._run_in_background(job, on_result):
+                resumed += 1
+        return resumed
+
+# ========== 百度图片翻译类 ========== 
+
+class BaiduImageTranslator:
+    """百度图片翻译API封装类"""
+
+    def __init__(self, api_key=None, secret_key=None):
+        self.api_key = api_key or self._load_key_from_config('BAIDU_API_KEY')
+        self.secret_key = secret_key or self._load_key_from_config('BAIDU_SECRET_KEY')
+        self.access_token = None
+
+    def _load_key_from_config(self, key_name):
+        """从配置文件加载密钥（按照老后端的方式）"""
+        # 按照老后端的方式，从单独的文本文件读取
+        file_mapping = {
+            'BAIDU_API_KEY': 'config/baidu_api_key.txt',
+            'BAIDU_SECRET_KEY': 'config/baidu_secret_key.txt'
+        }
+        
+        file_path = file_mapping.get(key_name)
+        if file_path and os.path.exists(file_path):
+            try:
+                with open(file_path, 'r', encoding='utf-8') as f:
+                    key = f.read().strip()
+                    if key:
+                        log_message(f"✅ 成功从 {file_path} 加载密钥", "INFO")
+                        return key
+            except Exception as e:
+                log_message(f"⚠️ 警告: 无法从 {file_path} 读取密钥: {e}", "WARNING")
+        
+        # 如果文件读取失败，尝试从config.env读取
+        config_path = "config.env"
+        if os.path.exists(config_path):
+            try:
+                with open(config_path, 'r', encoding='utf-8') as f:
+                    for line in f:
+                        line = line.strip()
+                        if '=' in line and not line.startswith('#') and line:
+                            key, value = line.split('=', 1)
+                            if key.strip() == key_name:
+                                return value.strip()
+            except Exception:
+                pass
+        
+        return ''
 
     def log_status(self, message, level="INFO"):
         """状态日志"""
@@ -1418,71 +3480,1629 @@ class BaiduImageTranslator:
         }
         
         start_time = time.time()
-        
-        try:
-            # 调用翻译API
-            translation_result = self.call_image_translation_api(
-                image_path, from_lang, to_lang, paste_type=1 if save_image else 0
-            )
-            
-            if not translation_result:
-                result['error'] = '翻译API调用失败'
-                return result
-            
-            # 检查API响应（使用老前端的逻辑）
-            error_code = translation_result.get("error_code")
-            
-            # 按照老前端的成功判断逻辑
-            is_success = False
-            if error_code is None:
-                is_success = True  # 没有error_code字段，可能是成功
-            elif isinstance(error_code, str):
-                is_success = (error_code == "0" or error_code.lower() == "success")
-            elif isinstance(error_code, int):
-                is_success = (error_code == 0)
-            else:
-                # 尝试转换为整数比较
-                try:
-                    is_success = (int(error_code) == 0)
-                except (ValueError, TypeError):
-                    is_success = False
-            
-            if not is_success:
-                error_msg = translation_result.get("error_msg", "未知错误")
-                result['error'] = f"百度API错误 ({error_code}): {error_msg}"
-                self.log_status(f"API返回错误: code={error_code}, msg={error_msg}", "ERROR")
-                return result
-            
-            # 检查是否有数据（双重验证）
-            if not translation_result.get("data"):
-                result['error'] = "百度API未返回翻译数据"
-                self.log_status("API响应中缺少data字段", "ERROR")
-                return result
-            
-            self.log_status("百度API翻译成功", "SUCCESS")
-            
-            # 提取文本信息
-            result['text_info'] = self.extract_text_info(translation_result)
-            
-            # 保存翻译后的图片
-            if save_image and translation_result.get("data", {}).get("pasteImg"):
-                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                output_filename = f"translated_{timestamp}.jpg"
-                output_path = os.path.join('image_translation_output', output_filename)
-                
-                translated_image_path = self.save_translated_image(translation_result, output_path)
-                if translated_image_path:
-                    result['translated_image'] = translated_image_path
-            
-            result['success'] = True
-            result['processing_time'] = f"{time.time() - start_time:.2f}秒"
-            
-            return result
-            
-        except Exception as e:
-            result['error'] = f"翻译过程异常: {str(e)}"
-            result['processing_time'] = f"{time.time() - start_time:.2f}秒"
-            return result
+        
+        try:
+            # 调用翻译API
+            translation_result = self.call_image_translation_api(
+                image_path, from_lang, to_lang, paste_type=1 if save_image else 0
+            )
+            
+            if not translation_result:
+                result['error'] = '翻译API调用失败'
+                return result
+            
+            # 检查API响应（使用老前端的逻辑）
+            error_code = translation_result.get("error_code")
+            
+            # 按照老前端的成功判断逻辑
+            is_success = False
+            if error_code is None:
+                is_success = True  # 没有error_code字段，可能是成功
+            elif isinstance(error_code, str):
+                is_success = (error_code == "0" or error_code.lower() == "success")
+            elif isinstance(error_code, int):
+                is_success = (error_code == 0)
+            else:
+                # 尝试转换为整数比较
+                try:
+                    is_success = (int(error_code) == 0)
+                except (ValueError, TypeError):
+                    is_success = False
+            
+            if not is_success:
+                error_msg = translation_result.get("error_msg", "未知错误")
+                result['error'] = f"百度API错误 ({error_code}): {error_msg}"
+                self.log_status(f"API返回错误: code={error_code}, msg={error_msg}", "ERROR")
+                return result
+            
+            # 检查是否有数据（双重验证）
+            if not translation_result.get("data"):
+                result['error'] = "百度API未返回翻译数据"
+                self.log_status("API响应中缺少data字段", "ERROR")
+                return result
+            
+            self.log_status("百度API翻译成功", "SUCCESS")
+            
+            # 提取文本信息
+            result['text_info'] = self.extract_text_info(translation_result)
+            
+            # 保存翻译后的图片
+            if save_image and translation_result.get("data", {}).get("pasteImg"):
+                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+                output_filename = f"translated_{timestamp}.jpg"
+                output_path = os.path.join('image_translation_output', output_filename)
+                
+                translated_image_path = self.save_translated_image(translation_result, output_path)
+                if translated_image_path:
+                    result['translated_image'] = translated_image_path
+            
+            result['success'] = True
+            result['processing_time'] = f"{time.time() - start_time:.2f}秒"
+            
+            return result
+            
+        except Exception as e:
+            result['error'] = f"翻译过程异常: {str(e)}"
+            result['processing_time'] = f"{time.time() - start_time:.2f}秒"
+            return result
+
+# ========== 浏览器池 ==========
+
+# 按资源类型拦截请求：Network.setBlockedURLs 只支持URL通配符，按扩展名匹配。
+# Fetch.enable 可以按 resourceType 拦截，但被拦截的请求要逐个响应 Fetch.requestPaused 事件，
+# selenium 的 execute_cdp_cmd 收不到CDP事件，开启后页面会卡住，所以这里不使用。
+# 局限：没有扩展名的资源地址（如 /image?id=1、CDN动态裁剪的图片）无法按类型识别，会照常加载。
+RESOURCE_BLOCK_EXTENSIONS = {
+    'image': ('png', 'jpg', 'jpeg', 'gif', 'webp', 'avif', 'bmp', 'ico', 'svg'),
+    'media': ('mp4', 'webm', 'ogv', 'ogg', 'mp3', 'm4a', 'wav', 'flac', 'm3u8', 'mpd'),
+    'font': ('woff', 'woff2', 'ttf', 'otf', 'eot')
+}
+# 各流程拦截的资源类型：只取文本的流程不下载图片、媒体和字体，生成PDF快照的流程全部保留
+BROWSER_BLOCK_PROFILES = {
+    'text': os.getenv('BROWSER_BLOCK_TEXT', 'image,media,font'),
+    'snapshot': os.getenv('BROWSER_BLOCK_SNAPSHOT', '')
+}
+# 广告和统计域名，所有流程都拦截
+BROWSER_BLOCKED_DOMAINS = os.getenv('BROWSER_BLOCKED_DOMAINS') or (
+    'doubleclick.net,googlesyndication.com,googleadservices.com,google-analytics.com,googletagmanager.com,'
+    'facebook.net,hm.baidu.com,cnzz.com,scorecardresearch.com,hotjar.com,criteo.com,taboola.com,outbrain.com'
+)
+
+def build_block_patterns(profile):
+    """生成某个流程的 Network.setBlockedURLs URL模式列表"""
+    patterns = []
+    for resource_type in BROWSER_BLOCK_PROFILES.get(profile, '').split(','):
+        for ext in RESOURCE_BLOCK_EXTENSIONS.get(resource_type.strip(), ()):
+            # 通配符区分大小写，同时匹配大写扩展名（.JPG、.PNG）
+            for variant in (ext, ext.upper()):
+                patterns.extend([f'*.{variant}', f'*.{variant}?*'])
+    for domain in BROWSER_BLOCKED_DOMAINS.split(','):
+        domain = domain.strip()
+        if domain:
+            patterns.extend([f'*://{domain}/*', f'*://*.{domain}/*'])
+    return patterns
+
+class ChromePool:
+    """
+    共享的无头Chrome实例池
+
+    每次网页翻译都冷启动Chrome要花数秒CPU。池中保留已启动的浏览器供各个网页流程租用：
+    租出前做健康检查，每个实例打开 max_pages 个页面后回收重建，租用期间浏览器崩溃时
+    丢弃该实例，下次租用时重新创建。是否执行JavaScript和拦截哪些请求通过CDP按租用设置，
+    所有流程共用同一个池。
+    """
+
+    def __init__(self, size=None, max_pages=None, lease_timeout=None, page_load_timeout=None):
+        self.size = max(1, size or int(os.getenv('CHROME_POOL_SIZE', '2')))
+        self.max_pages = max_pages or int(os.getenv('CHROME_POOL_MAX_PAGES', '50'))
+        self.lease_timeout = lease_timeout or float(os.getenv('CHROME_POOL_LEASE_TIMEOUT', '120'))
+        self.page_load_timeout = page_load_timeout or int(os.getenv('CHROME_PAGE_LOAD_TIMEOUT', '30'))
+        self.slots = threading.BoundedSemaphore(self.size)
+        self.lock = threading.Lock()
+        self.idle = deque()
+        self.in_use = 0
+        self.leased = {}  # id(driver) -> 租用中的实例，count_page 按driver找到实例
+        self.closed = False
+        self.counters = {'created': 0, 'recycled': 0, 'crashed': 0, 'leases': 0, 'wait_seconds': 0.0}
+
+    def _build_options(self):
+        options = Options()
+        options.add_argument('--headless')
+        options.add_argument('--window-size=1280,800')
+        options.add_argument('--no-sandbox')
+        options.add_argument('--disable-setuid-sandbox')
+        options.add_argument('--disable-dev-shm-usage')
+        options.add_argument('--disable-gpu')
+        options.add_argument('--disable-extensions')
+        options.add_argument('--allow-file-access-from-files')
+        options.add_argument('--disable-features=TranslateUI')
+        # 记录CDP网络事件，用于判断页面网络空闲
+        options.set_capability('goog:loggingPrefs', {'performance': 'ALL'})
+        chrome_binary = os.getenv('CHROME_EXECUTABLE_PATH')
+        if chrome_binary:
+            options.binary_location = chrome_binary
+        return options
+
+    def _create(self):
+        """启动一个新的Chrome实例"""
+        start_time = time.time()
+        driver_path = os.getenv('CHROMEDRIVER_PATH')
+        if driver_path:
+            from selenium.webdriver.chrome.service import Service
+            driver = webdriver.Chrome(service=Service(executable_path=driver_path), options=self._build_options())
+        else:
+            driver = webdriver.Chrome(options=self._build_options())
+        driver.set_page_load_timeout(self.page_load_timeout)
+        with self.lock:
+            self.counters['created'] += 1
+        log_message(f"Chrome实例已启动，耗时 {time.time() - start_time:.2f} 秒", "DEBUG")
+        return {'driver': driver, 'pages': 0, 'created_at': time.time()}
+
+    @staticmethod
+    def _is_healthy(entry):
+        try:
+            entry['driver'].execute_script('return 1')
+            return True
+        except Exception:
+            return False
+
+    def _discard(self, entry, reason):
+        """关闭实例；reason 为 'recycled' 或 'crashed'"""
+        with self.lock:
+            self.counters[reason] += 1
+        if reason == 'crashed':
+            log_message(f"Chrome实例异常，已丢弃（已处理 {entry['pages']} 个页面）", "WARNING")
+        try:
+            entry['driver'].quit()
+        except Exception:
+            pass
+
+    def _take_entry(self):
+        """取出一个健康的空闲实例，没有时新建"""
+        while True:
+            with self.lock:
+                entry = self.idle.popleft() if self.idle else None
+            if entry is None:
+                return self._create()
+            if self._is_healthy(entry):
+                return entry
+            self._discard(entry, 'crashed')
+
+    def _reset(self, entry):
+        """归还前清理页面状态，避免影响下一次租用"""
+        driver = entry['driver']
+        handles = driver.window_handles
+        for handle in handles[1:]:
+            driver.switch_to.window(handle)
+            driver.close()
+        driver.switch_to.window(handles[0])
+        driver.execute_cdp_cmd('Emulation.setScriptExecutionDisabled', {'value': False})
+        driver.delete_all_cookies()
+        driver.set_page_load_timeout(self.page_load_timeout)
+        driver.get('about:blank')
+        # 丢弃本次租用残留的性能日志，避免影响下一次网络空闲判断
+        try:
+            driver.get_log('performance')
+        except Exception:
+            pass
+
+    def _return_entry(self, entry):
+        if self.closed or entry['pages'] >= self.max_pages:
+            self._discard(entry, 'recycled')
+            return
+        try:
+            self._reset(entry)
+        except Exception:
+            self._discard(entry, 'crashed')
+            return
+        with self.lock:
+            self.idle.append(entry)
+
+    @contextmanager
+    def lease(self, disable_js=False, block='snapshot'):
+        """
+        租用一个浏览器
+
+        Args:
+            disable_js (bool): 本次租用禁用JavaScript
+            block (str): 请求拦截配置，'text'（不加载图片/媒体/字体）或 'snapshot'（保留页面外观）
+
+        用法（每次加载页面后调用 count_page，实例按加载的页面数而不是租用次数回收）：
+            with chrome_pool.lease(disable_js=True, block='text') as driver:
+                driver.get(url)
+                chrome_pool.count_page(driver)
+        """
+        if not SELENIUM_AVAILABLE:
+            raise Exception("Selenium未安装，无法启动浏览器")
+        if self.closed:
+            raise Exception("浏览器池已关闭")
+
+        wait_start = time.time()
+        if not self.slots.acquire(timeout=self.lease_timeout):
+            raise Exception(f"浏览器池繁忙，等待 {self.lease_timeout:.0f} 秒后仍无可用实例")
+
+        entry = None
+        leased = False
+        try:
+            entry = self._take_entry()
+            driver_key = id(entry['driver'])
+            leased = True
+            with self.lock:
+                self.in_use += 1
+                self.counters['leases'] += 1
+                self.counters['wait_seconds'] += time.time() - wait_start
+            if disable_js:
+                entry['driver'].execute_cdp_cmd('Emulation.setScriptExecutionDisabled', {'value': True})
+            entry['driver'].execute_cdp_cmd('Network.enable', {})
+            entry['driver'].execute_cdp_cmd('Network.setBlockedURLs', {'urls': build_block_patterns(block)})
+            with self.lock:
+                self.leased[driver_key] = entry
+            yield entry['driver']
+        except Exception:
+            # 区分页面错误和浏览器崩溃：浏览器无响应时丢弃实例
+            if entry is not None and not self._is_healthy(entry):
+                self._discard(entry, 'crashed')
+                entry = None
+            raise
+        finally:
+            if entry is not None:
+                self._return_entry(entry)
+            if leased:
+                with self.lock:
+                    self.in_use -= 1
+                    self.leased.pop(driver_key, None)
+            self.slots.release()
+
+    def count_page(self, driver):
+        """记录租用中的浏览器加载了一个页面；同一次租用可以加载多个页面"""
+        with self.lock:
+            entry = self.leased.get(id(driver))
+            if entry is not None:
+                entry['pages'] += 1
+
+    def warm(self, count=None):
+        """预先启动实例放入空闲队列"""
+        count = min(self.size, count if count is not None else int(os.getenv('CHROME_POOL_WARM', '1')))
+        if not SELENIUM_AVAILABLE:
+            return
+        for _ in range(count):
+            if not self.slots.acquire(blocking=False):
+                break
+            try:
+                entry = self._create()
+                with self.lock:
+                    self.idle.append(entry)
+            except Exception as e:
+                log_message(f"预热Chrome实例失败: {str(e)}", "WARNING")
+                break
+            finally:
+                self.slots.release()
+
+    def warm_async(self, count=None):
+        threading.Thread(target=self.warm, args=(count,), name="chrome-pool-warm", daemon=True).start()
+
+    def close(self):
+        """关闭所有空闲实例；租用中的实例在归还时关闭"""
+        self.closed = True
+        with self.lock:
+            entries = list(self.idle)
+            self.idle.clear()
+        for entry in entries:
+            try:
+                entry['driver'].quit()
+            except Exception:
+                pass
+
+    def stats(self):
+        with self.lock:
+            leases = self.counters['leases']
+            return {
+                'size': self.size,
+                'max_pages': self.max_pages,
+                'idle': len(self.idle),
+                'in_use': self.in_use,
+                'created': self.counters['created'],
+                'recycled': self.counters['recycled'],
+                'crashed': self.counters['crashed'],
+                'leases': leases,
+                'avg_wait_seconds': round(self.counters['wait_seconds'] / leases, 3) if leases else 0.0
+            }
+
+chrome_pool = ChromePool()
+atexit.register(chrome_pool.close)
+
+# 页面就绪检测：替代固定的 sleep，快速页面只等待网络空闲窗口
+PAGE_READY_TIMEOUT = float(os.getenv('PAGE_READY_TIMEOUT', '15'))
+PAGE_NETWORK_IDLE_SECONDS = float(os.getenv('PAGE_NETWORK_IDLE_MS', '300')) / 1000
+# 允许保持进行中的长连接请求数（统计、长轮询等），与 networkidle2 的判定一致
+PAGE_IDLE_MAX_INFLIGHT = 2
+
+# Google翻译完成后会给 <html> 加上 translated-ltr / translated-rtl 类
+GOOGLE_TRANSLATE_DONE_JS = """
+var root = document.documentElement;
+return !!root && (root.classList.contains('translated-ltr') || root.classList.contains('translated-rtl'));
+"""
+
+def _drain_network_events(driver, inflight, totals=None):
+    """
+    读取性能日志中的CDP网络事件并更新进行中的请求集合，totals 累计下载字节数和被拦截的请求数
+
+    Returns:
+        bool: 是否有新的网络活动；性能日志不可用时返回 None
+    """
+    try:
+        entries = driver.get_log('performance')
+    except Exception:
+        return None
+
+    activity = False
+    for entry in entries:
+        try:
+            message = json.loads(entry['message'])['message']
+        except (KeyError, TypeError, ValueError):
+            continue
+        method = message.get('method', '')
+        params = message.get('params') or {}
+        if method == 'Network.requestWillBeSent':
+            if params.get('type') != 'EventSource':
+                inflight.add(params.get('requestId'))
+            activity = True
+        elif method in ('Network.loadingFinished', 'Network.loadingFailed'):
+            inflight.discard(params.get('requestId'))
+            activity = True
+            if totals is not None:
+                if method == 'Network.loadingFinished':
+                    totals['bytes'] += int(params.get('encodedDataLength') or 0)
+                elif params.get('blockedReason'):
+                    totals['blocked'] += 1
+    return activity
+
+def wait_for_page_ready(driver, timeout=None, google_translate=False, idle_seconds=None):
+    """
+    等待页面就绪，超过 timeout 秒后不再等待
+
+    就绪条件：document.readyState 为 complete；网络空闲（CDP网络事件显示进行中的请求
+    不超过 PAGE_IDLE_MAX_INFLIGHT 个，且 idle_seconds 内没有新活动）；Google翻译代理页
+    还需要出现翻译完成标记。性能日志不可用时用 Resource Timing 条目数判断网络活动。
+
+    Returns:
+        dict: {'ready': bool, 'waited': 等待秒数, 'pending': 未满足的条件,
+               'bytes': 下载字节数, 'blocked': 被拦截的请求数}（后两项依赖性能日志）
+    """
+    timeout = PAGE_READY_TIMEOUT if timeout is None else timeout
+    idle_seconds = PAGE_NETWORK_IDLE_SECONDS if idle_seconds is None else idle_seconds
+    start_time = time.time()
+    last_activity = start_time
+    inflight = set()
+    totals = {'bytes': 0, 'blocked': 0}
+    resource_count = None
+
+    while True:
+        now = time.time()
+        pending = []
+        try:
+            if driver.execute_script('return document.readyState') != 'complete':
+                pending.append('document')
+            if google_translate and not driver.execute_script(GOOGLE_TRANSLATE_DONE_JS):
+                pending.append('translation')
+            activity = _drain_network_events(driver, inflight, totals)
+            if activity is None:
+                count = driver.execute_script("return performance.getEntriesByType('resource').length")
+                activity = count != resource_count
+                resource_count = count
+        except Exception:
+            # 页面跳转过程中脚本可能执行失败，视为未就绪
+            pending.append('document')
+            activity = True
+
+        if activity:
+            last_activity = now
+        if len(inflight) > PAGE_IDLE_MAX_INFLIGHT or now - last_activity < idle_seconds:
+            pending.append('network')
+
+        waited = round(now - start_time, 3)
+        if not pending:
+            log_message(f"页面就绪，等待 {waited} 秒，下载 {totals['bytes'] // 1024} KB，拦截 {totals['blocked']} 个请求", "DEBUG")
+            return dict(totals, ready=True, waited=waited, pending=[])
+        if now - start_time >= timeout:
+            log_message(f"页面在 {timeout:.0f} 秒内未就绪（{', '.join(pending)}），继续处理", "WARNING")
+            return dict(totals, ready=False, waited=waited, pending=pending)
+        time.sleep(0.05)
+
+# ========== 网页抓取缓存 ==========
+
+class WebFetchCache:
+    """
+    网页抓取的持久化HTTP缓存
+
+    每个URL的元数据（保留的响应头、ETag/Last-Modified、新鲜期和历次抓取记录）保存为
+    <URL哈希>.json，响应正文按内容哈希保存在 captures/ 目录，同一内容只存一份。
+    遵循 Cache-Control：no-store 不缓存；no-cache/private 每次都重新验证；
+    max-age/s-maxage/Expires 有效期内直接使用本地正文；过期后带 If-None-Match /
+    If-Modified-Since 请求源站，304 时复用本地正文。源站出错时返回过期的缓存（must-revalidate 除外）。
+
+    回放模式（replay）只读存档、不访问源站，可以用 capture_id 指定某次抓取，
+    按当时的原始字节重新翻译。
+    """
+
+    STORED_HEADERS = ('content-type', 'content-language', 'cache-control', 'expires',
+                      'etag', 'last-modified', 'date', 'age')
+    MODES = ('normal', 'replay', 'off')
+
+    def __init__(self, cache_dir=None, max_bytes=None, max_captures=None, heuristic_max=None, mode=None):
+        self.cache_dir = os.path.abspath(cache_dir or os.getenv('WEB_CACHE_DIR', 'web_fetch_cache'))
+        self.capture_dir = os.path.join(self.cache_dir, 'captures')
+        self.max_bytes = max_bytes or int(os.getenv('WEB_CACHE_MAX_MB', '512')) * 1024 * 1024
+        self.max_captures = max_captures or int(os.getenv('WEB_CACHE_MAX_CAPTURES', '5'))
+        # 响应没有明确有效期时，按 Last-Modified 推算的启发式新鲜期上限（秒）
+        self.heuristic_max = heuristic_max if heuristic_max is not None else int(os.getenv('WEB_CACHE_HEURISTIC_MAX', '3600'))
+        self.mode = (mode or os.getenv('WEB_CACHE_MODE', 'normal')).lower()
+        if self.mode not in self.MODES:
+            log_message(f"未知的 WEB_CACHE_MODE={self.mode}，使用 normal", "WARNING")
+            self.mode = 'normal'
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.capture_refs = {}
+        self.total_bytes = 0
+        self.counters = {'hits': 0, 'revalidated': 0, 'misses': 0, 'stale': 0,
+                         'replays': 0, 'bypassed': 0, 'evictions': 0}
+        os.makedirs(self.capture_dir, exist_ok=True)
+        self._load_index()
+
+    def _load_index(self):
+        """按元数据文件的修改时间恢复LRU顺序，并清理没有被引用的正文"""
+        metas = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith('.json'):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    metas.append((os.stat(path).st_mtime, name[:-5], json.load(f)))
+            except (OSError, ValueError):
+                log_message(f"跳过损坏的网页缓存元数据: {name}", "WARNING")
+        for _, key, meta in sorted(metas, key=lambda item: item[0]):
+            captures = [c for c in meta.get('captures', []) if os.path.exists(self._capture_path(c['capture_id']))]
+            if not captures:
+                continue
+            meta['captures'] = captures
+            self.entries[key] = meta
+            for capture in captures:
+                self._add_ref(capture['capture_id'], capture['size'])
+        for name in os.listdir(self.capture_dir):
+            if name.endswith('.body') and name[:-5] not in self.capture_refs:
+                try:
+                    os.remove(os.path.join(self.capture_dir, name))
+                except OSError:
+                    pass
+
+    @staticmethod
+    def _url_key(url):
+        return hashlib.sha256(url.encode('utf-8')).hexdigest()
+
+    def _capture_path(self, capture_id):
+        return os.path.join(self.capture_dir, f"{capture_id}.body")
+
+    def _meta_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def _add_ref(self, capture_id, size):
+        ref = self.capture_refs.setdefault(capture_id, [size, 0])
+        if ref[1] == 0:
+            self.total_bytes += size
+        ref[1] += 1
+
+    def _release_ref(self, capture_id):
+        ref = self.capture_refs.get(capture_id)
+        if not ref:
+            return
+        ref[1] -= 1
+        if ref[1] <= 0:
+            self.total_bytes -= ref[0]
+            del self.capture_refs[capture_id]
+            try:
+                os.remove(self._capture_path(capture_id))
+            except OSError:
+                pass
+
+    def _write_meta(self, key, meta):
+        tmp_path = os.path.join(self.cache_dir, f".{key}.{uuid.uuid4().hex}.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(tmp_path, self._meta_path(key))
+
+    @staticmethod
+    def parse_cache_control(value):
+        """解析 Cache-Control 头，返回 {指令: 参数}"""
+        directives = {}
+        for part in (value or '').split(','):
+            name, _, argument = part.strip().partition('=')
+            if name:
+                directives[name.strip().lower()] = argument.strip().strip('"')
+        return directives
+
+    @staticmethod
+    def _http_date(value):
+        try:
+            return parsedate_to_datetime(value).timestamp() if value else None
+        except (TypeError, ValueError, IndexError, OverflowError):
+            return None
+
+    def _fresh_until(self, headers, stored_at):
+        """按 RFC 9111 计算响应在本地保持新鲜的截止时间"""
+        directives = self.parse_cache_control(headers.get('cache-control'))
+        if 'no-cache' in directives or 'private' in directives:
+            # private 响应只对单个用户有效，本服务在多个客户之间共享缓存，因此每次都要重新验证
+            return 0
+        response_date = self._http_date(headers.get('date')) or stored_at
+        lifetime = 0
+        if 's-maxage' in directives or 'max-age' in directives:
+            try:
+                lifetime = int(directives.get('s-maxage', directives.get('max-age')))
+            except ValueError:
+                lifetime = 0
+        elif headers.get('expires') is not None:
+            expires = self._http_date(headers.get('expires'))
+            lifetime = expires - response_date if expires else 0
+        elif headers.get('last-modified'):
+            last_modified = self._http_date(headers.get('last-modified'))
+            if last_modified:
+                lifetime = min(self.heuristic_max, (response_date - last_modified) * 0.1)
+        try:
+            age = int(headers.get('age') or 0)
+        except ValueError:
+            age = 0
+        return stored_at + max(0, lifetime - age)
+
+    def _read_capture(self, capture_id):
+        with open(self._capture_path(capture_id), 'rb') as f:
+            return f.read()
+
+    def _touch(self, key, counter):
+        with self.lock:
+            self.counters[counter] += 1
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                try:
+                    os.utime(self._meta_path(key), None)
+                except OSError:
+                    pass
+
+    @staticmethod
+    def _result(meta, content, status, capture_id):
+        capture = next((c for c in meta['captures'] if c['capture_id'] == capture_id), {})
+        return {
+            'content': content,
+            'url': meta['url'],
+            'final_url': meta.get('final_url', meta['url']),
+            'status_code': meta.get('status_code', 200),
+            'headers': dict(meta.get('headers', {})),
+            'cache': status,
+            'capture_id': capture_id,
+            'fetched_at': capture.get('fetched_at')
+        }
+
+    def _store(self, key, url, response, content, fetch_seconds=None):
+        """保存一次完整响应，返回元数据；no-store 或 Vary: * 的响应不缓存"""
+        headers = {name: response.headers[name] for name in self.STORED_HEADERS if name in response.headers}
+        if 'no-store' in self.parse_cache_control(headers.get('cache-control')) \
+                or response.headers.get('vary', '').strip() == '*':
+            return None
+
+        capture_id = hashlib.sha256(content).hexdigest()
+        capture_path = self._capture_path(capture_id)
+        if not os.path.exists(capture_path):
+            tmp_path = os.path.join(self.capture_dir, f".{capture_id}.{uuid.uuid4().hex}.tmp")
+            with open(tmp_path, 'wb') as f:
+                f.write(content)
+            os.replace(tmp_path, capture_path)
+
+        now = time.time()
+        with self.lock:
+            old = self.entries.pop(key, None)
+            old_captures = old['captures'] if old else []
+            captures = [c for c in old_captures if c['capture_id'] != capture_id]
+            captures.append({'capture_id': capture_id, 'fetched_at': now, 'size': len(content),
+                             'fetch_seconds': fetch_seconds})
+            captures = captures[-self.max_captures:]
+            # 先登记保留的抓取再释放旧引用，避免仍在使用的正文被删除
+            for capture in captures:
+                self._add_ref(capture['capture_id'], capture['size'])
+            for capture in old_captures:
+                self._release_ref(capture['capture_id'])
+            meta = {
+                'url': url,
+                'final_url': response.url or url,
+                'status_code': response.status_code,
+                'headers': headers,
+                'etag': headers.get('etag'),
+                'last_modified': headers.get('last-modified'),
+                'stored_at': now,
+                'fresh_until': self._fresh_until(headers, now),
+                'capture_id': capture_id,
+                'captures': captures
+            }
+            self.entries[key] = meta
+            self._write_meta(key, meta)
+            while len(self.entries) > 1 and self.total_bytes > self.max_bytes:
+                old_key, old_meta = self.entries.popitem(last=False)
+                for capture in old_meta['captures']:
+                    self._release_ref(capture['capture_id'])
+                try:
+                    os.remove(self._meta_path(old_key))
+                except OSError:
+                    pass
+                self.counters['evictions'] += 1
+        return meta
+
+    def _refresh(self, key, response):
+        """304 响应：合并新的响应头并重新计算新鲜期，正文保持不变"""
+        with self.lock:
+            meta = self.entries.get(key)
+            if meta is None:
+                return None
+            for name in self.STORED_HEADERS:
+                if name in response.headers:
+                    meta['headers'][name] = response.headers[name]
+            meta['etag'] = meta['headers'].get('etag')
+            meta['last_modified'] = meta['headers'].get('last-modified')
+            meta['stored_at'] = time.time()
+            meta['fresh_until'] = self._fresh_until(meta['headers'], meta['stored_at'])
+            self.entries.move_to_end(key)
+            self._write_meta(key, meta)
+            return json.loads(json.dumps(meta))
+
+    def fetch(self, url, headers=None, timeout=30, replay=False, capture_id=None):
+        """
+        获取网页，优先使用缓存
+
+        Args:
+            url (str): 网页地址
+            headers (dict): 额外的请求头
+            timeout (int): 请求超时（秒）
+            replay (bool): 只从存档读取，不访问源站
+            capture_id (str): 回放指定的某次抓取（正文的sha256）
+
+        Returns:
+            dict: {'content', 'url', 'final_url', 'status_code', 'headers', 'cache', 'capture_id', 'fetched_at'}
+                  cache 为 hit / revalidated / miss / stale / replay / bypass
+
+        Raises:
+            LookupError: 回放模式下没有对应的存档
+            requests.RequestException: 源站请求失败且没有可用的缓存
+        """
+        key = self._url_key(url)
+        with self.lock:
+            meta = json.loads(json.dumps(self.entries[key])) if key in self.entries else None
+
+        if replay or capture_id or self.mode == 'replay':
+            if meta is None:
+                raise LookupError(f"缓存中没有该网址的存档: {url}")
+            capture_id = capture_id or meta['capture_id']
+            if capture_id not in [c['capture_id'] for c in meta['captures']]:
+                raise LookupError(f"缓存中没有抓取记录 {capture_id}: {url}")
+            content = self._read_capture(capture_id)
+            self._touch(key, 'replays')
+            log_message(f"回放网页存档 {capture_id[:12]}: {url}", "INFO")
+            return self._result(meta, content, 'replay', capture_id)
+
+        if self.mode == 'off':
+            response = requests.get(url, headers=headers, timeout=timeout)
+            response.raise_for_status()
+            with self.lock:
+                self.counters['bypassed'] += 1
+            return {'content': response.content, 'url': url, 'final_url': response.url or url,
+                    'status_code': response.status_code, 'headers': dict(response.headers),
+                    'cache': 'bypass', 'capture_id': None, 'fetched_at': time.time()}
+
+        cached_content = None
+        if meta is not None:
+            try:
+                cached_content = self._read_capture(meta['capture_id'])
+            except OSError:
+                meta = None
+
+        if meta is not None and time.time() < meta['fresh_until']:
+            self._touch(key, 'hits')
+            return self._result(meta, cached_content, 'hit', meta['capture_id'])
+
+        request_headers = dict(headers or {})
+        if meta is not None:
+            if meta.get('etag'):
+                request_headers['If-None-Match'] = meta['etag']
+            if meta.get('last_modified'):
+                request_headers['If-Modified-Since'] = meta['last_modified']
+
+        try:
+            request_started = time.time()
+            response = requests.get(url, headers=request_headers, timeout=timeout)
+            if response.status_code == 304 and meta is not None:
+                meta = self._refresh(key, response) or meta
+                self._touch(key, 'revalidated')
+                return self._result(meta, cached_content, 'revalidated', meta['capture_id'])
+            response.raise_for_status()
+        except requests.RequestException as e:
+            directives = self.parse_cache_control(meta['headers'].get('cache-control')) if meta else {}
+            if meta is None or 'must-revalidate' in directives or 'proxy-revalidate' in directives:
+                raise
+            log_message(f"源站请求失败，使用过期的网页缓存: {url} ({str(e)})", "WARNING")
+            self._touch(key, 'stale')
+            return self._result(meta, cached_content, 'stale', meta['capture_id'])
+
+        content = response.content
+        with self.lock:
+            self.counters['misses'] += 1
+        stored = self._store(key, url, response, content, round(time.time() - request_started, 3))
+        if stored is None:
+            return {'content': content, 'url': url, 'final_url': response.url or url,
+                    'status_code': response.status_code, 'headers': dict(response.headers),
+                    'cache': 'miss', 'capture_id': None, 'fetched_at': time.time()}
+        return self._result(stored, content, 'miss', stored['capture_id'])
+
+    def captures(self, url):
+        """列出某个网址保存的历次抓取，供回放时选择 capture_id"""
+        with self.lock:
+            meta = self.entries.get(self._url_key(url))
+            return [dict(c) for c in meta['captures']] if meta else []
+
+    def stats(self):
+        with self.lock:
+            lookups = self.counters['hits'] + self.counters['revalidated'] + self.counters['misses']
+            return {
+                'mode': self.mode,
+                'entries': len(self.entries),
+                'captures': len(self.capture_refs),
+                'total_bytes': self.total_bytes,
+                'max_bytes': self.max_bytes,
+                **self.counters,
+                'hit_rate': round((self.counters['hits'] + self.counters['revalidated']) / lookups, 4) if lookups else 0.0
+            }
+
+web_fetch_cache = WebFetchCache()
+
+# ========== 网页正文提取 ==========
+
+class _TextCollector:
+    """lxml 解析器的 target：只收集文本节点，跳过 script/style 内部和注释，不构建DOM树"""
+
+    def __init__(self, skip_tags):
+        self.skip_tags = skip_tags
+        self.skip_depth = 0
+        self.parts = []
+
+    def start(self, tag, attrib):
+        if tag in self.skip_tags:
+            self.skip_depth += 1
+
+    def end(self, tag):
+        if tag in self.skip_tags and self.skip_depth:
+            self.skip_depth -= 1
+
+    def data(self, data):
+        if not self.skip_depth:
+            self.parts.append(data)
+
+    def comment(self, text):
+        pass
+
+    def close(self):
+        return self.parts
+
+class _StdlibEventParser(HTMLParser):
+    """把标准库 html.parser 的回调转换为与 lxml target 相同的 start/end/data 事件"""
+
+    VOID_TAGS = frozenset(('area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link',
+                           'meta', 'param', 'source', 'track', 'wbr'))
+
+    def __init__(self, target):
+        super().__init__(convert_charrefs=True)
+        self.target = target
+
+    def handle_starttag(self, tag, attrs):
+        self.target.start(tag, dict(attrs))
+        if tag in self.VOID_TAGS:
+            self.target.end(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        self.target.start(tag, dict(attrs))
+        self.target.end(tag)
+
+    def handle_endtag(self, tag):
+        if tag not in self.VOID_TAGS:
+            self.target.end(tag)
+
+    def handle_data(self, data):
+        self.target.data(data)
+
+    def close(self):
+        super().close()
+        return self.target.close()
+
+class _Block:
+    """正文提取用的轻量节点：标签名、class/id 提示和子节点（文本节点为 str）"""
+
+    __slots__ = ('tag', 'hint', 'parent', 'children', 'dropped', 'text_len', 'link_len', 'commas', 'score')
+
+    def __init__(self, tag, hint, parent, dropped=False):
+        self.tag = tag
+        self.hint = hint
+        self.parent = parent
+        self.children = []
+        self.dropped = dropped
+        self.text_len = self.link_len = self.commas = 0
+        self.score = None
+
+class _BlockTreeBuilder:
+    """
+    把解析事件构建成 _Block 树（作为 lxml target 或由 _StdlibEventParser 驱动）
+
+    script/style 的内容直接跳过；导航、页脚、广告等子树仍然建节点但标记为 dropped，
+    这样整页文本不受影响，标签未闭合时的栈处理也和其他节点一致。
+    """
+
+    # 标准库解析器不会补全这些标签的结束标签，遇到同名标签时先关闭前一个
+    AUTO_CLOSE_TAGS = frozenset(('p', 'li', 'td', 'th', 'tr', 'dt', 'dd', 'option'))
+
+    def __init__(self, extractor):
+        self.extractor = extractor
+        self.root = _Block('#root', '', None)
+        self.stack = [self.root]
+        self.skip_depth = 0
+        self.title = None
+
+    def start(self, tag, attrib):
+        if tag in self.extractor.SKIP_TAGS:
+            self.skip_depth += 1
+            return
+        if self.skip_depth:
+            return
+        parent = self.stack[-1]
+        if parent.tag == tag and tag in self.AUTO_CLOSE_TAGS:
+            self.stack.pop()
+            parent = self.stack[-1]
+        hint = f"{attrib.get('class') or ''} {attrib.get('id') or ''}".lower()
+        node = _Block(tag, hint, parent, parent.dropped or self.extractor.is_unlikely(tag, hint, attrib))
+        parent.children.append(node)
+        if tag == 'title' and self.title is None:
+            self.title = node
+        if tag not in _StdlibEventParser.VOID_TAGS:
+            self.stack.append(node)
+
+    def end(self, tag):
+        if tag in self.extractor.SKIP_TAGS and self.skip_depth:
+            self.skip_depth -= 1
+            return
+        if self.skip_depth:
+            return
+        for index in range(len(self.stack) - 1, 0, -1):
+            if self.stack[index].tag == tag:
+                del self.stack[index:]
+                return
+
+    def data(self, data):
+        if not self.skip_depth:
+            self.stack[-1].children.append(data)
+
+    def comment(self, text):
+        pass
+
+    def close(self):
+        return self.root
+
+class HTMLTextExtractor:
+    """
+    从网页HTML中提取文本，解析后端可替换
+
+    - lxml：libxml2（C实现）解析，通过 target 回调边解析边收集文本，不构建DOM树
+    - stdlib：标准库 html.parser 流式解析，同样不建树，未安装lxml时使用
+    - bs4：原来的 BeautifulSoup 建树 + decompose + get_text 实现，用于对照
+
+    各后端都跳过 script/style 子树和注释，输出为按行去除首尾空白、删除空行后的文本。
+
+    extract_main 在此基础上只保留正文：参考 Readability 的做法，先去掉导航、页脚、侧栏、
+    Cookie 提示等子树，再按段落的长度和逗号数给祖先块打分，乘以(1-链接文本占比)后取最高分的块，
+    并带上得分接近的相邻块。找不到足够长的正文时退回整页文本。
+    """
+
+    SKIP_TAGS = frozenset(('script', 'style'))
+    BACKENDS = ('lxml', 'stdlib', 'bs4')
+
+    # 正文提取时整棵子树丢弃的标签和 role
+    DROP_TAGS = frozenset(('nav', 'footer', 'aside', 'form', 'button', 'select', 'iframe', 'svg',
+                           'noscript', 'template', 'dialog', 'menu'))
+    DROP_ROLES = frozenset(('navigation', 'banner', 'contentinfo', 'complementary', 'dialog',
+                            'alertdialog', 'menu', 'menubar', 'search'))
+    UNLIKELY_PATTERN = re.compile(
+        r'-ad-|banner|breadcrumb|combx|comment|community|cookie|consent|disqus|extra|footer|gdpr|header|'
+        r'legends|menu|modal|newsletter|pagination|pager|popup|related|remark|replies|rss|share|shoutbox|'
+        r'sidebar|skyscraper|social|sponsor|subscribe|supplemental|toolbar'
+    )
+    MAYBE_CANDIDATE_PATTERN = re.compile(r'and|article|body|column|content|main|shadow')
+    POSITIVE_PATTERN = re.compile(r'article|body|content|entry|hentry|h-entry|main|page|post|text|blog|story|zhengwen')
+    NEGATIVE_PATTERN = re.compile(
+        r'-ad-|hidden|banner|combx|comment|com-|contact|foot|footnote|gdpr|masthead|media|meta|outbrain|'
+        r'promo|related|scroll|share|shoutbox|sidebar|skyscraper|sponsor|shopping|tags|tool|widget'
+    )
+    BLOCK_TAGS = frozenset(('address', 'article', 'aside', 'blockquote', 'dd', 'div', 'dl', 'dt', 'fieldset',
+                            'figure', 'footer', 'form', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'header', 'hr',
+                            'li', 'main', 'nav', 'ol', 'p', 'pre', 'section', 'table', 'ul'))
+    LINE_BREAK_TAGS = frozenset(('br', 'tr', 'td', 'th', 'caption', 'figcaption'))
+    PARAGRAPH_TAGS = frozenset(('p', 'pre', 'td', 'blockquote'))
+    TAG_WEIGHTS = {'div': 5, 'article': 5, 'main': 5, 'pre': 3, 'td': 3, 'blockquote': 3,
+                   'address': -3, 'ol': -3, 'ul': -3, 'dl': -3, 'dd': -3, 'dt': -3, 'li': -3, 'form': -3,
+                   'h1': -5, 'h2': -5, 'h3': -5, 'h4': -5, 'h5': -5, 'h6': -5, 'th': -5}
+    META_CHARSET_PATTERN = re.compile(rb'<meta[^>]+charset\s*=\s*["\']?\s*([A-Za-z0-9_.:-]+)', re.IGNORECASE)
+    # 按HTML规范，网页声明的这些编码实际应按其超集解码
+    ENCODING_ALIASES = {'gb2312': 'gb18030', 'gbk': 'gb18030', 'iso-8859-1': 'windows-1252',
+                        'latin1': 'windows-1252', 'latin-1': 'windows-1252', 'ascii': 'windows-1252',
+                        'us-ascii': 'windows-1252'}
+
+    def __init__(self, backend=None):
+        backend = (backend or os.getenv('HTML_EXTRACT_BACKEND', 'auto')).lower()
+        if backend == 'auto':
+            backend = 'lxml' if LXML_AVAILABLE else 'stdlib'
+        elif backend not in self.BACKENDS:
+            log_message(f"未知的网页正文提取后端 {backend}，使用 stdlib", "WARNING")
+            backend = 'stdlib'
+        elif backend == 'lxml' and not LXML_AVAILABLE:
+            log_message("未安装lxml，网页正文提取使用 stdlib 后端", "WARNING")
+            backend = 'stdlib'
+        self.backend = backend
+        # 正文少于这么多字符时认为提取失败，退回整页
+        self.main_min_chars = int(os.getenv('WEBPAGE_MAIN_MIN_CHARS', '200'))
+
+    @classmethod
+    def decode(cls, content, content_type=None):
+        """按 BOM、Content-Type、<meta charset> 的顺序确定编码，都没有时依次尝试 UTF-8 和 Windows-1252"""
+        if isinstance(content, str):
+            return content
+        for bom, encoding in ((codecs.BOM_UTF8, 'utf-8-sig'), (codecs.BOM_UTF16_LE, 'utf-16'),
+                              (codecs.BOM_UTF16_BE, 'utf-16')):
+            if content.startswith(bom):
+                return content.decode(encoding, errors='replace')
+
+        candidates = []
+        header_match = re.search(r'charset\s*=\s*["\']?([A-Za-z0-9_.:-]+)', content_type or '', re.IGNORECASE)
+        if header_match:
+            candidates.append(header_match.group(1))
+        meta_match = cls.META_CHARSET_PATTERN.search(content[:4096])
+        if meta_match:
+            candidates.append(meta_match.group(1).decode('ascii'))
+        candidates += ['utf-8', 'windows-1252']
+
+        for encoding in candidates:
+            encoding = cls.ENCODING_ALIASES.get(encoding.lower(), encoding)
+            try:
+                return content.decode(encoding)
+            except (LookupError, UnicodeDecodeError):
+                continue
+        return content.decode('utf-8', errors='replace')
+
+    def _extract_lxml(self, html):
+        collector = _TextCollector(self.SKIP_TAGS)
+        parser = lxml_etree.HTMLParser(target=collector)
+        parser.feed(html)
+        return parser.close()
+
+    def _extract_stdlib(self, html):
+        parser = _StdlibEventParser(_TextCollector(self.SKIP_TAGS))
+        parser.feed(html)
+        return parser.close()
+
+    def _extract_bs4(self, html):
+        soup = BeautifulSoup(html, 'html.parser')
+        for element in soup(list(self.SKIP_TAGS)):
+            element.decompose()
+        return [soup.get_text()]
+
+    @staticmethod
+    def _clean_lines(text):
+        return '\n'.join(line.strip() for line in text.splitlines() if line.strip())
+
+    @classmethod
+    def is_unlikely(cls, tag, hint, attrib):
+        """判断一个子树是否明显不是正文（导航、页脚、广告、隐藏元素等）"""
+        if tag in cls.DROP_TAGS or (attrib.get('role') or '').lower() in cls.DROP_ROLES:
+            return True
+        if 'hidden' in attrib or (attrib.get('aria-hidden') or '').lower() == 'true':
+            return True
+        return (tag not in ('body', 'main', 'article', 'a')
+                and bool(cls.UNLIKELY_PATTERN.search(hint))
+                and not cls.MAYBE_CANDIDATE_PATTERN.search(hint))
+
+    @classmethod
+    def _text_of(cls, node, skip_dropped=False, block_breaks=False):
+        """
+        按文档顺序拼接子树中的文本（迭代遍历，避免深层嵌套时递归过深）
+
+        block_breaks 为True时在块级元素和 <br> 前后换行，使每个段落单独成行
+        """
+        parts = []
+        stack = [(iter(node.children), False)]
+        while stack:
+            for child in stack[-1][0]:
+                if isinstance(child, str):
+                    parts.append(child)
+                elif not (skip_dropped and child.dropped):
+                    is_break = block_breaks and (child.tag in cls.BLOCK_TAGS or child.tag in cls.LINE_BREAK_TAGS)
+                    if is_break:
+                        parts.append('\n')
+                    stack.append((iter(child.children), is_break))
+                    break
+            else:
+                if stack.pop()[1]:
+                    parts.append('\n')
+        return ''.join(parts)
+
+    def _build_tree(self, html):
+        builder = _BlockTreeBuilder(self)
+        if self.backend == 'lxml':
+            parser = lxml_etree.HTMLParser(target=builder)
+        else:
+            parser = _StdlibEventParser(builder)
+        parser.feed(html)
+        parser.close()
+        return builder
+
+    def _score_blocks(self, root):
+        """统计每个节点的文本长度、链接文本长度和逗号数，并给正文候选块打分"""
+        order = []
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            order.append(node)
+            stack.extend(child for child in node.children if not isinstance(child, str) and not child.dropped)
+
+        # 逆先序遍历保证子节点先于父节点统计
+        for node in reversed(order):
+            text_len = commas = link_len = 0
+            for child in node.children:
+                if isinstance(child, str):
+                    text_len += len(child.strip())
+                    commas += child.count(',') + child.count('，') + child.count('、')
+                elif not child.dropped:
+                    text_len += child.text_len
+                    commas += child.commas
+                    link_len += child.link_len
+            node.text_len, node.commas = text_len, commas
+            node.link_len = text_len if node.tag == 'a' else link_len
+
+        candidates = []
+        for node in order:
+            if node.text_len < 25:
+                continue
+            if node.tag not in self.PARAGRAPH_TAGS and not (
+                    node.tag in ('div', 'section') and not any(
+                        not isinstance(child, str) and child.tag in self.BLOCK_TAGS for child in node.children)):
+                continue
+            content_score = 1 + node.commas + min(node.text_len // 100, 3)
+            ancestor, level = node.parent, 0
+            while ancestor is not None and ancestor is not root and level < 5:
+                if ancestor.score is None:
+                    ancestor.score = float(self.TAG_WEIGHTS.get(ancestor.tag, 0))
+                    if self.POSITIVE_PATTERN.search(ancestor.hint):
+                        ancestor.score += 25
+                    if self.NEGATIVE_PATTERN.search(ancestor.hint):
+                        ancestor.score -= 25
+                    candidates.append(ancestor)
+                ancestor.score += content_score / (1 if level == 0 else 2 if level == 1 else level * 3)
+                ancestor, level = ancestor.parent, level + 1
+
+        for node in candidates:
+            node.score *= 1 - (node.link_len / node.text_len if node.text_len else 0)
+        return candidates
+
+    def _select_main_blocks(self, top):
+        """最高分的块加上得分接近的兄弟块，以及看起来像正文段落的兄弟 <p>"""
+        if top.parent is None:
+            return [top]
+        threshold = max(10, top.score * 0.2)
+        blocks = []
+        for sibling in top.parent.children:
+            if isinstance(sibling, str) or sibling.dropped:
+                continue
+            if sibling is top or (sibling.score is not None and sibling.score >= threshold):
+                blocks.append(sibling)
+            elif sibling.tag == 'p' and sibling.text_len:
+                density = sibling.link_len / sibling.text_len
+                if sibling.text_len > 80 and density < 0.25:
+                    blocks.append(sibling)
+                elif density == 0 and re.search(r'[.。!?！？]\s*$', self._text_of(sibling)):
+                    blocks.append(sibling)
+        return blocks
+
+    def extract_main(self, content, content_type=None):
+        """
+        提取网页正文
+
+        Returns:
+            dict: {'text': 要翻译的文本, 'full_text': 整页文本, 'mode': 'main'/'full', 'fallback_reason'}
+                  mode 为 full 表示没有找到足够长的正文，text 退回整页文本
+        """
+        html = self.decode(content, content_type)
+        if not html.strip():
+            return {'text': '', 'full_text': '', 'mode': 'full', 'fallback_reason': '网页内容为空'}
+
+        builder = self._build_tree(html)
+        full_text = self._clean_lines(self._text_of(builder.root))
+        candidates = self._score_blocks(builder.root)
+        if not candidates:
+            return {'text': full_text, 'full_text': full_text, 'mode': 'full', 'fallback_reason': '没有找到正文段落'}
+
+        top = max(candidates, key=lambda node: node.score)
+        main_text = self._clean_lines('\n'.join(
+            self._text_of(block, skip_dropped=True, block_breaks=True) for block in self._select_main_blocks(top)
+        ))
+        if len(main_text) < min(self.main_min_chars, len(full_text)):
+            return {'text': full_text, 'full_text': full_text, 'mode': 'full',
+                    'fallback_reason': f'正文过短（{len(main_text)} 字符）'}
+
+        # 标题一般不在正文块内，放在第一行一起翻译
+        title = self._clean_lines(self._text_of(builder.title)) if builder.title is not None else ''
+        if title and not main_text.startswith(title):
+            main_text = f"{title}\n{main_text}"
+        return {'text': main_text, 'full_text': full_text, 'mode': 'main', 'fallback_reason': None}
+
+    def extract(self, content, content_type=None):
+        """
+        提取网页文本
+
+        Args:
+            content (bytes|str): 网页HTML
+            content_type (str): 响应的 Content-Type，用于确定编码
+
+        Returns:
+            str: 每行一段的文本
+        """
+        html = self.decode(content, content_type)
+        if not html.strip():
+            return ''
+        return self._clean_lines(''.join(getattr(self, f'_extract_{self.backend}')(html)))
+
+html_text_extractor = HTMLTextExtractor()
+# GPT网页翻译默认的翻译范围：main（只翻译正文）或 full（整页）
+WEBPAGE_CONTENT_MODE = os.getenv('WEBPAGE_CONTENT_MODE', 'main').lower()
+
+# ========== 网页批量翻译 ==========
+
+class DomainConcurrencyLimiter:
+    """
+    网页批量翻译的并发限制
+
+    全局同时处理的网址数不超过 global_limit；同一域名同时处理的网址数不超过 per_domain，
+    且相邻两次开始访问同一域名至少间隔 min_interval 秒，避免短时间内大量请求同一站点。
+    限制在所有批量任务之间共享。
+    """
+
+    def __init__(self, global_limit=None, per_domain=None, min_interval=None):
+        self.global_limit = global_limit or int(os.getenv('WEBPAGE_BATCH_WORKERS', '4'))
+        self.per_domain = per_domain or int(os.getenv('WEBPAGE_BATCH_PER_DOMAIN', '2'))
+        self.min_interval = min_interval if min_interval is not None else float(os.getenv('WEBPAGE_BATCH_DOMAIN_INTERVAL', '1.0'))
+        self.lock = threading.Lock()
+        self.active = 0
+        self.domain_active = {}
+        self.domain_last_start = {}
+
+    @staticmethod
+    def domain_of(url):
+        host = (urlparse(url).hostname or '').lower()
+        return host[4:] if host.startswith('www.') else host
+
+    def try_acquire(self, domain):
+        """有空闲名额时占用并返回True，否则立即返回False"""
+        with self.lock:
+            now = time.time()
+            if self.active >= self.global_limit or self.domain_active.get(domain, 0) >= self.per_domain:
+                return False
+            if now - self.domain_last_start.get(domain, 0) < self.min_interval:
+                return False
+            self.active += 1
+            self.domain_active[domain] = self.domain_active.get(domain, 0) + 1
+            self.domain_last_start[domain] = now
+            return True
+
+    def release(self, domain):
+        with self.lock:
+            self.active -= 1
+            self.domain_active[domain] -= 1
+            if not self.domain_active[domain]:
+                del self.domain_active[domain]
+
+    def stats(self):
+        with self.lock:
+            return {'global_limit': self.global_limit, 'per_domain': self.per_domain,
+                    'min_interval': self.min_interval, 'active': self.active,
+                    'domains': dict(self.domain_active)}
+
+webpage_batch_limiter = DomainConcurrencyLimiter()
+# 线程数与全局并发上限一致，占到名额的任务提交后立即开始执行
+webpage_batch_executor = ThreadPoolExecutor(max_workers=webpage_batch_limiter.global_limit, thread_name_prefix='webpage-batch')
+
+# ========== 分段并行翻译 ==========
+
+_token_encoder = None
+
+def estimate_tokens(text):
+    """估算文本的token数：安装了tiktoken时精确计算，否则按中日韩字符1个、其他字符4个约1个估算"""
+    global _token_encoder
+    if _token_encoder is None:
+        try:
+            import tiktoken
+            _token_encoder = tiktoken.get_encoding('cl100k_base')
+        except Exception:
+            _token_encoder = False
+    if _token_encoder:
+        return len(_token_encoder.encode(text))
+    cjk = len(re.findall(r'[\u3000-\u9fff\uac00-\ud7af\uff00-\uffef]', text))
+    return cjk + math.ceil((len(text) - cjk) / 4)
+
+def split_text_into_segments(text, max_tokens):
+    """
+    把文本切成翻译片段：每个段落是一个片段
+
+    单个段落超过 max_tokens 时按句子切分，单个句子仍超长时按字符硬切。
+
+    Returns:
+        list: [(片段文本, 与前一片段之间的连接符)]，按连接符拼接即还原原文
+    """
+    segments = []
+    for paragraph in text.split('\n'):
+        if estimate_tokens(paragraph) <= max_tokens:
+            segments.append((paragraph, '\n'))
+            continue
+        joiner = '\n'
+        for sentence in re.split(r'(?<=[。！？.!?])', paragraph):
+            while sentence and estimate_tokens(sentence) > max_tokens:
+                cut = max(1, len(sentence) * max_tokens // estimate_tokens(sentence))
+                segments.append((sentence[:cut], joiner))
+                sentence, joiner = sentence[cut:], ''
+            if sentence:
+                segments.append((sentence, joiner))
+                joiner = ''
+    return segments
+
+class TranslationMemory:
+    """
+    片段级翻译记忆（SQLite持久化）
+
+    以“语言对/术语表版本 + 规范化原文”的哈希为键保存译文，所有网页和客户共用。
+    翻译前先查询：完全匹配直接复用，相似片段作为参考译文提示给模型。
+    条目数超过上限时按最近使用时间淘汰。
+    """
+
+    def __init__(self, db_path=None, max_entries=None, fuzzy_threshold=None):
+        self.db_path = os.path.abspath(db_path or os.getenv('TM_DB_PATH', 'translation_memory.db'))
+        self.max_entries = max_entries or int(os.getenv('TM_MAX_ENTRIES', '200000'))
+        self.fuzzy_threshold = fuzzy_threshold or float(os.getenv('TM_FUZZY_THRESHOLD', '0.8'))
+        self.fuzzy_candidates = 300
+        self.lock = threading.Lock()
+        self.lookups = 0
+        self.hits = 0
+        self.fuzzy_hits = 0
+        self.evictions = 0
+        self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS segments (
+                key TEXT PRIMARY KEY,
+                scope TEXT NOT NULL,
+                source TEXT NOT NULL,
+                source_length INTEGER NOT NULL,
+                translation TEXT NOT NULL,
+                hits INTEGER NOT NULL DEFAULT 0,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_segments_scope_length ON segments(scope, source_length)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_segments_last_used ON segments(last_used)")
+        self.conn.commit()
+
+    @staticmethod
+    def make_scope(source_lang, target_lang, glossary_version=None):
+        glossary_version = glossary_version or os.getenv('TM_GLOSSARY_VERSION', '')
+        return f"{source_lang}>{target_lang}|{glossary_version}"
+
+    @staticmethod
+    def normalize(text):
+        """统一全角/半角形式并合并空白"""
+        return re.sub(r'\s+', ' ', unicodedata.normalize('NFKC', text)).strip()
+
+    @classmethod
+    def make_key(cls, scope, normalized):
+        return hashlib.sha256(f"{scope}\n{normalized}".encode('utf-8')).hexdigest()
+
+    def lookup(self, text, scope):
+        """
+        查询翻译记忆
+
+        Returns:
+            tuple: ('exact', 译文) / ('fuzzy', {'source', 'translation', 'score'}) / (None, None)
+        """
+        normalized = self.normalize(text)
+        if not normalized:
+            return None, None
+        key = self.make_key(scope, normalized)
+        now = time.time()
+        with self.lock:
+            self.lookups += 1
+            row = self.conn.execute("SELECT translation FROM segments WHERE key = ?", (key,)).fetchone()
+            if row:
+                self.hits += 1
+                self.conn.execute("UPDATE segments SET hits = hits + 1, last_used = ? WHERE key = ?", (now, key))
+                self.conn.commit()
+                return 'exact', row[0]
+
+            # 短片段的相似度没有参考价值
+            if len(normalized) < 20:
+                return None, None
+            length = len(normalized)
+            candidates = self.conn.execute(
+                "SELECT source, translation FROM segments WHERE scope = ? AND source_length BETWEEN ? AND ? "
+                "ORDER BY last_used DESC LIMIT ?",
+                (scope, int(length * 0.8), int(length * 1.25) + 1, self.fuzzy_candidates)
+            ).fetchall()
+
+        best = None
+        for source, translation in candidates:
+            matcher = difflib.SequenceMatcher(None, normalized, source, autojunk=False)
+            if matcher.quick_ratio() < self.fuzzy_threshold:
+                continue
+            score = matcher.ratio()
+            if score >= self.fuzzy_threshold and (best is None or score > best['score']):
+                best = {'source': source, 'translation': translation, 'score': round(score, 3)}
+        if best:
+            with self.lock:
+                self.fuzzy_hits += 1
+            return 'fuzzy', best
+        return None, None
+
+    def store(self, pairs, scope):
+        """保存 [(原文, 译文)]，超过条目上限时淘汰最久未使用的条目"""
+        now = time.time()
+        rows = []
+        for source, translation in pairs:
+            normalized = self.normalize(source)
+            if normalized and translation and translation.strip():
+                rows.append((self.make_key(scope, normalized), scope, normalized, len(normalized),
+                             translation.strip(), now, now))
+        if not rows:
+            return
+        with self.lock:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO segments (key, scope, source, source_length, translation, hits, created_at, last_used) "
+                "VALUES (?, ?, ?, ?, ?, 0, ?, ?)", rows
+            )
+            count = self.conn.execute("SELECT COUNT(*) FROM segments").fetchone()[0]
+            if count > self.max_entries:
+                overflow = count - self.max_entries
+                self.conn.execute(
+                    "DELETE FROM segments WHERE key IN (SELECT key FROM segments ORDER BY last_used LIMIT ?)", (overflow,)
+                )
+                self.evictions += overflow
+            self.conn.commit()
+
+    def stats(self):
+        with self.lock:
+            entries = self.conn.execute("SELECT COUNT(*) FROM segments").fetchone()[0]
+            return {
+                'entries': entries,
+                'max_entries': self.max_entries,
+                'lookups': self.lookups,
+                'hits': self.hits,
+                'fuzzy_hits': self.fuzzy_hits,
+                'hit_rate': round(self.hits / self.lookups, 4) if self.lookups else 0.0,
+                'evictions': self.evictions
+            }
+
+translation_memory = TranslationMemory() if os.getenv('TRANSLATION_MEMORY', '1').lower() in ('1', 'true', 'yes') else None
+
+class ParallelChunkTranslator:
+    """
+    长文本分段并行翻译
+
+    文本按段落切成片段，先查翻译记忆，未命中的片段按token上限打包成批，在线程池中并发调用模型，
+    结果按原顺序拼接。每批单独重试，总耗时取决于最慢的一批而不是整篇文档。
+    失败的批次和模型漏掉的片段保留原文；未翻译片段的比例超过 max_failed_ratio 时结果中给出 error。
+    """
+
+    def __init__(self, client, model=None, max_chunk_tokens=None, max_workers=None, max_retries=None, max_chunks=None,
+                 memory=None, scope=None, max_failed_ratio=None):
+        self.client = client
+        self.model = model or os.getenv('WEBPAGE_GPT_MODEL', 'gpt-4o')
+        self.max_chunk_tokens = max_chunk_tokens or int(os.getenv('WEBPAGE_GPT_CHUNK_TOKENS', '1500'))
+        self.max_workers = max_workers or int(os.getenv('WEBPAGE_GPT_WORKERS', '4'))
+        self.max_retries = max_retries or int(os.getenv('WEBPAGE_GPT_RETRIES', '3'))
+        self.max_chunks = max_chunks or int(os.getenv('WEBPAGE_GPT_MAX_CHUNKS', '40'))
+        self.max_failed_ratio = (max_failed_ratio if max_failed_ratio is not None
+                                 else float(os.getenv('WEBPAGE_GPT_MAX_FAILED_RATIO', '0.5')))
+        self.memory = memory
+        self.scope = scope
+
+    @staticmethod
+    def _keep_spacing(original, translation):
+        """译文和翻译记忆都不带首尾空白，按原片段补回（句子片段之间的空格留在片段开头）"""
+        leading = original[:len(original) - len(original.lstrip())]
+        trailing = original[len(original.rstrip()):]
+        return leading + translation + trailing
+
+    def _make_batches(self, indices, segments):
+        """把待翻译片段按token上限打包"""
+        batches, current, current_tokens = [], [], 0
+        for index in indices:
+            tokens = estimate_tokens(segments[index][0]) + 8
+            if current and current_tokens + tokens > self.max_chunk_tokens:
+                batches.append(current)
+                current, current_tokens = [], 0
+            current.append(index)
+            current_tokens += tokens
+        if current:
+            batches.append(current)
+        return batches
+
+    def _translate_batch(self, number, batch, segments, hints, system_prompt):
+        """
+        翻译一批片段，失败时指数退避重试；返回 ({片段序号: 译文}, 耗时)
+
+        模型返回的JSON中一个片段都没有时按失败重试；只漏掉部分片段时返回已有的译文，由调用方记录漏掉的片段
+        """
+        start_time = time.time()
+        payload = {str(i): segments[index][0] for i, index in enumerate(batch, 1)}
+        messages = [{
+            "role": "system",
+            "content": system_prompt + "\n用户发送一个JSON对象，键是片段编号，值是原文片段。"
+                       "请返回同样键的JSON对象，值为对应译文；逐个翻译，不要合并或拆分片段。"
+        }]
+        references = [hints[index] for index in batch if index in hints]
+        if references:
+            messages.append({
+                "role": "system",
+                "content": "翻译记忆中的相似片段及其译文，术语和句式请保持一致：\n" + json.dumps(
+                    [{'source': ref['source'], 'translation': ref['translation']} for ref in references],
+                    ensure_ascii=False
+                )
+            })
+        messages.append({"role": "user", "content": json.dumps(payload, ensure_ascii=False)})
+        input_tokens = sum(estimate_tokens(segments[index][0]) for index in batch)
+
+        for attempt in range(1, self.max_retries + 1):
+            try:
+                response = self.client.chat.completions.create(
+                    model=self.model,
+                    messages=messages,
+                    max_tokens=min(4096, input_tokens * 2 + 256),
+                    temperature=0.3,
+                    response_format={"type": "json_object"}
+                )
+                data = json.loads(response.choices[0].message.content)
+                translations = {}
+                for i, index in enumerate(batch, 1):
+                    value = data.get(str(i))
+                    if isinstance(value, str) and value.strip():
+                        translations[index] = value.strip()
+                if not translations:
+                    raise ValueError("模型返回的JSON中没有任何片段的译文")
+                return translations, time.time() - start_time
+            except Exception as e:
+                if attempt == self.max_retries:
+                    raise
+                delay = 2 ** (attempt - 1)
+                log_message(f"第 {number + 1} 批第 {attempt} 次翻译失败，{delay} 秒后重试: {str(e)}", "WARNING")
+                time.sleep(delay)
+
+    def translate(self, text, system_prompt):
+        """
+        分段并行翻译
+
+        Returns:
+            dict: {'text': 按原顺序拼接的译文, 'chunks': 发送给模型的批数, 'failed_chunks': 失败批次序号（从0开始，保留原文）,
+                   'missing_segments': 成功批次中模型漏掉、保留原文的片段序号,
+                   'sent_segments': 发送给模型的片段数, 'untranslated_segments': 其中保留原文的片段数,
+                   'error': 所有批次都失败或未翻译比例超过上限时的错误说明，否则为None,
+                   'truncated': 是否因批数上限有片段未翻译, 'seconds': 总耗时, 'slowest_chunk_seconds': 最慢一批的耗时,
+                   'memory': 翻译记忆命中情况}
+        """
+        start_time = time.time()
+        segments = split_text_into_segments(text, self.max_chunk_tokens)
+        results = [segment for segment, _ in segments]
+        hints = {}
+        pending = []
+        duplicates = {}  # 片段序号 -> 同一任务中内容相同、已在待翻译列表中的片段序号
+        first_seen = {}
+        exact_hits = 0
+        for index, (segment, _) in enumerate(segments):
+            if not segment.strip():
+                continue
+            normalized = TranslationMemory.normalize(segment)
+            if normalized in first_seen:
+                duplicates[index] = first_seen[normalized]
+                continue
+            if self.memory:
+                kind, match = self.memory.lookup(segment, self.scope)
+                if kind == 'exact':
+                    results[index] = self._keep_spacing(segment, match)
+                    exact_hits += 1
+                    continue
+                if kind == 'fuzzy':
+                    hints[index] = match
+            first_seen[normalized] = index
+            pending.append(index)
+
+        lookups = exact_hits + len(pending)
+        memory_report = {
+            'segments': lookups,
+            'exact_hits': exact_hits,
+            'fuzzy_hints': len(hints),
+            'hit_rate': round(exact_hits / lookups, 4) if lookups else 0.0
+        } if self.memory else None
+
+        batches = self._make_batches(pending, segments)
+        truncated = len(batches) > self.max_chunks
+        if truncated:
+            log_message(f"共 {len(batches)} 批，超过上限 {self.max_chunks}，其余片段保留原文", "WARNING")
+            batches = batches[:self.max_chunks]
+
+        log_message(
+            f"分段翻译: {lookups} 个片段，翻译记忆命中 {exact_hits} 个，{len(batches)} 批发送给 {self.model}"
+            f"（并发 {min(self.max_workers, len(batches) or 1)}）", "INFO"
+        )
+        durations = [0.0] * len(batches)
+        failed = []
+        missing = []
+        translated_pairs = []
+        if batches:
+            with ThreadPoolExecutor(max_workers=max(1, min(self.max_workers, len(batches))), thread_name_prefix='gpt-chunk') as executor:
+                futures = [
+                    executor.submit(self._translate_batch, number, batch, segments, hints, system_prompt)
+                    for number, batch in enumerate(batches)
+                ]
+                for number, future in enumerate(futures):
+                    try:
+                        translations, durations[number] = future.result()
+                    except Exception as e:
+                        log_message(f"第 {number + 1} 批翻译失败，保留原文: {str(e)}", "ERROR")
+                        failed.append(number)
+                        continue
+                    for index, translation in translations.items():
+                        results[index] = self._keep_spacing(segments[index][0], translation)
+                        translated_pairs.append((segments[index][0], translation))
+                    omitted = [index for index in batches[number] if index not in translations]
+                    if omitted:
+                        log_message(f"第 {number + 1} 批中模型漏掉了 {len(omitted)} 个片段，保留原文", "WARNING")
+                        missing.extend(omitted)
+
+        if self.memory and translated_pairs:
+            self.memory.store(translated_pairs, self.scope)
+        for index, original in duplicates.items():
+            results[index] = self._keep_spacing(segments[index][0], results[original].strip())
+
+        output = results[0] if results else ''
+        for index in range(1, len(results)):
+            output += segments[index][1] + results[index]
+
+        sent = sum(len(batch) for batch in batches)
+        untranslated = sum(len(batches[number]) for number in failed) + len(missing)
+        error = None
+        if batches and len(failed) == len(batches):
+            error = f"全部 {len(batches)} 批翻译失败"
+        elif sent and untranslated / sent > self.max_failed_ratio:
+            error = f"{sent} 个片段中有 {untranslated} 个未翻译，超过上限 {self.max_failed_ratio:.0%}"
+        if error:
+            log_message(f"分段翻译失败: {error}", "ERROR")
+
+        return {
+            'text': output,
+            'chunks': len(batches),
+            'failed_chunks': failed,
+            'missing_segments': sorted(missing),
+            'sent_segments': sent,
+            'untranslated_segments': untranslated,
+            'error': error,
+            'truncated': truncated,
+            'seconds': round(time.time() - start_time, 2),
+            'slowest_chunk_seconds': round(max(durations), 2) if durations else 0.0,
+            'memory': memory_report
+        }
 
 # ========== 翻译功能类 ========== 
 
@@ -1580,32 +5200,22 @@ class SimpleTranslator:
                     'error': 'Selenium未安装，无法进行网页翻译'
                 }
             
-            # 设置Chrome选项
-            chrome_options = Options()
-            chrome_options.add_argument('--headless')
-            chrome_options.add_argument('--no-sandbox')
-            chrome_options.add_argument('--disable-dev-shm-usage')
-            
-            driver = None
-            try:
-                driver = webdriver.Chrome(options=chrome_options)
-                
+            # 从共享浏览器池租用Chrome，避免每个URL冷启动浏览器；只保存HTML，不加载图片、媒体和字体
+            with chrome_pool.lease(block='text') as driver:
                 # 访问Google翻译
                 translate_url = f"https://translate.google.com/translate?sl=auto&tl=zh&u={url}"
                 driver.get(translate_url)
+                chrome_pool.count_page(driver)
                 
-                # 等待页面加载
-                time.sleep(5)
+                # 等待页面加载和Google翻译完成
+                wait_for_page_ready(driver, google_translate=True)
                 
                 # 获取翻译后的内容
                 page_source = driver.page_source
                 
-                # 解析内容
-                soup = BeautifulSoup(page_source, 'html.parser')
-                
                 # 保存结果
                 timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                output_filename = f"google_translate_{timestamp}.html"
+                output_filename = f"google_translate_{timestamp}_{uuid.uuid4().hex[:8]}.html"
                 output_path = os.path.join('web_translation_output', output_filename)
                 
                 os.makedirs('web_translation_output', exist_ok=True)
@@ -1621,10 +5231,6 @@ class SimpleTranslator:
                     'output_path': output_path,
                     'url': url
                 }
-                
-            finally:
-                if driver:
-                    driver.quit()
             
         except Exception as e:
             log_message(f"Google网页翻译失败: {str(e)}", "ERROR")
@@ -1633,8 +5239,13 @@ class SimpleTranslator:
                 'error': f'Google网页翻译失败: {str(e)}'
             }
     
-    def translate_webpage_gpt(self, url):
-        """GPT网页翻译（简化版）"""
+    def translate_webpage_gpt(self, url, replay=False, capture_id=None, content_mode=None):
+        """
+        GPT网页翻译（简化版）
+
+        replay/capture_id 时从网页存档重新翻译，不访问源站；
+        content_mode 为 main 时只翻译正文（去掉导航、页脚、侧栏等），full 时翻译整页
+        """
         try:
             if not self.openai_client:
                 return {
@@ -1647,51 +5258,70 @@ class SimpleTranslator:
                 'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
             }
             
-            response = requests.get(url, headers=headers, timeout=30)
-            response.raise_for_status()
-            
-            # 解析HTML内容
-            soup = BeautifulSoup(response.content, 'html.parser')
-            
-            # 提取主要文本内容
-            for script in soup(["script", "style"]):
-                script.decompose()
+            page = web_fetch_cache.fetch(url, headers=headers, timeout=30, replay=replay, capture_id=capture_id)
             
-            text_content = soup.get_text()
-            text_content = '\n'.join(line.strip() for line in text_content.splitlines() if line.strip())
-            
-            # 限制文本长度
-            if len(text_content) > 8000:
-                text_content = text_content[:8000] + "..."
-            
-            # 使用GPT翻译
-            messages = [
-                {
-                    "role": "system",
-                    "content": "你是一个专业的网页翻译助手。请将提供的网页内容翻译成中文，保持原有的结构和格式。"
-                },
-                {
-                    "role": "user",
-                    "content": f"请将以下网页内容翻译成中文：\n\n{text_content}"
-                }
-            ]
+            # 提取网页文本：整页模式流式解析不建树；正文模式额外按块打分，只保留正文
+            content_mode = content_mode or WEBPAGE_CONTENT_MODE
+            content_type = page['headers'].get('content-type')
+            extract_started = time.perf_counter()
+            if content_mode == 'main':
+                extracted = html_text_extractor.extract_main(page['content'], content_type)
+                text_content, full_text = extracted['text'], extracted['full_text']
+            else:
+                extracted = {'mode': 'full', 'fallback_reason': None}
+                text_content = full_text = html_text_extractor.extract(page['content'], content_type)
+            extract_seconds = time.perf_counter() - extract_started
+
+            full_tokens = estimate_tokens(full_text)
+            translated_tokens = estimate_tokens(text_content) if extracted['mode'] == 'main' else full_tokens
+            content_info = {
+                'requested_mode': content_mode,
+                'mode': extracted['mode'],
+                'fallback_reason': extracted['fallback_reason'],
+                'full_tokens': full_tokens,
+                'translated_tokens': translated_tokens,
+                'token_reduction': round(1 - translated_tokens / full_tokens, 4) if full_tokens else 0.0
+            }
+            log_message(f"网页文本提取完成（{extracted['mode']}）: {len(page['content']) // 1024} KB，"
+                        f"token {full_tokens} -> {translated_tokens}，耗时 {extract_seconds * 1000:.1f} ms"
+                        f"（{html_text_extractor.backend}）", "INFO")
+            if extracted['fallback_reason']:
+                log_message(f"正文提取退回整页: {extracted['fallback_reason']}", "WARNING")
             
-            gpt_response = self.openai_client.chat.completions.create(
-                model="gpt-4",
-                messages=messages,
-                max_tokens=4000
+            # 按段落分段并行翻译，不再截断长网页；重复出现的片段直接使用翻译记忆
+            chunk_result = ParallelChunkTranslator(
+                self.openai_client, memory=translation_memory, scope=TranslationMemory.make_scope('auto', 'zh')
+            ).translate(
+                text_content,
+                "你是一个专业的网页翻译助手。请将用户提供的网页内容片段翻译成中文，保持原有的段落结构和格式，"
+                "只输出译文，不要添加任何说明。"
             )
-            
-            translated_content = gpt_response.choices[0].message.content
+            if chunk_result['error']:
+                return {
+                    'success': False,
+                    'error': f"GPT网页翻译失败: {chunk_result['error']}",
+                    'url': url,
+                    'chunks': chunk_result['chunks'],
+                    'failed_chunks': chunk_result['failed_chunks'],
+                    'missing_segments': chunk_result['missing_segments'],
+                    'untranslated_segments': chunk_result['untranslated_segments'],
+                    'fetch_cache': page['cache'],
+                    'capture_id': page['capture_id']
+                }
+            translated_content = chunk_result['text']
             
             # 保存翻译结果
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            output_filename = f"gpt_translate_{timestamp}.txt"
+            output_filename = f"gpt_translate_{timestamp}_{uuid.uuid4().hex[:8]}.txt"
             output_path = os.path.join('web_translation_output', output_filename)
             
             os.makedirs('web_translation_output', exist_ok=True)
             with open(output_path, 'w', encoding='utf-8') as f:
                 f.write(f"原始URL: {url}\n")
+                if page['capture_id']:
+                    f.write(f"抓取记录: {page['capture_id']}\n")
+                f.write(f"翻译范围: {'正文' if extracted['mode'] == 'main' else '整页'}"
+                        f"（token {full_tokens} -> {translated_tokens}）\n")
                 f.write("="*50 + "\n")
                 f.write(translated_content)
             
@@ -1703,7 +5333,18 @@ class SimpleTranslator:
                 'output_filename': output_filename,
                 'output_path': output_path,
                 'url': url,
-                'translated_content': translated_content[:500] + '...' if len(translated_content) > 500 else translated_content
+                'translated_content': translated_content[:500] + '...' if len(translated_content) > 500 else translated_content,
+                'chunks': chunk_result['chunks'],
+                'failed_chunks': chunk_result['failed_chunks'],
+                'missing_segments': chunk_result['missing_segments'],
+                'untranslated_segments': chunk_result['untranslated_segments'],
+                'truncated': chunk_result['truncated'],
+                'translation_seconds': chunk_result['seconds'],
+                'translation_memory': chunk_result['memory'],
+                'fetch_cache': page['cache'],
+                'capture_id': page['capture_id'],
+                'extract_seconds': round(extract_seconds, 4),
+                'content': content_info
             }
             
         except Exception as e:
@@ -1959,8 +5600,18 @@ def webpage_gpt_translate():
                 'error': '无效的URL格式'
             }), 400
         
+        # 翻译范围：main 只翻译正文，full 翻译整页，不传时使用 WEBPAGE_CONTENT_MODE
+        content_mode = data.get('content_mode')
+        if content_mode not in (None, 'main', 'full'):
+            return jsonify({
+                'success': False,
+                'error': 'content_mode 只能是 main 或 full'
+            }), 400
+        
         # 调用翻译功能
-        result = get_translator().translate_webpage_gpt(url)
+        result = get_translator().translate_webpage_gpt(
+            url, replay=bool(data.get('replay')), capture_id=data.get('capture_id'), content_mode=content_mode
+        )
         
         if result['success']:
             return jsonify({
@@ -1969,7 +5620,15 @@ def webpage_gpt_translate():
                 'output_filename': result['output_filename'],
                 'download_url': f'/download/web/{result["output_filename"]}',
                 'url': url,
-                'preview': result.get('translated_content', '')
+                'preview': result.get('translated_content', ''),
+                'chunks': result.get('chunks'),
+                'failed_chunks': result.get('failed_chunks'),
+                'missing_segments': result.get('missing_segments'),
+                'truncated': result.get('truncated'),
+                'translation_memory': result.get('translation_memory'),
+                'fetch_cache': result.get('fetch_cache'),
+                'capture_id': result.get('capture_id'),
+                'content': result.get('content')
             })
         else:
             return jsonify(result), 500
@@ -1981,38 +5640,222 @@ def webpage_gpt_translate():
             'error': f'GPT网页翻译失败: {str(e)}'
         }), 500
 
+@app.route('/api/translation-memory/stats', methods=['GET'])
+@jwt_required()
+def translation_memory_stats():
+    """翻译记忆的条目数和累计命中率"""
+    return jsonify({'success': True, 'enabled': translation_memory is not None,
+                    'stats': translation_memory.stats() if translation_memory else None})
+
+@app.route('/api/webpage/browser-pool', methods=['GET'])
+@jwt_required()
+def browser_pool_stats():
+    """共享Chrome浏览器池的状态"""
+    return jsonify({'success': True, 'selenium_available': SELENIUM_AVAILABLE, 'pool': chrome_pool.stats()})
+
+@app.route('/api/webpage/fetch-cache', methods=['GET'])
+@jwt_required()
+def web_fetch_cache_stats():
+    """网页抓取缓存的命中情况；带 url 参数时列出该网址的历次抓取，用于回放"""
+    url = request.args.get('url', '').strip()
+    response = {'success': True, 'stats': web_fetch_cache.stats()}
+    if url:
+        response['captures'] = web_fetch_cache.captures(url)
+    return jsonify(response)
+
 # ========== LaTeX 翻译接口 ========== 
 
 # 初始化海报翻译器
 poster_translator = PosterTranslator(api_key=load_api_keys().get('OPENAI_API_KEY'))
 
+class EnvironmentProbe:
+    """
+    LaTeX环境检查结果缓存
+    
+    完整检查需要启动pdflatex进程并在多个目录中读写测试文件，开销较大。
+    启动时检查一次，之后在TTL内直接返回缓存结果；过期后先返回旧结果，
+    同时在后台线程中刷新，接口不会因检查而阻塞。
+    """
+    
+    def __init__(self, translator, ttl=None):
+        self.translator = translator
+        self.ttl = ttl if ttl is not None else int(os.getenv('LATEX_ENV_CHECK_TTL', '600'))
+        self.lock = threading.Lock()
+        self.result = None
+        self.checked_at = None
+        self.duration = None
+        self.refreshing = False
+    
+    def _run(self):
+        start = time.time()
+        try:
+            result = self.translator.check_requirements_with_details()
+        except Exception as e:
+            log_message(f"环境检查异常: {str(e)}", "ERROR")
+            result = {'success': False, 'error_summary': f'环境检查异常: {str(e)}'}
+        with self.lock:
+            self.result = result
+            self.checked_at = time.time()
+            self.duration = round(self.checked_at - start, 3)
+            self.refreshing = False
+        return result
+    
+    def refresh_async(self):
+        """在后台线程中刷新，已有刷新在进行时不重复启动"""
+        with self.lock:
+            if self.refreshing:
+                return
+            self.refreshing = True
+        threading.Thread(target=self._run, name='latex-env-probe', daemon=True).start()
+    
+    def get(self, force=False):
+        """返回 (检查结果, 元信息)；force为True时同步重新检查"""
+        with self.lock:
+            result, checked_at = self.result, self.checked_at
+        
+        if force or result is None:
+            with self.lock:
+                self.refreshing = True
+            result = self._run()
+        elif time.time() - checked_at > self.ttl:
+            self.refresh_async()
+        
+        with self.lock:
+            meta = {
+                'checked_at': datetime.fromtimestamp(self.checked_at).isoformat() if self.checked_at else None,
+                'age_seconds': round(time.time() - self.checked_at, 1) if self.checked_at else None,
+                'ttl_seconds': self.ttl,
+                'probe_duration': self.duration,
+                'refreshing': self.refreshing
+            }
+        return result, meta
+
+environment_probe = EnvironmentProbe(poster_translator)
+poster_batch_processor = PosterBatchProcessor(poster_translator)
+
+def apply_latex_result_to_material(material, latex_result):
+    """把LaTeX翻译结果写入材料记录（不提交事务）"""
+    if latex_result['success']:
+        material.latex_translation_result = json.dumps({
+            'tex_file': latex_result.get('tex_file'),
+            'pdf_file': latex_result.get('pdf_file'),
+            'latex_code_length': latex_result.get('latex_code_length', 0),
+            'compile_passes': latex_result.get('compile_passes'),
+            'thumbnails': latex_result.get('thumbnails'),
+            'model': latex_result.get('model'),
+            'route': latex_result.get('route'),
+            'generation_mode': latex_result.get('generation_mode')
+        }, ensure_ascii=False)
+        material.latex_translation_error = None
+        log_message(f"LaTeX翻译完成: {material.name}", "SUCCESS")
+        log_message(f"  - LaTeX文件: {latex_result.get('tex_file')}", "INFO")
+        log_message(f"  - PDF文件: {latex_result.get('pdf_file')}", "INFO")
+    else:
+        material.latex_translation_error = latex_result.get('error', 'LaTeX翻译失败')
+        log_message(f"LaTeX翻译失败: {material.name} - {latex_result.get('error', '未知错误')}", "ERROR")
+
+def apply_batch_latex_result(item, latex_result):
+    """批量任务的结果回调，在后台线程中更新材料记录"""
+    with app.app_context():
+        material = Material.query.get(item['material_id'])
+        if not material:
+            log_message(f"批量结果对应的材料已不存在: {item['material_id']}", "WARNING")
+            return
+        apply_latex_result_to_material(material, latex_result)
+        db.session.commit()
+
+# 草稿模式：接口先返回由翻译图片生成的草稿PDF，正式LaTeX版本在后台线程池中生成后替换草稿
+POSTER_DRAFT_TIER = os.getenv('POSTER_DRAFT_TIER', '1').lower() in ('1', 'true', 'yes')
+poster_final_executor = ThreadPoolExecutor(
+    max_workers=max(1, int(os.getenv('POSTER_FINAL_WORKERS', '2'))), thread_name_prefix='poster-final'
+)
+
+def finish_latex_in_background(material_id, draft_pdf, **kwargs):
+    """后台生成正式LaTeX版本并写回材料；失败时保留草稿并记录错误"""
+    try:
+        latex_result = poster_translator.translate_poster_complete(**kwargs)
+    except Exception as e:
+        latex_result = {"success": False, "error": str(e)}
+
+    with app.app_context():
+        material = Material.query.get(material_id)
+        if not material:
+            log_message(f"正式版本对应的材料已不存在: {material_id}", "WARNING")
+            return
+        apply_latex_result_to_material(material, latex_result)
+        db.session.commit()
+
+    if latex_result['success'] and draft_pdf and os.path.exists(draft_pdf):
+        try:
+            os.remove(draft_pdf)
+        except OSError as e:
+            log_message(f"删除草稿PDF失败: {draft_pdf} - {str(e)}", "WARNING")
+
 @app.route('/api/latex/check-environment', methods=['GET'])
 @jwt_required()
 def check_latex_environment():
-    """检查LaTeX翻译环境"""
+    """检查LaTeX翻译环境（返回缓存结果，refresh=1 时强制重新检查）"""
     try:
-        log_message("开始LaTeX环境检查", "INFO")
+        force = request.args.get('refresh') in ('1', 'true')
+        if force:
+            log_message("强制重新进行LaTeX环境检查", "INFO")
         
-        # 运行详细检查
-        check_result = poster_translator.check_requirements_with_details()
+        check_result, probe_meta = environment_probe.get(force=force)
         
         if check_result['success']:
             return jsonify({
                 'success': True,
                 'message': 'LaTeX环境正常',
-                'details': check_result
+                'details': check_result,
+                'probe': probe_meta
             })
         else:
             return jsonify({
                 'success': False,
                 'error': 'LaTeX环境存在问题',
-                'details': check_result
+                'details': check_result,
+                'probe': probe_meta
             }), 500
             
     except Exception as e:
         log_message(f"LaTeX环境检查失败: {str(e)}", "ERROR")
         return jsonify({'success': False, 'error': f'环境检查异常: {str(e)}'}), 500
 
+@app.route('/api/latex/stats', methods=['GET'])
+@jwt_required()
+def latex_stats():
+    """LaTeX编译相关的缓存指标"""
+    return jsonify({
+        'success': True,
+        'backend': poster_translator.backend.name,
+        'sandbox': poster_translator.sandbox.stats(),
+        'routing': poster_translator.router.describe() if poster_translator.router else None,
+        'generation': poster_translator.generation_stats.stats(),
+        'pdf_cache': poster_translator.pdf_cache.stats() if poster_translator.pdf_cache else None
+    })
+
+@app.route('/api/latex/batches/<job_id>', methods=['GET'])
+@jwt_required()
+def latex_batch_status(job_id):
+    """查询LaTeX离线批量任务的状态"""
+    job = poster_batch_processor.get_job(job_id)
+    if not job or job.get('owner') != str(get_jwt_identity()):
+        return jsonify({'success': False, 'error': '批量任务不存在'}), 404
+    
+    items = [
+        {'material_id': item.get('material_id'), 'status': item.get('status'), 'error': item.get('error')}
+        for item in job['items'].values()
+    ]
+    return jsonify({
+        'success': True,
+        'job_id': job['id'],
+        'batch_id': job['batch_id'],
+        'status': job['status'],
+        'created_at': job.get('created_at'),
+        'finished_at': job.get('finished_at'),
+        'items': items
+    })
+
 @app.route('/api/latex/translate-poster', methods=['POST'])
 @jwt_required()
 def latex_translate_poster():
@@ -2038,14 +5881,14 @@ def latex_translate_poster():
         
         # 保存上传的文件
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"latex_input_{timestamp}{file_ext}"
+        filename = f"latex_input_{timestamp}_{uuid.uuid4().hex[:8]}{file_ext}"
         upload_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
         file.save(upload_path)
         
         log_message(f"图像文件已保存: {upload_path}", "INFO")
         
-        # 定义输出文件基础名称
-        output_base_name = f"poster_output/translated_{timestamp}"
+        # 定义输出文件基础名称（附加随机后缀，避免同一秒内的并发请求重名）
+        output_base_name = f"poster_output/translated_{timestamp}_{uuid.uuid4().hex[:8]}"
         
         # 调用完整的翻译流程
         result = poster_translator.translate_poster_complete(
@@ -2059,12 +5902,14 @@ def latex_translate_poster():
             log_message(f"PDF生成成功: {pdf_path}", "SUCCESS")
             
             # 返回PDF文件
-            return send_file(
+            response = send_file(
                 pdf_path,
                 as_attachment=True,
                 download_name=f"translated_poster_{timestamp}.pdf",
                 mimetype='application/pdf'
             )
+            response.headers['X-LaTeX-Compile-Passes'] = str(result.get('compile_passes', ''))
+            return response
         else:
             log_message(f"LaTeX海报翻译失败: {result['error']}", "ERROR")
             return jsonify({
@@ -2214,6 +6059,9 @@ def delete_client(client_id):
         
         client_name = client.name
         
+        for material in client.materials:
+            poster_translator.build_dirs.remove(f"material_{material.id}")
+        
         # 删除客户（材料会因为外键约束自动删除）
         db.session.delete(client)
         db.session.commit()
@@ -2349,6 +6197,171 @@ def upload_urls(client_id):
         db.session.rollback()
         return jsonify({'success': False, 'error': '网页添加失败'}), 500
 
+def translate_webpage_material(material_id, url, engine, domain, content_mode=None):
+    """批量任务中翻译一个网址，并把结果写回材料；返回流式输出的一行结果"""
+    started = time.time()
+    try:
+        if engine == 'google':
+            result = get_translator().translate_webpage_google(url)
+        else:
+            result = get_translator().translate_webpage_gpt(url, content_mode=content_mode)
+    except Exception as e:
+        result = {'success': False, 'error': str(e)}
+    finally:
+        webpage_batch_limiter.release(domain)
+
+    line = {
+        'type': 'result',
+        'material_id': material_id,
+        'url': url,
+        'engine': engine,
+        'success': result['success'],
+        'seconds': round(time.time() - started, 2)
+    }
+    if result['success']:
+        line['download_url'] = f'/download/web/{result["output_filename"]}'
+        for key in ('chunks', 'failed_chunks', 'missing_segments', 'fetch_cache', 'capture_id', 'content'):
+            if key in result:
+                line[key] = result[key]
+    else:
+        line['error'] = result.get('error', '翻译失败')
+
+    with app.app_context():
+        try:
+            material = Material.query.get(material_id)
+            if material:
+                if result['success']:
+                    material.status = '翻译完成'
+                    material.file_path = result['output_path']
+                    material.translation_text_info = json.dumps(
+                        {key: value for key, value in line.items() if key not in ('type', 'material_id')},
+                        ensure_ascii=False
+                    )
+                    material.translation_error = None
+                else:
+                    material.status = '翻译失败'
+                    material.translation_error = line['error']
+                db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            log_message(f"写回网页翻译结果失败: {url} - {str(e)}", "ERROR")
+    return line
+
+@app.route('/api/clients/<client_id>/materials/webpages/translate', methods=['POST'])
+@jwt_required()
+def translate_webpages_batch(client_id):
+    """
+    批量翻译网页材料
+
+    请求体可以带 urls（先添加为网页材料）和 material_ids；都不提供时翻译该客户所有未翻译的网页。
+    engine 为 gpt（默认）或 google，content_mode 为 main 或 full（只对gpt有效）。
+    每个网址完成后立即以一行JSON（application/x-ndjson）返回，最后一行是汇总；结果同时写回对应的材料。
+    """
+    user_id = get_jwt_identity()
+    client = Client.query.filter_by(id=client_id, user_id=user_id).first()
+    if not client:
+        return jsonify({'success': False, 'error': '客户不存在'}), 404
+
+    data = request.get_json(silent=True) or {}
+    engine = data.get('engine', 'gpt')
+    if engine not in ('gpt', 'google'):
+        return jsonify({'success': False, 'error': 'engine 只能是 gpt 或 google'}), 400
+    content_mode = data.get('content_mode')
+    if content_mode not in (None, 'main', 'full'):
+        return jsonify({'success': False, 'error': 'content_mode 只能是 main 或 full'}), 400
+
+    materials = []
+    for url in data.get('urls') or []:
+        url = url.strip()
+        if url:
+            material = Material(name=url, type='webpage', url=url, status='已添加', client_id=client_id)
+            db.session.add(material)
+            materials.append(material)
+    # Material.id 由Python端default生成，flush之后新材料才有id
+    db.session.flush()
+    query = Material.query.filter_by(client_id=client_id, type='webpage')
+    if data.get('material_ids'):
+        materials += query.filter(Material.id.in_(data['material_ids'])).all()
+    elif not materials:
+        materials = query.filter(Material.status.in_(['已添加', '翻译失败'])).all()
+    # urls 和 material_ids 可能指向同一材料，每个材料只翻译一次
+    materials = list({material.id: material for material in materials}.values())
+
+    items = []
+    for material in materials:
+        parsed = urlparse(material.url or '')
+        if parsed.scheme not in ('http', 'https') or not parsed.netloc:
+            material.status = '翻译失败'
+            material.translation_error = '无效的URL格式'
+            continue
+        material.status = '翻译中'
+        items.append({'material_id': material.id, 'url': material.url,
+                      'domain': webpage_batch_limiter.domain_of(material.url)})
+    db.session.commit()
+
+    if not items:
+        return jsonify({'success': False, 'error': '没有需要翻译的网页材料',
+                        'materials': [material.to_dict() for material in materials]}), 400
+
+    get_translator()
+    log_message(f"开始批量网页翻译: {len(items)} 个网址，引擎 {engine}", "INFO")
+
+    def generate():
+        started = time.time()
+        pending = deque(items)
+        running = {}
+        succeeded = failed = 0
+        yield json.dumps({'type': 'start', 'total': len(items), 'engine': engine,
+                          'materials': [material.to_dict() for material in materials]}, ensure_ascii=False) + '\n'
+        try:
+            while pending or running:
+                # 按全局和域名名额提交任务，暂时没有名额的网址留在队列中
+                for _ in range(len(pending)):
+                    item = pending.popleft()
+                    if webpage_batch_limiter.try_acquire(item['domain']):
+                        future = webpage_batch_executor.submit(
+                            translate_webpage_material, item['material_id'], item['url'], engine, item['domain'],
+                            content_mode
+                        )
+                        running[future] = item
+                    else:
+                        pending.append(item)
+
+                if not running:
+                    time.sleep(0.1)
+                    continue
+                done, _ = wait(running, timeout=0.2, return_when=FIRST_COMPLETED)
+                for future in done:
+                    item = running.pop(future)
+                    try:
+                        line = future.result()
+                    except Exception as e:
+                        line = {'type': 'result', 'material_id': item['material_id'], 'url': item['url'],
+                                'engine': engine, 'success': False, 'error': str(e)}
+                    if line['success']:
+                        succeeded += 1
+                    else:
+                        failed += 1
+                    yield json.dumps(line, ensure_ascii=False) + '\n'
+
+            seconds = round(time.time() - started, 2)
+            log_message(f"批量网页翻译完成: 成功 {succeeded}，失败 {failed}，耗时 {seconds} 秒", "SUCCESS")
+            yield json.dumps({'type': 'done', 'total': len(items), 'succeeded': succeeded,
+                              'failed': failed, 'seconds': seconds}, ensure_ascii=False) + '\n'
+        finally:
+            # 客户端中途断开时，已提交的任务仍会完成并写回；尚未开始的网址恢复为待翻译
+            if pending:
+                with app.app_context():
+                    for item in pending:
+                        material = Material.query.get(item['material_id'])
+                        if material and material.status == '翻译中':
+                            material.status = '已添加'
+                    db.session.commit()
+                log_message(f"批量网页翻译中断，{len(pending)} 个网址未开始", "WARNING")
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 @app.route('/api/materials/<material_id>', methods=['DELETE'])
 @jwt_required()
 def delete_material(material_id):
@@ -2375,6 +6388,9 @@ def delete_material(material_id):
             except Exception as e:
                 log_message(f"删除文件失败: {material.file_path} - {str(e)}", "WARNING")
         
+        # 删除该材料的持久构建目录
+        poster_translator.build_dirs.remove(f"material_{material.id}")
+        
         # 删除数据库记录
         db.session.delete(material)
         db.session.commit()
@@ -2387,6 +6403,70 @@ def delete_material(material_id):
         log_message(f"删除材料失败: {str(e)}", "ERROR")
         return jsonify({'success': False, 'error': '删除材料失败'}), 500
 
+@app.route('/api/materials/<material_id>/latex/patch', methods=['POST'])
+@jwt_required()
+def patch_material_latex(material_id):
+    """对材料的LaTeX源码应用行范围修改并增量重新编译"""
+    try:
+        user_id = get_jwt_identity()
+        
+        material = Material.query.join(Client).filter(
+            Material.id == material_id,
+            Client.user_id == user_id
+        ).first()
+        
+        if not material:
+            return jsonify({'success': False, 'error': '材料不存在或无权限'}), 404
+        
+        if not material.latex_translation_result:
+            return jsonify({'success': False, 'error': '该材料没有LaTeX翻译结果'}), 400
+        
+        latex_result = json.loads(material.latex_translation_result)
+        if latex_result.get('draft'):
+            return jsonify({'success': False, 'error': '正式LaTeX版本仍在生成中，请稍后再试'}), 409
+        tex_file = latex_result.get('tex_file')
+        if not tex_file or not os.path.exists(tex_file):
+            return jsonify({'success': False, 'error': 'LaTeX文件不存在'}), 404
+        
+        data = request.get_json() or {}
+        try:
+            start_line = int(data['start_line'])
+            end_line = int(data['end_line'])
+        except (KeyError, TypeError, ValueError):
+            return jsonify({'success': False, 'error': '需要提供 start_line 和 end_line'}), 400
+        replacement = data.get('replacement', '')
+        if not isinstance(replacement, str):
+            return jsonify({'success': False, 'error': 'replacement 必须是字符串'}), 400
+        
+        result = poster_translator.recompile_with_patch(
+            tex_file, start_line, end_line, replacement,
+            build_key=f"material_{material.id}",
+            base_hash=data.get('base_hash')
+        )
+        
+        if not result['success']:
+            status = 409 if result.get('conflict') else (422 if 'errors' in result else 400)
+            log_message(f"LaTeX增量编译失败: {material.name} - {result.get('error')}", "WARNING")
+            return jsonify(result), status
+        
+        latex_result.update({
+            'pdf_file': result['pdf_file'],
+            'compile_passes': result['compile_passes'],
+            'thumbnails': result['thumbnails']
+        })
+        material.latex_translation_result = json.dumps(latex_result, ensure_ascii=False)
+        material.latex_translation_error = None
+        db.session.commit()
+        
+        log_message(f"LaTeX增量编译完成: {material.name}", "SUCCESS")
+        result['pdf_url'] = f"/preview/poster/{os.path.basename(result['pdf_file'])}"
+        result['material'] = material.to_dict()
+        return jsonify(result)
+    except Exception as e:
+        db.session.rollback()
+        log_message(f"LaTeX增量编译异常: {str(e)}", "ERROR")
+        return jsonify({'success': False, 'error': f'处理失败: {str(e)}'}), 500
+
 @app.route('/api/clients/<client_id>/materials/translate', methods=['POST'])
 @jwt_required()
 def start_translation(client_id):
@@ -2411,6 +6491,17 @@ def start_translation(client_id):
         failed_count = 0
         translated_materials = []  # 存储翻译结果
         
+        # bulk模式下LaTeX生成通过离线批量接口提交，接口立即返回，结果在后台写回材料
+        options = request.get_json(silent=True) or {}
+        bulk_mode = options.get('latex_mode') == 'bulk' or request.args.get('latex_mode') == 'bulk'
+        # LaTeX生成方式：vision（默认，上传图像）、text（只使用OCR文本块）或 structured（JSON+本地模板）；bulk模式始终使用vision
+        latex_generation = options.get('latex_generation') or request.args.get('latex_generation')
+        # 草稿模式：先返回翻译图片生成的草稿PDF，正式LaTeX版本在后台生成（latex_draft=false 时同步等待）
+        draft_option = options.get('latex_draft', request.args.get('latex_draft'))
+        draft_mode = POSTER_DRAFT_TIER if draft_option is None else str(draft_option).lower() in ('1', 'true', 'yes')
+        bulk_items = []
+        final_jobs = []
+        
         for material in materials:
             log_message(f"检查材料: {material.name}, 状态: {material.status}", "INFO")
             if material.status == '已上传':  # 只翻译未翻译的材料
@@ -2430,7 +6521,6 @@ def start_translation(client_id):
                         if result.get('translated_image'):
                             material.translated_image_path = result['translated_image']
                         if result.get('text_info'):
-                            import json
                             material.translation_text_info = json.dumps(result['text_info'], ensure_ascii=False)
                         material.translation_error = None
                         translated_count += 1
@@ -2445,29 +6535,57 @@ def start_translation(client_id):
                             
                             # 生成输出文件名
                             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                            output_base_name = f"poster_output/latex_{material.id}_{timestamp}"
+                            output_base_name = f"poster_output/latex_{material.id}_{timestamp}_{uuid.uuid4().hex[:8]}"
                             
-                            # 调用LaTeX翻译
-                            latex_result = poster_translator.translate_poster_complete(
-                                image_path=image_path_for_latex,
-                                output_base_name=output_base_name,
-                                clean_aux=True
-                            )
-                            
-                            if latex_result['success']:
-                                # 保存LaTeX翻译结果到数据库
+                            if bulk_mode:
+                                # 批量模式：先收集请求，循环结束后统一提交
+                                # 批量请求固定按视觉方式构建（上传图像），模型也按视觉模式路由
+                                bulk_items.append({
+                                    'custom_id': f"material_{material.id}",
+                                    'material_id': material.id,
+                                    'model': poster_translator.route_poster(
+                                        image_path_for_latex, result.get('text_info'), mode='vision'
+                                    )['model'],
+                                    'image_path': image_path_for_latex,
+                                    'output_base_name': output_base_name,
+                                    'build_key': f"material_{material.id}"
+                                })
+                                material.latex_translation_error = None
+                            elif draft_mode:
+                                # 草稿模式：立即生成草稿预览，正式版本在提交事务后交给后台线程池
+                                draft_result = poster_translator.render_draft(
+                                    image_path_for_latex, f"poster_output/draft_{material.id}_{timestamp}_{uuid.uuid4().hex[:8]}"
+                                )
                                 material.latex_translation_result = json.dumps({
-                                    'tex_file': latex_result.get('tex_file'),
-                                    'pdf_file': latex_result.get('pdf_file'),
-                                    'latex_code_length': latex_result.get('latex_code_length', 0)
+                                    'draft': True,
+                                    'tex_file': None,
+                                    'pdf_file': draft_result['pdf_file'],
+                                    'thumbnails': draft_result['thumbnails']
                                 }, ensure_ascii=False)
                                 material.latex_translation_error = None
-                                log_message(f"LaTeX翻译完成: {material.name}", "SUCCESS")
-                                log_message(f"  - LaTeX文件: {latex_result.get('tex_file')}", "INFO")
-                                log_message(f"  - PDF文件: {latex_result.get('pdf_file')}", "INFO")
+                                final_jobs.append({
+                                    'material_id': material.id,
+                                    'draft_pdf': draft_result['pdf_file'],
+                                    'image_path': image_path_for_latex,
+                                    'output_base_name': output_base_name,
+                                    'clean_aux': True,
+                                    'build_key': f"material_{material.id}",
+                                    'text_info': result.get('text_info'),
+                                    'generation_mode': latex_generation
+                                })
                             else:
-                                material.latex_translation_error = latex_result.get('error', 'LaTeX翻译失败')
-                                log_message(f"LaTeX翻译失败: {material.name} - {latex_result.get('error', '未知错误')}", "ERROR")
+                                # 调用LaTeX翻译
+                                latex_result = poster_translator.translate_poster_complete(
+                                    image_path=image_path_for_latex,
+                                    output_base_name=output_base_name,
+                                    clean_aux=True,
+                                    build_key=f"material_{material.id}",
+                                    text_info=result.get('text_info'),
+                                    generation_mode=latex_generation
+                                )
+                                
+                                # 保存LaTeX翻译结果到数据库
+                                apply_latex_result_to_material(material, latex_result)
                                 
                         except Exception as latex_e:
                             material.latex_translation_error = str(latex_e)
@@ -2497,12 +6615,30 @@ def start_translation(client_id):
         
         db.session.commit()
         
+        for job in final_jobs:
+            poster_final_executor.submit(finish_latex_in_background, **job)
+        
+        latex_batch = None
+        if bulk_items:
+            try:
+                job = poster_batch_processor.start(bulk_items, apply_batch_latex_result, owner=str(user_id))
+                latex_batch = {'job_id': job['id'], 'batch_id': job['batch_id'], 'count': len(bulk_items)}
+            except Exception as e:
+                log_message(f"提交LaTeX批量任务失败: {str(e)}", "ERROR")
+                for item in bulk_items:
+                    material = Material.query.get(item['material_id'])
+                    if material:
+                        material.latex_translation_error = f"批量任务提交失败: {str(e)}"
+                db.session.commit()
+        
         return jsonify({
             'success': True,
             'message': f'翻译完成：成功 {translated_count} 个，失败 {failed_count} 个',
             'translated_count': translated_count,
             'failed_count': failed_count,
-            'translated_materials': translated_materials  # 直接返回翻译结果
+            'translated_materials': translated_materials,  # 直接返回翻译结果
+            'latex_batch': latex_batch,
+            'latex_pending': len(final_jobs)
         })
         
     except Exception as e:
@@ -2539,6 +6675,8 @@ def cancel_upload(client_id):
                     except Exception as e:
                         log_message(f"删除文件失败: {material.file_path} - {str(e)}", "WARNING")
                 
+                poster_translator.build_dirs.remove(f"material_{material.id}")
+                
                 # 删除数据库记录
                 db.session.delete(material)
                 deleted_count += 1
@@ -2624,6 +6762,54 @@ def preview_poster_file(filename):
         log_message(f"PDF预览失败: {str(e)}", "ERROR")
         return jsonify({'error': '预览失败'}), 500
 
+@app.route('/preview/poster/<filename>/thumbnail')
+def preview_poster_thumbnail(filename):
+    """预览LaTeX生成PDF的缩略图，参数 size=small/medium/large，page 默认为1"""
+    try:
+        file_path = os.path.join('poster_output', os.path.basename(filename))
+        if not filename.lower().endswith('.pdf') or not os.path.exists(file_path):
+            return jsonify({'error': '文件不存在'}), 404
+        
+        thumbnailer = poster_translator.thumbnailer
+        if not thumbnailer:
+            return jsonify({'error': '缩略图功能未启用'}), 404
+        
+        size = request.args.get('size', 'small')
+        page = request.args.get('page', 1, type=int)
+        if size not in PDFThumbnailer.SIZES:
+            return jsonify({'error': f'不支持的尺寸: {size}'}), 400
+        
+        # 编译时通常已生成，旧的PDF在首次访问时补生成
+        manifest = thumbnailer.generate(file_path)
+        if not manifest or page < 1 or page > manifest['pages']:
+            return jsonify({'error': '缩略图不可用'}), 404
+        
+        # 同名PDF可能被重新编译，这里只允许协商缓存；按内容寻址的URL见 thumbnails.urls
+        response = send_file(
+            thumbnailer.thumbnail_path(manifest['digest'], page, size),
+            mimetype=f"image/{manifest['format']}",
+            conditional=True
+        )
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+    except Exception as e:
+        log_message(f"缩略图预览失败: {str(e)}", "ERROR")
+        return jsonify({'error': '预览失败'}), 500
+
+@app.route('/preview/thumbnail/<digest>/<name>')
+def preview_thumbnail_by_digest(digest, name):
+    """按PDF内容哈希访问缩略图，内容不变，可长期缓存"""
+    if not re.fullmatch(r'[0-9a-f]{32}', digest) or not re.fullmatch(r'p\d+_[a-z]+\.(?:webp|png)', name):
+        return jsonify({'error': '文件不存在'}), 404
+    
+    file_path = os.path.join(PDF_THUMBNAIL_DIR, digest, name)
+    if not os.path.exists(file_path):
+        return jsonify({'error': '文件不存在'}), 404
+    
+    response = send_file(file_path, mimetype=f"image/{name.rsplit('.', 1)[1]}", conditional=True)
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
+
 @app.route('/download/web/<filename>')
 def download_web_file(filename):
     try:
@@ -2698,6 +6884,36 @@ def init_database():
         except Exception as e:
             log_message(f"数据库初始化失败: {str(e)}", "ERROR")
 
+# ========== 后台服务 ========== 
+
+_background_services_started = False
+_background_services_lock = threading.Lock()
+
+def start_background_services():
+    """
+    启动后台服务：环境检查、浏览器池预热、恢复未完成的LaTeX批量任务
+
+    只执行一次，重复调用直接返回False。直接运行本文件时在启动服务前调用；
+    由其他启动脚本或WSGI服务器导入 app 时，在处理第一个请求前调用。
+    """
+    global _background_services_started
+    with _background_services_lock:
+        if _background_services_started:
+            return False
+        _background_services_started = True
+    # 启动时在后台完成一次环境检查，接口直接使用缓存结果
+    environment_probe.refresh_async()
+    # 预热浏览器池，第一个网页翻译请求不必等待Chrome冷启动
+    chrome_pool.warm_async()
+    # 继续处理重启前提交、尚未处理完的LaTeX批量任务
+    poster_batch_processor.resume_pending(apply_batch_latex_result)
+    return True
+
+@app.before_request
+def ensure_background_services():
+    if not _background_services_started:
+        start_background_services()
+
 # ========== 错误处理 ========== 
 
 @app.errorhandler(404)
@@ -2776,4 +6992,9 @@ if __name__ == '__main__':
         except Exception:
             pass  # 列已存在
     
-    app.run(debug=True, host='0.0.0.0', port=5000)
+    debug = os.getenv('FLASK_DEBUG', '0').lower() in ('1', 'true', 'yes')
+    # debug模式下重载器的父进程只负责监视文件，后台任务只在实际提供服务的子进程中启动
+    if not debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_background_services()
+    
+    app.run(debug=debug, host='0.0.0.0', port=5000)
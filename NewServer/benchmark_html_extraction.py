@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+智能文书翻译平台 - 网页正文提取基准测试脚本
+
+对一组保存下来的真实网页分别用各提取后端（lxml / stdlib / bs4）测量：
+1. 每页提取耗时和吞吐量
+2. Python堆内存峰值（单独一轮，tracemalloc 的开销不计入耗时）
+3. 输出是否与 bs4 原实现一致
+4. 语料来自网页抓取缓存时，提取耗时与当时抓取该网页耗时的比例
+5. 正文提取（extract_main）的耗时和翻译token的减少比例
+
+语料可以是网页抓取缓存目录（默认 web_fetch_cache，读取每个网址最近一次抓取的原始字节），
+也可以是任意包含 .html/.htm 文件的目录。
+
+用法:
+    python benchmark_html_extraction.py [语料目录] --runs 5 --backends lxml stdlib bs4 --json result.json
+"""
+
+import argparse
+import glob
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+from app_full_translation import HTMLTextExtractor, LXML_AVAILABLE, estimate_tokens
+
+
+def load_corpus(corpus_dir):
+    """返回 [(名称, 原始字节, Content-Type, 抓取耗时)]"""
+    pages = []
+    capture_dir = os.path.join(corpus_dir, 'captures')
+    if os.path.isdir(capture_dir):
+        for meta_path in sorted(glob.glob(os.path.join(corpus_dir, '*.json'))):
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            capture = next((c for c in meta.get('captures', []) if c['capture_id'] == meta.get('capture_id')), None)
+            body_path = os.path.join(capture_dir, f"{meta.get('capture_id')}.body")
+            if capture is None or not os.path.exists(body_path):
+                continue
+            content_type = meta.get('headers', {}).get('content-type', '')
+            if content_type and 'html' not in content_type:
+                continue
+            with open(body_path, 'rb') as f:
+                pages.append((meta['url'], f.read(), content_type, capture.get('fetch_seconds')))
+    else:
+        for path in sorted(glob.glob(os.path.join(corpus_dir, '*.htm*'))):
+            with open(path, 'rb') as f:
+                pages.append((os.path.basename(path), f.read(), None, None))
+    return pages
+
+
+def percentile(values, ratio):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * ratio))] if ordered else 0
+
+
+def benchmark_backend(extractor, pages, runs):
+    """测量一个后端：逐页取多次运行的最小耗时，另跑一轮统计内存峰值"""
+    outputs = {}
+    timings = []
+    for name, content, content_type, _ in pages:
+        best = None
+        for _ in range(runs):
+            start = time.perf_counter()
+            text = extractor.extract(content, content_type)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        outputs[name] = text
+        timings.append(best)
+
+    peak = 0
+    for name, content, content_type, _ in pages:
+        tracemalloc.start()
+        extractor.extract(content, content_type)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return timings, peak, outputs
+
+
+def main():
+    parser = argparse.ArgumentParser(description='网页正文提取基准测试')
+    parser.add_argument('corpus', nargs='?', default='web_fetch_cache',
+                        help='网页抓取缓存目录或包含 .html 文件的目录（默认 web_fetch_cache）')
+    parser.add_argument('--runs', type=int, default=5, help='每页重复次数（取最小值）')
+    parser.add_argument('--backends', nargs='+', default=['lxml', 'stdlib', 'bs4'],
+                        help='要比较的提取后端')
+    parser.add_argument('--json', dest='json_path', help='将结果写入JSON文件')
+    args = parser.parse_args()
+
+    pages = load_corpus(args.corpus)
+    if not pages:
+        print(f"❌ 在 {args.corpus} 中未找到网页")
+        sys.exit(1)
+
+    total_bytes = sum(len(content) for _, content, _, _ in pages)
+    print(f"📄 语料: {len(pages)} 个网页, 共 {total_bytes / 1024 / 1024:.1f} MB, 每页重复 {args.runs} 次")
+
+    reference = None
+    if 'bs4' in args.backends:
+        reference = {name: HTMLTextExtractor('bs4').extract(content, content_type)
+                     for name, content, content_type, _ in pages}
+
+    results = {}
+    for backend_name in args.backends:
+        if backend_name == 'lxml' and not LXML_AVAILABLE:
+            print("⚠️ 未安装lxml，跳过 lxml 后端")
+            continue
+        extractor = HTMLTextExtractor(backend_name)
+        timings, peak, outputs = benchmark_backend(extractor, pages, args.runs)
+
+        ratios = [timing / fetch_seconds for timing, (_, _, _, fetch_seconds) in zip(timings, pages) if fetch_seconds]
+        mismatches = [name for name in outputs if reference is not None and outputs[name] != reference[name]]
+        results[backend_name] = {
+            'pages': len(pages),
+            'total_seconds': sum(timings),
+            'median_ms': statistics.median(timings) * 1000,
+            'p95_ms': percentile(timings, 0.95) * 1000,
+            'throughput_mb_s': total_bytes / 1024 / 1024 / sum(timings) if sum(timings) else 0,
+            'peak_python_mb': peak / 1024 / 1024,
+            'fetch_ratio_median': statistics.median(ratios) if ratios else None,
+            'mismatches': mismatches,
+        }
+
+    print()
+    print(f"{'后端':<8}{'中位(ms)':>10}{'P95(ms)':>10}{'MB/s':>8}{'内存峰值(MB)':>14}{'占抓取时间':>12}{'不一致':>8}")
+    for backend_name, r in results.items():
+        fetch_ratio = f"{r['fetch_ratio_median'] * 100:.2f}%" if r['fetch_ratio_median'] is not None else '-'
+        print(f"{backend_name:<8}{r['median_ms']:>10.2f}{r['p95_ms']:>10.2f}{r['throughput_mb_s']:>8.1f}"
+              f"{r['peak_python_mb']:>14.1f}{fetch_ratio:>12}{len(r['mismatches']):>8}")
+    for backend_name, r in results.items():
+        for name in r['mismatches'][:5]:
+            print(f"⚠️ {backend_name} 输出与 bs4 不一致: {name}")
+
+    # 正文提取：默认后端下每页的耗时和token减少比例
+    extractor = HTMLTextExtractor()
+    main_timings, reductions, fallbacks = [], [], 0
+    for name, content, content_type, _ in pages:
+        start = time.perf_counter()
+        extracted = extractor.extract_main(content, content_type)
+        main_timings.append(time.perf_counter() - start)
+        full_tokens = estimate_tokens(extracted['full_text'])
+        if extracted['mode'] != 'main':
+            fallbacks += 1
+        elif full_tokens:
+            reductions.append(1 - estimate_tokens(extracted['text']) / full_tokens)
+    results['main_content'] = {
+        'backend': extractor.backend,
+        'median_ms': statistics.median(main_timings) * 1000,
+        'token_reduction_median': statistics.median(reductions) if reductions else None,
+        'fallbacks': fallbacks,
+    }
+    reduction = results['main_content']['token_reduction_median']
+    print()
+    print(f"📰 正文提取（{extractor.backend}）: 中位耗时 {results['main_content']['median_ms']:.2f} ms, "
+          f"token减少中位数 {f'{reduction * 100:.1f}%' if reduction is not None else '-'}, "
+          f"退回整页 {fallbacks}/{len(pages)}")
+
+    if args.json_path:
+        with open(args.json_path, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"✅ 结果已写入 {args.json_path}")
+
+
+if __name__ == '__main__':
+    main()
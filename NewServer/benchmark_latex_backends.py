@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+智能文书翻译平台 - LaTeX编译后端基准测试脚本
+
+对一组海报LaTeX文件分别用 pdflatex 和 latexmk 后端测量：
+1. 冷编译：全新的持久构建目录中首次编译
+2. 编辑后重新编译：在同一构建目录中修改一行正文后再次编译
+
+用法:
+    python benchmark_latex_backends.py [语料目录] --runs 3 --backends pdflatex latexmk --json result.json
+"""
+
+import argparse
+import glob
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+# 基准测试测量的是真实编译时间，关闭编译结果缓存
+os.environ['LATEX_PDF_CACHE'] = '0'
+
+from app_full_translation import PosterTranslator
+
+
+def make_edit(tex_path, run_index):
+    """在 \\end{document} 前插入一行内容，模拟用户的小幅编辑"""
+    with open(tex_path, 'r', encoding='utf-8') as f:
+        content = f.read()
+    marker = '\\end{document}'
+    edit = f'\n% benchmark edit {run_index}\n\\mbox{{}}\n'
+    if marker in content:
+        content = content.replace(marker, edit + marker, 1)
+    else:
+        content += edit
+    with open(tex_path, 'w', encoding='utf-8') as f:
+        f.write(content)
+
+
+def benchmark_file(translator, tex_path, work_dir, run_index):
+    """对单个文件测量一次冷编译和一次编辑后重新编译"""
+    name = os.path.splitext(os.path.basename(tex_path))[0]
+    job_tex = os.path.join(work_dir, f"{name}.tex")
+    shutil.copyfile(tex_path, job_tex)
+    build_key = f"bench_{translator.backend.name}_{name}_{run_index}"
+
+    start = time.perf_counter()
+    cold = translator.compile_tex_with_report(job_tex, build_key=build_key)
+    cold_time = time.perf_counter() - start
+
+    make_edit(job_tex, run_index)
+    start = time.perf_counter()
+    warm = translator.compile_tex_with_report(job_tex, build_key=build_key)
+    warm_time = time.perf_counter() - start
+
+    # 清理本次使用的持久构建目录
+    persistent_dir, _ = translator._get_persistent_build_dir(build_key)
+    shutil.rmtree(persistent_dir, ignore_errors=True)
+
+    return {
+        'cold_time': cold_time,
+        'cold_passes': cold['passes'],
+        'edit_time': warm_time,
+        'edit_passes': warm['passes'],
+    }
+
+
+def summarize(samples, key):
+    values = [s[key] for s in samples]
+    return statistics.median(values) if values else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='LaTeX编译后端基准测试')
+    parser.add_argument('corpus', nargs='?', default='poster_output',
+                        help='包含 .tex 文件的目录（默认 poster_output）')
+    parser.add_argument('--runs', type=int, default=3, help='每个文件重复次数')
+    parser.add_argument('--backends', nargs='+', default=['pdflatex', 'latexmk'],
+                        help='要比较的编译后端')
+    parser.add_argument('--json', dest='json_path', help='将结果写入JSON文件')
+    args = parser.parse_args()
+
+    tex_files = sorted(glob.glob(os.path.join(args.corpus, '*.tex')))
+    if not tex_files:
+        print(f"❌ 在 {args.corpus} 中未找到 .tex 文件")
+        sys.exit(1)
+
+    print(f"📄 语料: {len(tex_files)} 个文件, 每个重复 {args.runs} 次")
+    results = {}
+
+    for backend_name in args.backends:
+        translator = PosterTranslator(backend=backend_name)
+        if translator.backend.name != backend_name:
+            print(f"⚠️ 后端 {backend_name} 不可用，跳过")
+            continue
+
+        samples = []
+        failures = 0
+        with tempfile.TemporaryDirectory(prefix='latex_bench_') as work_dir:
+            for run_index in range(args.runs):
+                for tex_path in tex_files:
+                    try:
+                        samples.append(benchmark_file(translator, tex_path, work_dir, run_index))
+                    except Exception as e:
+                        failures += 1
+                        print(f"❌ {backend_name} 编译 {tex_path} 失败: {e}")
+
+        results[backend_name] = {
+            'samples': len(samples),
+            'failures': failures,
+            'cold_time_median': summarize(samples, 'cold_time'),
+            'cold_passes_median': summarize(samples, 'cold_passes'),
+            'edit_time_median': summarize(samples, 'edit_time'),
+            'edit_passes_median': summarize(samples, 'edit_passes'),
+        }
+
+    print()
+    print(f"{'后端':<10}{'样本':>6}{'失败':>6}{'冷编译(s)':>12}{'遍数':>6}{'编辑后(s)':>12}{'遍数':>6}")
+    for backend_name, r in results.items():
+        print(f"{backend_name:<10}{r['samples']:>6}{r['failures']:>6}"
+              f"{r['cold_time_median']:>12.2f}{r['cold_passes_median']:>6}"
+              f"{r['edit_time_median']:>12.2f}{r['edit_passes_median']:>6}")
+
+    if args.json_path:
+        with open(args.json_path, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"✅ 结果已写入 {args.json_path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,30 @@
+"""
+单元测试的公共设置
+
+app_full_translation 在导入时会创建数据库、翻译记忆、各类缓存和输出目录。
+这里在任何测试模块导入它之前切换到临时工作目录，并把数据库和缓存路径指向该目录，
+测试不会在源码目录中留下文件。
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+
+SERVER_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, SERVER_DIR)
+
+_ORIGINAL_CWD = os.getcwd()
+TEST_WORK_DIR = tempfile.mkdtemp(prefix='translation_platform_test_')
+
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(TEST_WORK_DIR, 'translation_platform.db')}"
+os.environ['TM_DB_PATH'] = os.path.join(TEST_WORK_DIR, 'translation_memory.db')
+os.environ['WEB_CACHE_DIR'] = os.path.join(TEST_WORK_DIR, 'web_fetch_cache')
+os.environ['LATEX_PERSISTENT_BUILD_DIR'] = os.path.join(TEST_WORK_DIR, 'latex_persistent_builds')
+os.environ['LATEX_SCRATCH_DIR'] = os.path.join(TEST_WORK_DIR, 'latex_builds')
+os.chdir(TEST_WORK_DIR)
+
+
+def pytest_unconfigure(config):
+    os.chdir(_ORIGINAL_CWD)
+    shutil.rmtree(TEST_WORK_DIR, ignore_errors=True)
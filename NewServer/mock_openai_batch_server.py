@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""
+智能文书翻译平台 - OpenAI Batch API 本地替身服务
+
+实现离线批量生成用到的 /v1/files 和 /v1/batches 接口，不调用真实模型，
+每条请求返回一份可编译的简单LaTeX文档。用于在本地联调批量模式：
+
+    python mock_openai_batch_server.py --port 5055 --delay 3
+    OPENAI_BATCH_BASE_URL=http://localhost:5055/v1 python app_full_translation.py
+
+custom_id 出现在 --fail 列表中的请求返回错误，用于测试失败路径。
+"""
+
+import argparse
+import json
+import threading
+import time
+import uuid
+
+from flask import Flask, Response, jsonify, request
+
+app = Flask(__name__)
+
+FILES = {}
+BATCHES = {}
+LOCK = threading.Lock()
+SETTINGS = {'delay': 3.0, 'fail_ids': set()}
+
+MOCK_LATEX = r"""\documentclass{article}
+\usepackage[margin=1in]{geometry}
+\begin{document}
+\begin{center}
+{\Large \textbf{Mock Poster}}\\[1em]
+Request: %s
+\end{center}
+\end{document}
+"""
+
+
+def _new_id(prefix):
+    return f"{prefix}-{uuid.uuid4().hex[:24]}"
+
+
+def _store_file(filename, purpose, content):
+    file_id = _new_id('file')
+    with LOCK:
+        FILES[file_id] = {
+            'meta': {
+                'id': file_id,
+                'object': 'file',
+                'bytes': len(content),
+                'created_at': int(time.time()),
+                'filename': filename,
+                'purpose': purpose,
+                'status': 'processed'
+            },
+            'content': content
+        }
+    return FILES[file_id]['meta']
+
+
+def _mock_response(record):
+    """为一条批量请求生成响应行"""
+    custom_id = record['custom_id']
+    if custom_id in SETTINGS['fail_ids']:
+        return {
+            'id': _new_id('batch_req'),
+            'custom_id': custom_id,
+            'response': {
+                'status_code': 500,
+                'request_id': uuid.uuid4().hex,
+                'body': {'error': {'message': 'mock failure', 'type': 'server_error'}}
+            },
+            'error': None
+        }
+    model = record.get('body', {}).get('model', 'gpt-4o')
+    return {
+        'id': _new_id('batch_req'),
+        'custom_id': custom_id,
+        'response': {
+            'status_code': 200,
+            'request_id': uuid.uuid4().hex,
+            'body': {
+                'id': _new_id('chatcmpl'),
+                'object': 'chat.completion',
+                'created': int(time.time()),
+                'model': model,
+                'choices': [{
+                    'index': 0,
+                    'message': {'role': 'assistant', 'content': MOCK_LATEX % custom_id.replace('_', r'\_')},
+                    'finish_reason': 'stop'
+                }]
+            }
+        },
+        'error': None
+    }
+
+
+def _process_batch(batch_id):
+    """模拟批量任务的执行过程：validating -> in_progress -> completed"""
+    time.sleep(SETTINGS['delay'] / 2)
+    with LOCK:
+        batch = BATCHES[batch_id]
+        if batch['status'] == 'cancelling':
+            batch['status'] = 'cancelled'
+            return
+        batch['status'] = 'in_progress'
+        batch['in_progress_at'] = int(time.time())
+        input_content = FILES[batch['input_file_id']]['content']
+
+    records = [json.loads(line) for line in input_content.decode('utf-8').splitlines() if line.strip()]
+    time.sleep(SETTINGS['delay'] / 2)
+
+    lines = [_mock_response(record) for record in records]
+    failed = sum(1 for line in lines if line['response']['status_code'] != 200)
+    output = '\n'.join(json.dumps(line, ensure_ascii=False) for line in lines).encode('utf-8')
+    output_file = _store_file(f"{batch_id}_output.jsonl", 'batch_output', output)
+
+    with LOCK:
+        batch = BATCHES[batch_id]
+        if batch['status'] == 'cancelling':
+            batch['status'] = 'cancelled'
+            return
+        batch.update({
+            'status': 'completed',
+            'output_file_id': output_file['id'],
+            'completed_at': int(time.time()),
+            'request_counts': {'total': len(records), 'completed': len(records) - failed, 'failed': failed}
+        })
+
+
+@app.route('/v1/files', methods=['POST'])
+def create_file():
+    upload = request.files.get('file')
+    if upload is None:
+        return jsonify({'error': {'message': 'file is required'}}), 400
+    meta = _store_file(upload.filename or 'upload.jsonl', request.form.get('purpose', 'batch'), upload.read())
+    return jsonify(meta)
+
+
+@app.route('/v1/files/<file_id>', methods=['GET'])
+def retrieve_file(file_id):
+    if file_id not in FILES:
+        return jsonify({'error': {'message': 'file not found'}}), 404
+    return jsonify(FILES[file_id]['meta'])
+
+
+@app.route('/v1/files/<file_id>/content', methods=['GET'])
+def file_content(file_id):
+    if file_id not in FILES:
+        return jsonify({'error': {'message': 'file not found'}}), 404
+    return Response(FILES[file_id]['content'], mimetype='application/jsonl')
+
+
+@app.route('/v1/batches', methods=['POST'])
+def create_batch():
+    data = request.get_json() or {}
+    input_file_id = data.get('input_file_id')
+    if input_file_id not in FILES:
+        return jsonify({'error': {'message': 'input file not found'}}), 400
+
+    batch_id = _new_id('batch')
+    batch = {
+        'id': batch_id,
+        'object': 'batch',
+        'endpoint': data.get('endpoint', '/v1/chat/completions'),
+        'errors': None,
+        'input_file_id': input_file_id,
+        'completion_window': data.get('completion_window', '24h'),
+        'status': 'validating',
+        'output_file_id': None,
+        'error_file_id': None,
+        'created_at': int(time.time()),
+        'in_progress_at': None,
+        'completed_at': None,
+        'request_counts': {'total': 0, 'completed': 0, 'failed': 0},
+        'metadata': data.get('metadata')
+    }
+    with LOCK:
+        BATCHES[batch_id] = batch
+    threading.Thread(target=_process_batch, args=(batch_id,), daemon=True).start()
+    return jsonify(batch)
+
+
+@app.route('/v1/batches/<batch_id>', methods=['GET'])
+def retrieve_batch(batch_id):
+    with LOCK:
+        batch = BATCHES.get(batch_id)
+        if not batch:
+            return jsonify({'error': {'message': 'batch not found'}}), 404
+        return jsonify(batch)
+
+
+@app.route('/v1/batches/<batch_id>/cancel', methods=['POST'])
+def cancel_batch(batch_id):
+    with LOCK:
+        batch = BATCHES.get(batch_id)
+        if not batch:
+            return jsonify({'error': {'message': 'batch not found'}}), 404
+        if batch['status'] in ('validating', 'in_progress'):
+            batch['status'] = 'cancelling'
+        return jsonify(batch)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='OpenAI Batch API 本地替身服务')
+    parser.add_argument('--port', type=int, default=5055)
+    parser.add_argument('--delay', type=float, default=3.0, help='每个批量任务模拟的处理时间（秒）')
+    parser.add_argument('--fail', nargs='*', default=[], help='返回错误的 custom_id 列表')
+    args = parser.parse_args()
+
+    SETTINGS['delay'] = args.delay
+    SETTINGS['fail_ids'] = set(args.fail)
+    print(f"🚀 OpenAI Batch 替身服务: http://localhost:{args.port}/v1")
+    app.run(host='127.0.0.1', port=args.port, threaded=True)
+
+
+if __name__ == '__main__':
+    main()
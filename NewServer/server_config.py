@@ -78,6 +78,8 @@ CHROME_CONFIG = {
 LATEX_CONFIG = {
     "pdflatex_path": "/usr/bin/pdflatex",  # Linux pdflatex路径
     "latexmk_path": "/usr/bin/latexmk",
+    "backend": "pdflatex",  # 编译后端: pdflatex 或 latexmk（增量编译）
+    "pdftoppm_path": "/usr/bin/pdftoppm",  # poppler-utils，用于生成PDF预览缩略图
     "texlive_path": "/usr/share/texlive",
     "miktex_path": None,  # Linux通常使用TeX Live
     "output_dir": LATEX_DIR,
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+智能文书翻译平台 - 浏览器池和后台服务启动单元测试
+
+浏览器用替身代替，不需要安装Chrome。
+
+用法:
+    python -m pytest test_browser_pool.py -v
+"""
+
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+import app_full_translation
+from app_full_translation import ChromePool
+
+
+class FakeDriver:
+    """ChromePool 用到的 WebDriver 方法的替身"""
+
+    def __init__(self):
+        self.window_handles = ['main']
+        self.switch_to = SimpleNamespace(window=lambda handle: None)
+        self.closed = False
+
+    def execute_cdp_cmd(self, command, params):
+        return {}
+
+    def execute_script(self, script):
+        return 1
+
+    def delete_all_cookies(self):
+        pass
+
+    def set_page_load_timeout(self, seconds):
+        pass
+
+    def get(self, url):
+        pass
+
+    def get_log(self, name):
+        return []
+
+    def quit(self):
+        self.closed = True
+
+
+class ChromePoolPageCountTest(unittest.TestCase):
+    """实例按加载的页面数回收"""
+
+    def setUp(self):
+        patcher = mock.patch.object(app_full_translation, 'SELENIUM_AVAILABLE', True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.pool = ChromePool(size=1, max_pages=3)
+        self.pool._create = lambda: {'driver': FakeDriver(), 'pages': 0, 'created_at': 0}
+
+    def lease_and_load(self, pages):
+        with self.pool.lease() as driver:
+            for _ in range(pages):
+                self.pool.count_page(driver)
+        return driver
+
+    def test_pages_counted_per_load(self):
+        driver = self.lease_and_load(2)
+        self.assertEqual(self.pool.idle[0]['pages'], 2)
+        self.assertIs(self.lease_and_load(0), driver)
+        self.assertEqual(self.pool.idle[0]['pages'], 2)
+        self.assertEqual(self.pool.leased, {})
+
+    def test_recycled_after_max_page_loads(self):
+        first = self.lease_and_load(2)
+        self.assertFalse(first.closed)
+        self.assertIs(self.lease_and_load(2), first)
+        self.assertTrue(first.closed)
+        self.assertEqual(self.pool.stats()['recycled'], 1)
+        self.assertIsNot(self.lease_and_load(1), first)
+
+    def test_count_page_ignores_drivers_not_leased(self):
+        self.pool.count_page(FakeDriver())
+        self.assertEqual(self.pool.leased, {})
+
+
+class BackgroundServicesTest(unittest.TestCase):
+    """后台服务只启动一次"""
+
+    def test_started_once(self):
+        with mock.patch.object(app_full_translation, '_background_services_started', False), \
+                mock.patch.object(app_full_translation, 'environment_probe') as probe, \
+                mock.patch.object(app_full_translation, 'chrome_pool') as pool, \
+                mock.patch.object(app_full_translation, 'poster_batch_processor') as batches:
+            self.assertTrue(app_full_translation.start_background_services())
+            self.assertFalse(app_full_translation.start_background_services())
+        probe.refresh_async.assert_called_once()
+        pool.warm_async.assert_called_once()
+        batches.resume_pending.assert_called_once_with(app_full_translation.apply_batch_latex_result)
+
+
+if __name__ == '__main__':
+    unittest.main()
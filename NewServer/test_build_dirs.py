@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+智能文书翻译平台 - 持久构建目录单元测试
+
+用法:
+    python -m pytest test_build_dirs.py -v
+"""
+
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from app_full_translation import PersistentBuildDirs
+
+
+class PersistentBuildDirsTest(unittest.TestCase):
+    """构建目录的淘汰和锁的清理"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.dirs = PersistentBuildDirs(root=self.tmp_dir, max_dirs=100, max_bytes=10 ** 9, ttl=3600)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def make_old(self, key, age):
+        with self.dirs.hold(key) as build_dir:
+            pass
+        stamp = time.time() - age
+        os.utime(build_dir, (stamp, stamp))
+        return build_dir
+
+    def test_swept_directory_drops_its_lock(self):
+        old_dir = self.make_old('material_1', 7200)
+        self.make_old('material_2', 10)
+        self.dirs.sweep()
+        self.assertFalse(os.path.exists(old_dir))
+        self.assertEqual(set(self.dirs.locks), {'material_2'})
+        self.assertEqual(self.dirs.evictions, 1)
+
+    def test_locked_directory_is_not_swept(self):
+        old_dir = self.make_old('material_1', 7200)
+        build_dir, lock = self.dirs.acquire('material_1')
+        try:
+            os.utime(build_dir, (time.time() - 7200,) * 2)
+            thread = threading.Thread(target=self.dirs.sweep)
+            thread.start()
+            thread.join(5)
+            self.assertTrue(os.path.exists(old_dir))
+            self.assertIn('material_1', self.dirs.locks)
+        finally:
+            lock.release()
+
+    def test_remove_drops_lock(self):
+        build_dir = self.make_old('material_3', 0)
+        self.assertTrue(self.dirs.remove('material_3'))
+        self.assertFalse(os.path.exists(build_dir))
+        self.assertEqual(self.dirs.locks, {})
+
+    def test_waiter_switches_to_new_lock_after_removal(self):
+        build_dir, lock = self.dirs.acquire('material_4')
+        acquired = []
+
+        def waiter():
+            with self.dirs.hold('material_4') as path:
+                acquired.append((path, self.dirs.locks['material_4']))
+
+        thread = threading.Thread(target=waiter)
+        thread.start()
+        time.sleep(0.05)
+        # 持有锁的线程删除目录（可重入），等待旧锁的线程随后改用新锁并重新创建目录
+        self.assertTrue(self.dirs.remove('material_4'))
+        lock.release()
+        thread.join(5)
+        self.assertEqual(len(acquired), 1)
+        self.assertEqual(acquired[0][0], build_dir)
+        self.assertIsNot(acquired[0][1], lock)
+        self.assertTrue(os.path.isdir(build_dir))
+
+    def test_sweep_runs_once_per_interval(self):
+        self.make_old('material_5', 7200)
+        self.dirs._last_sweep = 0
+        with self.dirs.hold('material_6'):
+            pass
+        self.assertFalse(os.path.exists(os.path.join(self.tmp_dir, 'material_5')))
+        self.make_old('material_7', 7200)
+        with self.dirs.hold('material_8'):
+            pass
+        self.assertTrue(os.path.exists(os.path.join(self.tmp_dir, 'material_7')))
+
+if __name__ == '__main__':
+    unittest.main()
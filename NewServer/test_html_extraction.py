@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+智能文书翻译平台 - 网页文本提取单元测试
+
+用法:
+    python -m pytest test_html_extraction.py -v
+"""
+
+import unittest
+
+from app_full_translation import LXML_AVAILABLE, HTMLTextExtractor
+
+ARTICLE_HTML = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>Budget approved</title>
+<style>body { color: red }</style><script>var tracking = 1;</script></head>
+<body>
+<nav class="menu"><a href="/">Home</a> <a href="/news">News</a> <a href="/about">About us</a></nav>
+<div class="cookie-consent">We use cookies to improve your experience. <button>Accept</button></div>
+<div id="content" class="article-body">
+<h1>Budget approved</h1>
+<p>The city council approved the annual budget on Monday, after a long debate about transport, schools, and housing.</p>
+<p>Spending on public transport will rise by ten percent, while the school renovation programme will continue for another three years.</p>
+<p>The mayor said the budget balances ambition with prudence, and that residents will see the first improvements before the summer.</p>
+</div>
+<aside class="sidebar"><h3>Related</h3><a href="/x">Another story</a></aside>
+<footer>Copyright 2024 City News. All rights reserved.</footer>
+<!-- comment that must not appear -->
+</body></html>"""
+
+
+class HTMLTextExtractorTest(unittest.TestCase):
+    """网页文本提取：各后端结果一致、编码识别和正文提取"""
+
+    def backends(self):
+        return [backend for backend in HTMLTextExtractor.BACKENDS if backend != 'lxml' or LXML_AVAILABLE]
+
+    def test_backends_produce_identical_text(self):
+        outputs = {backend: HTMLTextExtractor(backend).extract(ARTICLE_HTML.encode('utf-8'), 'text/html')
+                   for backend in self.backends()}
+        reference = outputs['bs4']
+        for backend, text in outputs.items():
+            self.assertEqual(text, reference, backend)
+        self.assertIn('The city council approved', reference)
+        self.assertNotIn('tracking', reference)
+        self.assertNotIn('color: red', reference)
+        self.assertNotIn('comment that must not appear', reference)
+
+    def test_meta_charset_decoding(self):
+        html = '<html><head><meta charset="gb2312"></head><body><p>中文网页</p></body></html>'.encode('gbk')
+        for backend in self.backends():
+            self.assertEqual(HTMLTextExtractor(backend).extract(html), '中文网页', backend)
+
+    def test_content_type_charset_decoding(self):
+        html = '<html><body><p>Crème brûlée</p></body></html>'.encode('latin-1')
+        for backend in self.backends():
+            self.assertEqual(HTMLTextExtractor(backend).extract(html, 'text/html; charset=ISO-8859-1'),
+                             'Crème brûlée', backend)
+
+    def test_unknown_backend_falls_back_to_stdlib(self):
+        self.assertEqual(HTMLTextExtractor('nonexistent').backend, 'stdlib')
+
+    def test_extract_main_drops_boilerplate(self):
+        extractor = HTMLTextExtractor('stdlib')
+        extractor.main_min_chars = 200
+        result = extractor.extract_main(ARTICLE_HTML.encode('utf-8'), 'text/html; charset=utf-8')
+        self.assertEqual(result['mode'], 'main')
+        self.assertIsNone(result['fallback_reason'])
+        self.assertTrue(result['text'].startswith('Budget approved'))
+        self.assertIn('The mayor said the budget', result['text'])
+        for boilerplate in ('About us', 'We use cookies', 'Another story', 'All rights reserved'):
+            self.assertNotIn(boilerplate, result['text'])
+            self.assertIn(boilerplate, result['full_text'])
+
+    def test_extract_main_falls_back_to_full_page(self):
+        extractor = HTMLTextExtractor('stdlib')
+        extractor.main_min_chars = 200
+        html = "<html><body><div><p>Short notice, nothing else here.</p></div><footer>Footer</footer></body></html>"
+        result = extractor.extract_main(html)
+        self.assertEqual(result['mode'], 'full')
+        self.assertEqual(result['text'], result['full_text'])
+        self.assertIsNotNone(result['fallback_reason'])
+
+    def test_extract_main_empty_page(self):
+        result = HTMLTextExtractor('stdlib').extract_main(b'   ')
+        self.assertEqual((result['text'], result['mode']), ('', 'full'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+智能文书翻译平台 - 预编译导言区格式缓存单元测试
+
+不需要安装TeX：格式构建用替身代替，只测试加锁和失败记录。
+
+用法:
+    python -m pytest test_latex_format_cache.py -v
+"""
+
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+from app_full_translation import LaTeXFormatCache
+
+DOCUMENT = "\\documentclass{article}\n\\usepackage{%s}\n\\begin{document}\nHello\n\\end{document}\n"
+
+
+class LaTeXFormatCacheTest(unittest.TestCase):
+    """格式构建按导言区加锁"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.cache = LaTeXFormatCache(cache_dir=os.path.join(self.tmp_dir, 'formats'))
+        self.cache._mylatexformat_available = True
+        patcher = mock.patch('app_full_translation.get_tex_installation_signature', return_value='tex-1')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.builds = []
+        self.release_build = threading.Event()
+
+    def tearDown(self):
+        self.release_build.set()
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def write_tex(self, package):
+        path = os.path.join(self.tmp_dir, f"{package}.tex")
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(DOCUMENT % package)
+        return path
+
+    def slow_build(self, pdflatex_cmd, fmt_name, preamble):
+        self.builds.append(fmt_name)
+        self.release_build.wait(5)
+        with open(os.path.join(self.cache.cache_dir, f"{fmt_name}.fmt"), 'w') as f:
+            f.write('fmt')
+        return True
+
+    def run_in_thread(self, tex_path, results):
+        thread = threading.Thread(target=lambda: results.append(self.cache.get_format('pdflatex', tex_path)))
+        thread.start()
+        return thread
+
+    def test_build_does_not_block_other_preambles(self):
+        cached_tex, slow_tex = self.write_tex('geometry'), self.write_tex('tabularx')
+        self.release_build.set()
+        with mock.patch.object(self.cache, '_build_format', side_effect=self.slow_build):
+            cached_name = self.cache.get_format('pdflatex', cached_tex)
+        self.release_build.clear()
+
+        results = []
+        with mock.patch.object(self.cache, '_build_format', side_effect=self.slow_build):
+            thread = self.run_in_thread(slow_tex, results)
+            deadline = time.time() + 5
+            while len(self.builds) < 2 and time.time() < deadline:
+                time.sleep(0.01)
+            started = time.time()
+            self.assertEqual(self.cache.get_format('pdflatex', cached_tex), cached_name)
+            self.assertLess(time.time() - started, 1)
+            self.release_build.set()
+            thread.join(5)
+        self.assertEqual(len(results), 1)
+        self.assertEqual(self.cache.build_locks, {})
+
+    def test_same_preamble_built_once(self):
+        tex = self.write_tex('array')
+        results = []
+        with mock.patch.object(self.cache, '_build_format', side_effect=self.slow_build):
+            threads = [self.run_in_thread(tex, results) for _ in range(3)]
+            time.sleep(0.1)
+            self.release_build.set()
+            for thread in threads:
+                thread.join(5)
+        self.assertEqual(len(self.builds), 1)
+        self.assertEqual(len(set(results)), 1)
+        self.assertIsNotNone(results[0])
+
+    def test_failed_build_is_remembered(self):
+        tex = self.write_tex('booktabs')
+        with mock.patch.object(self.cache, '_build_format', return_value=False) as build:
+            self.assertIsNone(self.cache.get_format('pdflatex', tex))
+            self.assertIsNone(self.cache.get_format('pdflatex', tex))
+        build.assert_called_once()
+        self.assertEqual(len(self.cache.failed_formats), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
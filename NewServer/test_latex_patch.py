@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+智能文书翻译平台 - LaTeX按行修改与增量重新编译单元测试
+
+编译本身用 mock 代替，只测试行范围替换、冲突检测和错误行定位。
+
+用法:
+    python -m pytest test_latex_patch.py -v
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from app_full_translation import PersistentBuildDirs, PosterTranslator
+
+
+class RecompileWithPatchTest(unittest.TestCase):
+    """按行范围修改LaTeX源码时的行号计算"""
+
+    SOURCE = "line1\nline2\nline3\nline4\n"
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.tex_file = os.path.join(self.tmp_dir, 'poster.tex')
+        with open(self.tex_file, 'w', encoding='utf-8') as f:
+            f.write(self.SOURCE)
+        self.translator = PosterTranslator()
+        self.translator.build_dirs = PersistentBuildDirs(root=os.path.join(self.tmp_dir, 'builds'))
+        self.translator.thumbnailer = None
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def patch(self, start_line, end_line, replacement, compile_error=None):
+        report = {'pdf_file': 'poster.pdf', 'passes': 1, 'cache_hit': False}
+        with mock.patch.object(self.translator, 'compile_tex_with_report',
+                               side_effect=compile_error, return_value=report):
+            result = self.translator.recompile_with_patch(self.tex_file, start_line, end_line, replacement, 'material_t')
+        with open(self.tex_file, 'r', encoding='utf-8') as f:
+            return result, f.read()
+
+    def test_replace_range(self):
+        result, source = self.patch(2, 3, "new2\nnew3\nnew3b")
+        self.assertTrue(result['success'])
+        self.assertEqual(source, "line1\nnew2\nnew3\nnew3b\nline4\n")
+        self.assertEqual(result['patched_range'], [2, 4])
+
+    def test_insert_before_line(self):
+        result, source = self.patch(2, 1, "inserted")
+        self.assertEqual(source, "line1\ninserted\nline2\nline3\nline4\n")
+        self.assertEqual(result['patched_range'], [2, 2])
+
+    def test_append_after_last_line(self):
+        result, source = self.patch(5, 4, "tail")
+        self.assertEqual(source, self.SOURCE + "tail")
+        self.assertEqual(result['patched_range'], [5, 5])
+
+    def test_delete_lines(self):
+        result, source = self.patch(2, 3, "")
+        self.assertEqual(source, "line1\nline4\n")
+        self.assertEqual(result['patched_range'], [2, 1])
+
+    def test_invalid_range_rejected(self):
+        for start_line, end_line in ((3, 1), (1, 9), (0, 1)):
+            result, source = self.patch(start_line, end_line, "x")
+            self.assertFalse(result['success'])
+            self.assertEqual(source, self.SOURCE)
+
+    def test_stale_base_hash_conflicts(self):
+        result = self.translator.recompile_with_patch(self.tex_file, 1, 1, "x", 'material_t', base_hash='0' * 64)
+        self.assertTrue(result['conflict'])
+
+    def test_first_patch_is_not_incremental(self):
+        result, _ = self.patch(1, 1, "x")
+        self.assertFalse(result['incremental'])
+        with self.translator.build_dirs.hold('material_t') as build_dir:
+            open(os.path.join(build_dir, 'main.aux'), 'w').close()
+        result, _ = self.patch(1, 1, "y")
+        self.assertTrue(result['incremental'])
+
+    def test_errors_marked_inside_patch(self):
+        with self.translator.build_dirs.hold('material_t') as build_dir:
+            with open(os.path.join(build_dir, 'main.log'), 'w', encoding='utf-8') as f:
+                f.write("! Undefined control sequence.\nl.3 \\foo\n! Missing $ inserted.\nl.5 x\n")
+        result, _ = self.patch(2, 3, "new2\n\\foo", compile_error=Exception("编译失败"))
+        self.assertFalse(result['success'])
+        self.assertEqual([(e['line'], e['in_patch']) for e in result['errors']], [(3, True), (5, False)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+智能文书翻译平台 - LaTeX模板转义单元测试
+
+用法:
+    python -m pytest test_latex_templates.py -v
+"""
+
+import unittest
+from unittest import mock
+
+from app_full_translation import LaTeXTemplateRenderer
+
+escape = LaTeXTemplateRenderer.escape
+
+
+class LaTeXEscapeTest(unittest.TestCase):
+    """模板文本字段的转义"""
+
+    def test_special_characters(self):
+        self.assertEqual(escape('50% & $5 #1 a_b {x}'), r'50\% \& \$5 \#1 a\_b \{x\}')
+        self.assertEqual(escape('C:\\path'), r'C:\textbackslash{}path')
+
+    def test_latin1_kept(self):
+        self.assertEqual(escape('Zoë Müller, Ørsted, straße'), 'Zoë Müller, Ørsted, straße')
+
+    def test_letters_without_ascii_base_use_t1_commands(self):
+        self.assertEqual(escape('Zoë Łukasz'), r'Zoë \L{}ukasz')
+        self.assertEqual(escape('łódź Œuvre Đorđe'), r'\l{}ód\'{z} \OE{}uvre \DJ{}or\dj{}e')
+
+    def test_accented_letters_use_accent_commands(self):
+        self.assertEqual(escape('Dvořák'), r'Dvo\v{r}ák')
+        self.assertEqual(escape('Erdős Wałęsa'), r'Erd\H{o}s Wa\l{}\k{e}sa')
+        self.assertEqual(escape('ǐ'), r'\v{\i}')
+        self.assertEqual(escape('Nguyễn'), r'Nguy\~{\^{e}}n')
+
+    def test_decomposed_input_is_composed_first(self):
+        self.assertEqual(escape('Zoe\u0308'), 'Zoë')
+
+    def test_typography_whitespace_and_control_characters(self):
+        self.assertEqual(escape('“Hi”\u00a0—\tthere\x07\u200b'), "``Hi''~--- there")
+        self.assertEqual(escape('ﬁle　Ｎo．１'), 'file No.1')
+
+    def test_unmappable_characters_are_marked_and_logged(self):
+        with mock.patch('app_full_translation.log_message') as log:
+            self.assertEqual(escape('Hello 世界'), 'Hello ??')
+        log.assert_called_once()
+        self.assertIn('世界', log.call_args[0][0])
+        self.assertEqual(log.call_args[0][1], 'WARNING')
+
+    def test_none_is_empty(self):
+        self.assertEqual(escape(None), '')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+智能文书翻译平台 - 编译结果PDF缓存单元测试
+
+用法:
+    python -m pytest test_pdf_cache.py -v
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from app_full_translation import CompiledPDFCache
+
+
+class NormalizeSourceTest(unittest.TestCase):
+    """LaTeX源码规范化（缓存键）"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.cache = CompiledPDFCache(cache_dir=self.tmp_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def key(self, source, signature='sig'):
+        return self.cache.make_key(source, signature)
+
+    def test_comment_text_and_trailing_spaces_removed(self):
+        source = "\\section{A}   \r\n% 注释\r\ntext % 行尾注释\n  more\n\n"
+        self.assertEqual(CompiledPDFCache.normalize_source(source), "\\section{A}\n%\ntext %\nmore\n")
+
+    def test_escaped_percent_kept(self):
+        self.assertEqual(CompiledPDFCache.normalize_source("50\\% off % note\nnext"), "50\\% off %\nnext\n")
+
+    def test_verbatim_keeps_comments(self):
+        source = "\\url{http://a/%20b} % note\n"
+        self.assertEqual(CompiledPDFCache.normalize_source(source), "\\url{http://a/%20b} % note\n")
+
+    def test_key_ignores_comment_changes(self):
+        self.assertEqual(self.key("a % x\nb\n"), self.key("a % y\n  b"))
+        self.assertNotEqual(self.key("a\n"), self.key("a\n", "other"))
+
+    def test_comment_before_blank_line_keeps_paragraph_break(self):
+        # foo %note 后接空行是 foo + \\par + bar；foo\\nbar 是 "foo bar"
+        self.assertNotEqual(self.key("foo %note\n\nbar"), self.key("foo\nbar"))
+        self.assertEqual(self.key("foo %note\n\nbar"), self.key("foo %other\n\nbar"))
+
+    def test_comment_swallowing_line_end_differs_from_plain_newline(self):
+        # foo%\\nbar 是 "foobar"，foo\\nbar 是 "foo bar"
+        self.assertNotEqual(self.key("foo%\nbar"), self.key("foo\nbar"))
+
+
+class CompiledPDFCacheTest(unittest.TestCase):
+    """缓存读写"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.cache = CompiledPDFCache(cache_dir=os.path.join(self.tmp_dir, 'cache'), max_entries=2)
+        self.pdf = os.path.join(self.tmp_dir, 'in.pdf')
+        with open(self.pdf, 'wb') as f:
+            f.write(b'%PDF-1.4 test')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_put_get_and_lru_eviction(self):
+        for key in ('a', 'b', 'c'):
+            self.cache.put(key, self.pdf)
+        target = os.path.join(self.tmp_dir, 'out', 'out.pdf')
+        self.assertFalse(self.cache.get('a', target))
+        self.assertTrue(self.cache.get('c', target))
+        with open(target, 'rb') as f:
+            self.assertEqual(f.read(), b'%PDF-1.4 test')
+        self.assertEqual(self.cache.stats()['evictions'], 1)
+
+    def test_entry_evicted_during_copy_is_a_miss(self):
+        self.cache.put('a', self.pdf)
+        with mock.patch('app_full_translation.shutil.copyfile', side_effect=FileNotFoundError):
+            self.assertFalse(self.cache.get('a', os.path.join(self.tmp_dir, 'out.pdf')))
+        stats = self.cache.stats()
+        self.assertEqual((stats['hits'], stats['misses']), (0, 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+智能文书翻译平台 - 分段并行翻译单元测试
+
+用法:
+    python -m pytest test_segmentation.py -v
+"""
+
+import json
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+from app_full_translation import ParallelChunkTranslator, estimate_tokens, split_text_into_segments
+
+
+def join_segments(segments):
+    """按连接符还原 split_text_into_segments 的结果"""
+    if not segments:
+        return ''
+    return segments[0][0] + ''.join(joiner + segment for segment, joiner in segments[1:])
+
+
+class FakeChatClient:
+    """按 ParallelChunkTranslator 的JSON协议返回大写“译文”的模型替身"""
+
+    def __init__(self):
+        self.calls = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def translate_payload(self, payload):
+        return {key: value.upper() for key, value in payload.items()}
+
+    def create(self, **kwargs):
+        self.calls += 1
+        payload = json.loads(kwargs['messages'][-1]['content'])
+        content = json.dumps(self.translate_payload(payload))
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+
+class FailingChatClient(FakeChatClient):
+    """每次调用都出错的模型替身"""
+
+    def create(self, **kwargs):
+        self.calls += 1
+        raise RuntimeError("service unavailable")
+
+
+class OmittingChatClient(FakeChatClient):
+    """漏掉内容包含 skip 的片段的模型替身"""
+
+    def translate_payload(self, payload):
+        return {key: value.upper() for key, value in payload.items() if 'skip' not in value}
+
+
+class SplitTextTest(unittest.TestCase):
+    """分段与拼接"""
+
+    def test_paragraphs_are_segments(self):
+        text = "第一段。\n\nSecond paragraph.\nThird"
+        segments = split_text_into_segments(text, 100)
+        self.assertEqual([segment for segment, _ in segments], ["第一段。", "", "Second paragraph.", "Third"])
+        self.assertEqual(join_segments(segments), text)
+
+    def test_long_paragraph_split_by_sentence(self):
+        sentence = "This is a fairly ordinary sentence with several words. "
+        text = "Intro\n" + sentence * 20 + "\nOutro"
+        segments = split_text_into_segments(text, 40)
+        self.assertEqual(join_segments(segments), text)
+        for segment, _ in segments:
+            self.assertLessEqual(estimate_tokens(segment), 40)
+        # 只有段落的第一个片段以换行连接
+        self.assertEqual(sum(1 for _, joiner in segments if joiner == '\n'), 3)
+
+    def test_overlong_sentence_is_hard_cut(self):
+        text = "字" * 500
+        segments = split_text_into_segments(text, 100)
+        self.assertGreater(len(segments), 1)
+        self.assertEqual(join_segments(segments), text)
+        for segment, _ in segments:
+            self.assertLessEqual(estimate_tokens(segment), 100)
+
+
+class ParallelChunkTranslatorTest(unittest.TestCase):
+    """分段并行翻译的结果拼接"""
+
+    def test_reassembles_in_original_order(self):
+        text = "alpha one.\n\nbeta two.\nalpha one.\n" + "gamma sentence here. " * 30
+        client = FakeChatClient()
+        translator = ParallelChunkTranslator(client, max_chunk_tokens=30, max_workers=3)
+        result = translator.translate(text, "translate")
+        self.assertEqual(result['text'], text.upper())
+        self.assertEqual(result['failed_chunks'], [])
+        self.assertFalse(result['truncated'])
+        self.assertEqual(client.calls, result['chunks'])
+        self.assertEqual(result['missing_segments'], [])
+        self.assertIsNone(result['error'])
+
+    def test_all_batches_failed_is_an_error(self):
+        client = FailingChatClient()
+        translator = ParallelChunkTranslator(client, max_chunk_tokens=30, max_retries=1)
+        text = "first paragraph.\n\nsecond paragraph."
+        result = translator.translate(text, "translate")
+        self.assertEqual(result['failed_chunks'], list(range(result['chunks'])))
+        self.assertEqual(result['untranslated_segments'], result['sent_segments'])
+        self.assertIsNotNone(result['error'])
+        self.assertEqual(result['text'], text)
+
+    def test_missing_segments_are_reported(self):
+        translator = ParallelChunkTranslator(OmittingChatClient(), max_chunk_tokens=1000, max_failed_ratio=0.5)
+        result = translator.translate("one.\ntwo skip.\nthree.\nfour.", "translate")
+        self.assertEqual(result['text'], "ONE.\ntwo skip.\nTHREE.\nFOUR.")
+        self.assertEqual(result['failed_chunks'], [])
+        self.assertEqual(result['missing_segments'], [1])
+        self.assertEqual(result['untranslated_segments'], 1)
+        self.assertIsNone(result['error'])
+
+    def test_untranslated_ratio_over_limit_is_an_error(self):
+        translator = ParallelChunkTranslator(OmittingChatClient(), max_chunk_tokens=1000, max_failed_ratio=0.5)
+        result = translator.translate("one.\ntwo skip.\nthree skip.\nfour skip.", "translate")
+        self.assertEqual(result['missing_segments'], [1, 2, 3])
+        self.assertIsNotNone(result['error'])
+
+    def test_empty_model_response_is_retried_as_failure(self):
+        client = OmittingChatClient()
+        translator = ParallelChunkTranslator(client, max_chunk_tokens=1000, max_retries=2)
+        with mock.patch('app_full_translation.time.sleep'):
+            result = translator.translate("skip this.", "translate")
+        self.assertEqual(client.calls, 2)
+        self.assertEqual(result['failed_chunks'], [0])
+        self.assertIsNotNone(result['error'])
+
+
+if __name__ == '__main__':
+    unittest.main()
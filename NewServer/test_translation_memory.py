@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+智能文书翻译平台 - 翻译记忆单元测试
+
+用法:
+    python -m pytest test_translation_memory.py -v
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from app_full_translation import ParallelChunkTranslator, TranslationMemory
+from test_segmentation import FakeChatClient
+
+
+class TranslationMemoryTest(unittest.TestCase):
+    """翻译记忆的完全匹配和相似匹配"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.memory = TranslationMemory(db_path=os.path.join(self.tmp_dir, 'tm.db'), max_entries=3)
+        self.scope = TranslationMemory.make_scope('en', 'zh', 'v1')
+
+    def tearDown(self):
+        self.memory.conn.close()
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_exact_lookup_ignores_width_and_whitespace(self):
+        self.memory.store([("Annual  report\n2024", "年度报告 2024")], self.scope)
+        self.assertEqual(self.memory.lookup("Annual report ２０２４", self.scope), ('exact', "年度报告 2024"))
+
+    def test_scope_isolation(self):
+        self.memory.store([("Annual report", "年度报告")], self.scope)
+        other = TranslationMemory.make_scope('en', 'zh', 'v2')
+        self.assertEqual(self.memory.lookup("Annual report", other), (None, None))
+
+    def test_fuzzy_lookup_returns_reference(self):
+        source = "The committee approved the annual budget on Monday"
+        self.memory.store([(source, "委员会于周一批准了年度预算")], self.scope)
+        kind, match = self.memory.lookup("The committee approved the annual budget on Tuesday", self.scope)
+        self.assertEqual(kind, 'fuzzy')
+        self.assertEqual(match['source'], source)
+        self.assertGreaterEqual(match['score'], self.memory.fuzzy_threshold)
+
+    def test_short_segments_have_no_fuzzy_match(self):
+        self.memory.store([("Budget 2024", "2024年预算")], self.scope)
+        self.assertEqual(self.memory.lookup("Budget 2025", self.scope), (None, None))
+
+    def test_eviction_keeps_max_entries(self):
+        self.memory.store([(f"segment {i}", f"片段 {i}") for i in range(5)], self.scope)
+        self.assertEqual(self.memory.stats()['entries'], 3)
+
+    def test_exact_hits_skip_model(self):
+        self.memory.store([("hello world", "你好，世界")], self.scope)
+        client = FakeChatClient()
+        translator = ParallelChunkTranslator(client, memory=self.memory, scope=self.scope)
+        result = translator.translate("hello world\nsomething new", "translate")
+        self.assertEqual(result['text'], "你好，世界\nSOMETHING NEW")
+        self.assertEqual(result['memory']['exact_hits'], 1)
+        self.assertEqual(client.calls, 1)
+        # 新译文写回翻译记忆
+        self.assertEqual(self.memory.lookup("something new", self.scope), ('exact', "SOMETHING NEW"))
+
+
+if __name__ == '__main__':
+    unittest.main()
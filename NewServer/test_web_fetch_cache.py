@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+智能文书翻译平台 - 网页抓取缓存单元测试
+
+新鲜期计算直接测试；抓取、重新验证和回放使用本机临时HTTP服务。
+
+用法:
+    python -m pytest test_web_fetch_cache.py -v
+"""
+
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from app_full_translation import WebFetchCache
+
+
+class WebFetchCacheFreshnessTest(unittest.TestCase):
+    """网页缓存的新鲜期计算"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.cache = WebFetchCache(cache_dir=self.tmp_dir, heuristic_max=3600, mode='normal')
+        self.now = time.time()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_max_age_minus_age(self):
+        headers = {'cache-control': 'public, max-age=600', 'age': '100'}
+        self.assertAlmostEqual(self.cache._fresh_until(headers, self.now), self.now + 500)
+
+    def test_s_maxage_takes_precedence(self):
+        headers = {'cache-control': 'max-age=60, s-maxage=300'}
+        self.assertAlmostEqual(self.cache._fresh_until(headers, self.now), self.now + 300)
+
+    def test_no_cache_and_private_always_revalidate(self):
+        self.assertEqual(self.cache._fresh_until({'cache-control': 'no-cache'}, self.now), 0)
+        self.assertEqual(self.cache._fresh_until({'cache-control': 'private, max-age=600'}, self.now), 0)
+
+    def test_expires_relative_to_date(self):
+        headers = {'date': formatdate(self.now - 1000, usegmt=True),
+                   'expires': formatdate(self.now - 1000 + 120, usegmt=True)}
+        self.assertAlmostEqual(self.cache._fresh_until(headers, self.now), self.now + 120, delta=1)
+
+    def test_heuristic_lifetime_is_capped(self):
+        recent = {'date': formatdate(self.now, usegmt=True), 'last-modified': formatdate(self.now - 1000, usegmt=True)}
+        self.assertAlmostEqual(self.cache._fresh_until(recent, self.now), self.now + 100, delta=1)
+        old = {'date': formatdate(self.now, usegmt=True), 'last-modified': formatdate(self.now - 10 ** 7, usegmt=True)}
+        self.assertAlmostEqual(self.cache._fresh_until(old, self.now), self.now + 3600, delta=1)
+
+    def test_no_freshness_information(self):
+        self.assertEqual(self.cache._fresh_until({}, self.now), self.now)
+
+
+class PageHandler(BaseHTTPRequestHandler):
+    """/fresh 可缓存60秒；/etag 每次都要重新验证，带ETag时返回304"""
+
+    requests_seen = []
+
+    def do_GET(self):
+        self.requests_seen.append((self.path, self.headers.get('If-None-Match')))
+        if self.path == '/etag' and self.headers.get('If-None-Match') == '"v1"':
+            self.send_response(304)
+            self.send_header('ETag', '"v1"')
+            self.end_headers()
+            return
+        body = f"<html><body><p>{self.path}</p></body></html>".encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        if self.path == '/fresh':
+            self.send_header('Cache-Control', 'max-age=60')
+        else:
+            self.send_header('Cache-Control', 'no-cache')
+            self.send_header('ETag', '"v1"')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class WebFetchCacheFetchTest(unittest.TestCase):
+    """抓取、重新验证和回放"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), PageHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.base_url = f"http://127.0.0.1:{cls.server.server_address[1]}"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.cache = WebFetchCache(cache_dir=self.tmp_dir, mode='normal')
+        PageHandler.requests_seen = []
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_fresh_response_served_from_cache(self):
+        first = self.cache.fetch(f"{self.base_url}/fresh")
+        second = self.cache.fetch(f"{self.base_url}/fresh")
+        self.assertEqual((first['cache'], second['cache']), ('miss', 'hit'))
+        self.assertEqual(second['content'], first['content'])
+        self.assertEqual(len(PageHandler.requests_seen), 1)
+
+    def test_no_cache_response_revalidated_with_etag(self):
+        first = self.cache.fetch(f"{self.base_url}/etag")
+        second = self.cache.fetch(f"{self.base_url}/etag")
+        self.assertEqual((first['cache'], second['cache']), ('miss', 'revalidated'))
+        self.assertEqual(second['content'], first['content'])
+        self.assertEqual(PageHandler.requests_seen[-1], ('/etag', '"v1"'))
+
+    def test_replay_does_not_contact_origin(self):
+        first = self.cache.fetch(f"{self.base_url}/fresh")
+        replayed = self.cache.fetch(f"{self.base_url}/fresh", replay=True)
+        self.assertEqual(replayed['cache'], 'replay')
+        self.assertEqual(replayed['capture_id'], first['capture_id'])
+        self.assertEqual(len(PageHandler.requests_seen), 1)
+        with self.assertRaises(LookupError):
+            self.cache.fetch(f"{self.base_url}/never-fetched", replay=True)
+
+    def test_index_reloaded_from_disk(self):
+        self.cache.fetch(f"{self.base_url}/fresh")
+        reopened = WebFetchCache(cache_dir=self.tmp_dir, mode='normal')
+        self.assertEqual(reopened.fetch(f"{self.base_url}/fresh")['cache'], 'hit')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+智能文书翻译平台 - 网页批量翻译并发限制单元测试
+
+用法:
+    python -m pytest test_webpage_batch.py -v
+"""
+
+import unittest
+from unittest import mock
+
+from app_full_translation import DomainConcurrencyLimiter
+
+
+class DomainConcurrencyLimiterTest(unittest.TestCase):
+    """全局与单域名并发限制"""
+
+    def test_domain_of_strips_www(self):
+        self.assertEqual(DomainConcurrencyLimiter.domain_of('https://WWW.Example.com/a?b=1'), 'example.com')
+        self.assertEqual(DomainConcurrencyLimiter.domain_of('http://news.example.com:8080/'), 'news.example.com')
+
+    def test_per_domain_limit(self):
+        limiter = DomainConcurrencyLimiter(global_limit=4, per_domain=2, min_interval=0)
+        self.assertTrue(limiter.try_acquire('a.com'))
+        self.assertTrue(limiter.try_acquire('a.com'))
+        self.assertFalse(limiter.try_acquire('a.com'))
+        self.assertTrue(limiter.try_acquire('b.com'))
+
+    def test_global_limit(self):
+        limiter = DomainConcurrencyLimiter(global_limit=2, per_domain=2, min_interval=0)
+        self.assertTrue(limiter.try_acquire('a.com'))
+        self.assertTrue(limiter.try_acquire('b.com'))
+        self.assertFalse(limiter.try_acquire('c.com'))
+        limiter.release('a.com')
+        self.assertTrue(limiter.try_acquire('c.com'))
+
+    def test_release_removes_idle_domain(self):
+        limiter = DomainConcurrencyLimiter(global_limit=2, per_domain=2, min_interval=0)
+        limiter.try_acquire('a.com')
+        limiter.release('a.com')
+        stats = limiter.stats()
+        self.assertEqual(stats['active'], 0)
+        self.assertEqual(stats['domains'], {})
+
+    def test_min_interval_between_starts(self):
+        limiter = DomainConcurrencyLimiter(global_limit=4, per_domain=4, min_interval=1.0)
+        with mock.patch('app_full_translation.time.time', return_value=1000.0):
+            self.assertTrue(limiter.try_acquire('a.com'))
+            self.assertFalse(limiter.try_acquire('a.com'))
+            self.assertTrue(limiter.try_acquire('b.com'))
+        with mock.patch('app_full_translation.time.time', return_value=1001.5):
+            self.assertTrue(limiter.try_acquire('a.com'))
+
+
+if __name__ == '__main__':
+    unittest.main()
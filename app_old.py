@@ -10,11 +10,19 @@ import asyncio
 import subprocess
 import argparse
 import sys
+import uuid
+import hashlib
+import atexit
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime
 from pathlib import Path
 import requests
 from urllib.parse import urljoin, urlparse
-from bs4 import BeautifulSoup
+from email.utils import parsedate_to_datetime
+from bs4 import BeautifulSoup, NavigableString
 
 # 浏览器和翻译相关
 from selenium import webdriver
@@ -55,6 +63,678 @@ os.makedirs('web_translation_output', exist_ok=True)
 os.makedirs('uploads', exist_ok=True)
 os.makedirs('image_translation_output', exist_ok=True)  # 新增：图片翻译输出目录
 
+# ========== 浏览器池 ==========
+
+# 按资源类型拦截请求：Network.setBlockedURLs 只支持URL通配符，按扩展名匹配。
+# Fetch.enable 可以按 resourceType 拦截，但被拦截的请求要逐个响应 Fetch.requestPaused 事件，
+# selenium 的 execute_cdp_cmd 收不到CDP事件，开启后页面会卡住，所以这里不使用。
+# 局限：没有扩展名的资源地址（如 /image?id=1、CDN动态裁剪的图片）无法按类型识别，会照常加载。
+RESOURCE_BLOCK_EXTENSIONS = {
+    'image': ('png', 'jpg', 'jpeg', 'gif', 'webp', 'avif', 'bmp', 'ico', 'svg'),
+    'media': ('mp4', 'webm', 'ogv', 'ogg', 'mp3', 'm4a', 'wav', 'flac', 'm3u8', 'mpd'),
+    'font': ('woff', 'woff2', 'ttf', 'otf', 'eot')
+}
+# 各流程拦截的资源类型：只取文本的流程不下载图片、媒体和字体，生成PDF快照的流程全部保留
+BROWSER_BLOCK_PROFILES = {
+    'text': os.getenv('BROWSER_BLOCK_TEXT', 'image,media,font'),
+    'snapshot': os.getenv('BROWSER_BLOCK_SNAPSHOT', '')
+}
+# 广告和统计域名，所有流程都拦截
+BROWSER_BLOCKED_DOMAINS = os.getenv('BROWSER_BLOCKED_DOMAINS') or (
+    'doubleclick.net,googlesyndication.com,googleadservices.com,google-analytics.com,googletagmanager.com,'
+    'facebook.net,hm.baidu.com,cnzz.com,scorecardresearch.com,hotjar.com,criteo.com,taboola.com,outbrain.com'
+)
+
+def build_block_patterns(profile):
+    """生成某个流程的 Network.setBlockedURLs URL模式列表"""
+    patterns = []
+    for resource_type in BROWSER_BLOCK_PROFILES.get(profile, '').split(','):
+        for ext in RESOURCE_BLOCK_EXTENSIONS.get(resource_type.strip(), ()):
+            # 通配符区分大小写，同时匹配大写扩展名（.JPG、.PNG）
+            for variant in (ext, ext.upper()):
+                patterns.extend([f'*.{variant}', f'*.{variant}?*'])
+    for domain in BROWSER_BLOCKED_DOMAINS.split(','):
+        domain = domain.strip()
+        if domain:
+            patterns.extend([f'*://{domain}/*', f'*://*.{domain}/*'])
+    return patterns
+
+class ChromePool:
+    """
+    共享的无头Chrome实例池
+
+    Google翻译截图、网页获取和HTML转PDF都从这里租用浏览器，不再每一步冷启动Chrome。
+    租出前做健康检查，每个实例打开 max_pages 个页面后回收重建，浏览器崩溃时丢弃并在下次租用时重建。
+    """
+
+    def __init__(self, size=None, max_pages=None, lease_timeout=None, page_load_timeout=None):
+        self.size = max(1, size or int(os.getenv('CHROME_POOL_SIZE', '2')))
+        self.max_pages = max_pages or int(os.getenv('CHROME_POOL_MAX_PAGES', '50'))
+        self.lease_timeout = lease_timeout or float(os.getenv('CHROME_POOL_LEASE_TIMEOUT', '120'))
+        self.page_load_timeout = page_load_timeout or int(os.getenv('CHROME_PAGE_LOAD_TIMEOUT', '30'))
+        self.slots = threading.BoundedSemaphore(self.size)
+        self.lock = threading.Lock()
+        self.idle = deque()
+        self.in_use = 0
+        self.leased = {}  # id(driver) -> 租用中的实例，count_page 按driver找到实例
+        self.closed = False
+        self.counters = {'created': 0, 'recycled': 0, 'crashed': 0, 'leases': 0}
+
+    def _build_options(self):
+        options = Options()
+        options.add_argument("--headless")
+        options.add_argument("--window-size=1280,800")
+        options.add_argument("--no-sandbox")
+        options.add_argument("--disable-setuid-sandbox")
+        options.add_argument("--disable-dev-shm-usage")
+        options.add_argument("--disable-gpu")
+        options.add_argument("--disable-extensions")
+        options.add_argument("--disable-plugins")
+        options.add_argument("--allow-file-access-from-files")
+        options.add_argument("--disable-web-security")
+        options.add_argument("--disable-features=TranslateUI")
+        options.add_argument("--disable-ipc-flooding-protection")
+        # 记录CDP网络事件，用于判断页面网络空闲
+        options.set_capability('goog:loggingPrefs', {'performance': 'ALL'})
+        if os.getenv('CHROME_EXECUTABLE_PATH'):
+            options.binary_location = os.getenv('CHROME_EXECUTABLE_PATH')
+        return options
+
+    def _create(self):
+        start_time = time.time()
+        driver_path = os.getenv('CHROMEDRIVER_PATH')
+        service = Service(executable_path=driver_path) if driver_path else Service()
+        driver = webdriver.Chrome(service=service, options=self._build_options())
+        driver.set_page_load_timeout(self.page_load_timeout)
+        with self.lock:
+            self.counters['created'] += 1
+        print(f"🔍 Chrome实例已启动，耗时 {time.time() - start_time:.2f} 秒")
+        return {'driver': driver, 'pages': 0}
+
+    @staticmethod
+    def _is_healthy(entry):
+        try:
+            entry['driver'].execute_script('return 1')
+            return True
+        except Exception:
+            return False
+
+    def _discard(self, entry, reason):
+        with self.lock:
+            self.counters[reason] += 1
+        if reason == 'crashed':
+            print(f"⚠️ Chrome实例异常，已丢弃（已处理 {entry['pages']} 个页面）")
+        try:
+            entry['driver'].quit()
+        except Exception:
+            pass
+
+    def _take_entry(self):
+        while True:
+            with self.lock:
+                entry = self.idle.popleft() if self.idle else None
+            if entry is None:
+                return self._create()
+            if self._is_healthy(entry):
+                return entry
+            self._discard(entry, 'crashed')
+
+    def _reset(self, entry):
+        driver = entry['driver']
+        handles = driver.window_handles
+        for handle in handles[1:]:
+            driver.switch_to.window(handle)
+            driver.close()
+        driver.switch_to.window(handles[0])
+        driver.execute_cdp_cmd('Emulation.setScriptExecutionDisabled', {'value': False})
+        driver.delete_all_cookies()
+        driver.set_page_load_timeout(self.page_load_timeout)
+        driver.get('about:blank')
+        try:
+            driver.get_log('performance')
+        except Exception:
+            pass
+
+    def _return_entry(self, entry):
+        if self.closed or entry['pages'] >= self.max_pages:
+            self._discard(entry, 'recycled')
+            return
+        try:
+            self._reset(entry)
+        except Exception:
+            self._discard(entry, 'crashed')
+            return
+        with self.lock:
+            self.idle.append(entry)
+
+    @contextmanager
+    def lease(self, disable_js=False, block='snapshot'):
+        """
+        租用一个浏览器：with chrome_pool.lease() as driver: ...
+
+        block 为请求拦截配置：'text' 不加载图片/媒体/字体，'snapshot' 保留页面外观（两者都拦截广告统计域名）。
+        每次加载页面后调用 count_page，实例按加载的页面数而不是租用次数回收。
+        """
+        if self.closed:
+            raise Exception("浏览器池已关闭")
+        if not self.slots.acquire(timeout=self.lease_timeout):
+            raise Exception(f"浏览器池繁忙，等待 {self.lease_timeout:.0f} 秒后仍无可用实例")
+
+        entry = None
+        leased = False
+        try:
+            entry = self._take_entry()
+            driver_key = id(entry['driver'])
+            leased = True
+            with self.lock:
+                self.in_use += 1
+                self.counters['leases'] += 1
+            if disable_js:
+                entry['driver'].execute_cdp_cmd('Emulation.setScriptExecutionDisabled', {'value': True})
+            entry['driver'].execute_cdp_cmd('Network.enable', {})
+            entry['driver'].execute_cdp_cmd('Network.setBlockedURLs', {'urls': build_block_patterns(block)})
+            with self.lock:
+                self.leased[driver_key] = entry
+            yield entry['driver']
+        except Exception:
+            if entry is not None and not self._is_healthy(entry):
+                self._discard(entry, 'crashed')
+                entry = None
+            raise
+        finally:
+            if entry is not None:
+                self._return_entry(entry)
+            if leased:
+                with self.lock:
+                    self.in_use -= 1
+                    self.leased.pop(driver_key, None)
+            self.slots.release()
+
+    def count_page(self, driver):
+        """记录租用中的浏览器加载了一个页面；同一次租用可以加载多个页面"""
+        with self.lock:
+            entry = self.leased.get(id(driver))
+            if entry is not None:
+                entry['pages'] += 1
+
+    def close(self):
+        self.closed = True
+        with self.lock:
+            entries = list(self.idle)
+            self.idle.clear()
+        for entry in entries:
+            try:
+                entry['driver'].quit()
+            except Exception:
+                pass
+
+    def stats(self):
+        with self.lock:
+            return dict(self.counters, size=self.size, max_pages=self.max_pages,
+                        idle=len(self.idle), in_use=self.in_use)
+
+chrome_pool = ChromePool()
+atexit.register(chrome_pool.close)
+
+# 页面就绪检测：替代固定的 sleep，快速页面只等待网络空闲窗口
+PAGE_READY_TIMEOUT = float(os.getenv('PAGE_READY_TIMEOUT', '15'))
+PAGE_NETWORK_IDLE_SECONDS = float(os.getenv('PAGE_NETWORK_IDLE_MS', '300')) / 1000
+# 允许保持进行中的长连接请求数（统计、长轮询等），与 networkidle2 的判定一致
+PAGE_IDLE_MAX_INFLIGHT = 2
+
+# Google翻译完成后会给 <html> 加上 translated-ltr / translated-rtl 类
+GOOGLE_TRANSLATE_DONE_JS = """
+var root = document.documentElement;
+return !!root && (root.classList.contains('translated-ltr') || root.classList.contains('translated-rtl'));
+"""
+
+def _drain_network_events(driver, inflight, totals=None):
+    """
+    读取性能日志中的CDP网络事件并更新进行中的请求集合，totals 累计下载字节数和被拦截的请求数
+
+    Returns:
+        bool: 是否有新的网络活动；性能日志不可用时返回 None
+    """
+    try:
+        entries = driver.get_log('performance')
+    except Exception:
+        return None
+
+    activity = False
+    for entry in entries:
+        try:
+            message = json.loads(entry['message'])['message']
+        except (KeyError, TypeError, ValueError):
+            continue
+        method = message.get('method', '')
+        params = message.get('params') or {}
+        if method == 'Network.requestWillBeSent':
+            if params.get('type') != 'EventSource':
+                inflight.add(params.get('requestId'))
+            activity = True
+        elif method in ('Network.loadingFinished', 'Network.loadingFailed'):
+            inflight.discard(params.get('requestId'))
+            activity = True
+            if totals is not None:
+                if method == 'Network.loadingFinished':
+                    totals['bytes'] += int(params.get('encodedDataLength') or 0)
+                elif params.get('blockedReason'):
+                    totals['blocked'] += 1
+    return activity
+
+def wait_for_page_ready(driver, timeout=None, google_translate=False, idle_seconds=None):
+    """
+    等待页面就绪，超过 timeout 秒后不再等待
+
+    就绪条件：document.readyState 为 complete；网络空闲（CDP网络事件显示进行中的请求
+    不超过 PAGE_IDLE_MAX_INFLIGHT 个，且 idle_seconds 内没有新活动）；Google翻译代理页
+    还需要出现翻译完成标记。性能日志不可用时用 Resource Timing 条目数判断网络活动。
+
+    Returns:
+        dict: {'ready': bool, 'waited': 等待秒数, 'pending': 未满足的条件,
+               'bytes': 下载字节数, 'blocked': 被拦截的请求数}（后两项依赖性能日志）
+    """
+    timeout = PAGE_READY_TIMEOUT if timeout is None else timeout
+    idle_seconds = PAGE_NETWORK_IDLE_SECONDS if idle_seconds is None else idle_seconds
+    start_time = time.time()
+    last_activity = start_time
+    inflight = set()
+    totals = {'bytes': 0, 'blocked': 0}
+    resource_count = None
+
+    while True:
+        now = time.time()
+        pending = []
+        try:
+            if driver.execute_script('return document.readyState') != 'complete':
+                pending.append('document')
+            if google_translate and not driver.execute_script(GOOGLE_TRANSLATE_DONE_JS):
+                pending.append('translation')
+            activity = _drain_network_events(driver, inflight, totals)
+            if activity is None:
+                count = driver.execute_script("return performance.getEntriesByType('resource').length")
+                activity = count != resource_count
+                resource_count = count
+        except Exception:
+            # 页面跳转过程中脚本可能执行失败，视为未就绪
+            pending.append('document')
+            activity = True
+
+        if activity:
+            last_activity = now
+        if len(inflight) > PAGE_IDLE_MAX_INFLIGHT or now - last_activity < idle_seconds:
+            pending.append('network')
+
+        waited = round(now - start_time, 3)
+        if not pending:
+            print(f"🔍 页面就绪，等待 {waited} 秒，下载 {totals['bytes'] // 1024} KB，拦截 {totals['blocked']} 个请求")
+            return dict(totals, ready=True, waited=waited, pending=[])
+        if now - start_time >= timeout:
+            print(f"⚠️ 页面在 {timeout:.0f} 秒内未就绪（{', '.join(pending)}），继续处理")
+            return dict(totals, ready=False, waited=waited, pending=pending)
+        time.sleep(0.05)
+
+def wait_for_paint(driver):
+    """等待两帧动画，确保脚本修改的DOM已完成布局"""
+    try:
+        driver.execute_async_script(
+            "var done = arguments[arguments.length - 1];"
+            "requestAnimationFrame(function () { requestAnimationFrame(function () { done(true); }); });"
+        )
+    except Exception:
+        pass
+
+# ========== 网页抓取缓存 ==========
+
+class WebFetchCache:
+    """
+    网页抓取的持久化HTTP缓存
+
+    每个URL的元数据（保留的响应头、ETag/Last-Modified、新鲜期和历次抓取记录）保存为
+    <URL哈希>.json，响应正文按内容哈希保存在 captures/ 目录，同一内容只存一份。
+    遵循 Cache-Control：no-store 不缓存；no-cache/private 每次都重新验证；
+    max-age/s-maxage/Expires 有效期内直接使用本地正文；过期后带 If-None-Match /
+    If-Modified-Since 请求源站，304 时复用本地正文。源站出错时返回过期的缓存（must-revalidate 除外）。
+
+    回放模式（replay）只读存档、不访问源站，可以用 capture_id 指定某次抓取，
+    按当时的原始字节重新翻译。
+    """
+
+    STORED_HEADERS = ('content-type', 'content-language', 'cache-control', 'expires',
+                      'etag', 'last-modified', 'date', 'age')
+    MODES = ('normal', 'replay', 'off')
+
+    def __init__(self, cache_dir=None, max_bytes=None, max_captures=None, heuristic_max=None, mode=None):
+        self.cache_dir = os.path.abspath(cache_dir or os.getenv('WEB_CACHE_DIR', 'web_fetch_cache'))
+        self.capture_dir = os.path.join(self.cache_dir, 'captures')
+        self.max_bytes = max_bytes or int(os.getenv('WEB_CACHE_MAX_MB', '512')) * 1024 * 1024
+        self.max_captures = max_captures or int(os.getenv('WEB_CACHE_MAX_CAPTURES', '5'))
+        # 响应没有明确有效期时，按 Last-Modified 推算的启发式新鲜期上限（秒）
+        self.heuristic_max = heuristic_max if heuristic_max is not None else int(os.getenv('WEB_CACHE_HEURISTIC_MAX', '3600'))
+        self.mode = (mode or os.getenv('WEB_CACHE_MODE', 'normal')).lower()
+        if self.mode not in self.MODES:
+            print(f"⚠️ 未知的 WEB_CACHE_MODE={self.mode}，使用 normal")
+            self.mode = 'normal'
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.capture_refs = {}
+        self.total_bytes = 0
+        self.counters = {'hits': 0, 'revalidated': 0, 'misses': 0, 'stale': 0,
+                         'replays': 0, 'bypassed': 0, 'evictions': 0}
+        os.makedirs(self.capture_dir, exist_ok=True)
+        self._load_index()
+
+    def _load_index(self):
+        """按元数据文件的修改时间恢复LRU顺序，并清理没有被引用的正文"""
+        metas = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith('.json'):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    metas.append((os.stat(path).st_mtime, name[:-5], json.load(f)))
+            except (OSError, ValueError):
+                print(f"⚠️ 跳过损坏的网页缓存元数据: {name}")
+        for _, key, meta in sorted(metas, key=lambda item: item[0]):
+            captures = [c for c in meta.get('captures', []) if os.path.exists(self._capture_path(c['capture_id']))]
+            if not captures:
+                continue
+            meta['captures'] = captures
+            self.entries[key] = meta
+            for capture in captures:
+                self._add_ref(capture['capture_id'], capture['size'])
+        for name in os.listdir(self.capture_dir):
+            if name.endswith('.body') and name[:-5] not in self.capture_refs:
+                try:
+                    os.remove(os.path.join(self.capture_dir, name))
+                except OSError:
+                    pass
+
+    @staticmethod
+    def _url_key(url):
+        return hashlib.sha256(url.encode('utf-8')).hexdigest()
+
+    def _capture_path(self, capture_id):
+        return os.path.join(self.capture_dir, f"{capture_id}.body")
+
+    def _meta_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def _add_ref(self, capture_id, size):
+        ref = self.capture_refs.setdefault(capture_id, [size, 0])
+        if ref[1] == 0:
+            self.total_bytes += size
+        ref[1] += 1
+
+    def _release_ref(self, capture_id):
+        ref = self.capture_refs.get(capture_id)
+        if not ref:
+            return
+        ref[1] -= 1
+        if ref[1] <= 0:
+            self.total_bytes -= ref[0]
+            del self.capture_refs[capture_id]
+            try:
+                os.remove(self._capture_path(capture_id))
+            except OSError:
+                pass
+
+    def _write_meta(self, key, meta):
+        tmp_path = os.path.join(self.cache_dir, f".{key}.{uuid.uuid4().hex}.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(tmp_path, self._meta_path(key))
+
+    @staticmethod
+    def parse_cache_control(value):
+        """解析 Cache-Control 头，返回 {指令: 参数}"""
+        directives = {}
+        for part in (value or '').split(','):
+            name, _, argument = part.strip().partition('=')
+            if name:
+                directives[name.strip().lower()] = argument.strip().strip('"')
+        return directives
+
+    @staticmethod
+    def _http_date(value):
+        try:
+            return parsedate_to_datetime(value).timestamp() if value else None
+        except (TypeError, ValueError, IndexError, OverflowError):
+            return None
+
+    def _fresh_until(self, headers, stored_at):
+        """按 RFC 9111 计算响应在本地保持新鲜的截止时间"""
+        directives = self.parse_cache_control(headers.get('cache-control'))
+        if 'no-cache' in directives or 'private' in directives:
+            # private 响应只对单个用户有效，本服务在多个客户之间共享缓存，因此每次都要重新验证
+            return 0
+        response_date = self._http_date(headers.get('date')) or stored_at
+        lifetime = 0
+        if 's-maxage' in directives or 'max-age' in directives:
+            try:
+                lifetime = int(directives.get('s-maxage', directives.get('max-age')))
+            except ValueError:
+                lifetime = 0
+        elif headers.get('expires') is not None:
+            expires = self._http_date(headers.get('expires'))
+            lifetime = expires - response_date if expires else 0
+        elif headers.get('last-modified'):
+            last_modified = self._http_date(headers.get('last-modified'))
+            if last_modified:
+                lifetime = min(self.heuristic_max, (response_date - last_modified) * 0.1)
+        try:
+            age = int(headers.get('age') or 0)
+        except ValueError:
+            age = 0
+        return stored_at + max(0, lifetime - age)
+
+    def _read_capture(self, capture_id):
+        with open(self._capture_path(capture_id), 'rb') as f:
+            return f.read()
+
+    def _touch(self, key, counter):
+        with self.lock:
+            self.counters[counter] += 1
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                try:
+                    os.utime(self._meta_path(key), None)
+                except OSError:
+                    pass
+
+    @staticmethod
+    def _result(meta, content, status, capture_id):
+        capture = next((c for c in meta['captures'] if c['capture_id'] == capture_id), {})
+        return {
+            'content': content,
+            'url': meta['url'],
+            'final_url': meta.get('final_url', meta['url']),
+            'status_code': meta.get('status_code', 200),
+            'headers': dict(meta.get('headers', {})),
+            'cache': status,
+            'capture_id': capture_id,
+            'fetched_at': capture.get('fetched_at')
+        }
+
+    def _store(self, key, url, response, content, fetch_seconds=None):
+        """保存一次完整响应，返回元数据；no-store 或 Vary: * 的响应不缓存"""
+        headers = {name: response.headers[name] for name in self.STORED_HEADERS if name in response.headers}
+        if 'no-store' in self.parse_cache_control(headers.get('cache-control')) \
+                or response.headers.get('vary', '').strip() == '*':
+            return None
+
+        capture_id = hashlib.sha256(content).hexdigest()
+        capture_path = self._capture_path(capture_id)
+        if not os.path.exists(capture_path):
+            tmp_path = os.path.join(self.capture_dir, f".{capture_id}.{uuid.uuid4().hex}.tmp")
+            with open(tmp_path, 'wb') as f:
+                f.write(content)
+            os.replace(tmp_path, capture_path)
+
+        now = time.time()
+        with self.lock:
+            old = self.entries.pop(key, None)
+            old_captures = old['captures'] if old else []
+            captures = [c for c in old_captures if c['capture_id'] != capture_id]
+            captures.append({'capture_id': capture_id, 'fetched_at': now, 'size': len(content),
+                             'fetch_seconds': fetch_seconds})
+            captures = captures[-self.max_captures:]
+            # 先登记保留的抓取再释放旧引用，避免仍在使用的正文被删除
+            for capture in captures:
+                self._add_ref(capture['capture_id'], capture['size'])
+            for capture in old_captures:
+                self._release_ref(capture['capture_id'])
+            meta = {
+                'url': url,
+                'final_url': response.url or url,
+                'status_code': response.status_code,
+                'headers': headers,
+                'etag': headers.get('etag'),
+                'last_modified': headers.get('last-modified'),
+                'stored_at': now,
+                'fresh_until': self._fresh_until(headers, now),
+                'capture_id': capture_id,
+                'captures': captures
+            }
+            self.entries[key] = meta
+            self._write_meta(key, meta)
+            while len(self.entries) > 1 and self.total_bytes > self.max_bytes:
+                old_key, old_meta = self.entries.popitem(last=False)
+                for capture in old_meta['captures']:
+                    self._release_ref(capture['capture_id'])
+                try:
+                    os.remove(self._meta_path(old_key))
+                except OSError:
+                    pass
+                self.counters['evictions'] += 1
+        return meta
+
+    def _refresh(self, key, response):
+        """304 响应：合并新的响应头并重新计算新鲜期，正文保持不变"""
+        with self.lock:
+            meta = self.entries.get(key)
+            if meta is None:
+                return None
+            for name in self.STORED_HEADERS:
+                if name in response.headers:
+                    meta['headers'][name] = response.headers[name]
+            meta['etag'] = meta['headers'].get('etag')
+            meta['last_modified'] = meta['headers'].get('last-modified')
+            meta['stored_at'] = time.time()
+            meta['fresh_until'] = self._fresh_until(meta['headers'], meta['stored_at'])
+            self.entries.move_to_end(key)
+            self._write_meta(key, meta)
+            return json.loads(json.dumps(meta))
+
+    def fetch(self, url, headers=None, timeout=30, replay=False, capture_id=None):
+        """
+        获取网页，优先使用缓存
+
+        Args:
+            url (str): 网页地址
+            headers (dict): 额外的请求头
+            timeout (int): 请求超时（秒）
+            replay (bool): 只从存档读取，不访问源站
+            capture_id (str): 回放指定的某次抓取（正文的sha256）
+
+        Returns:
+            dict: {'content', 'url', 'final_url', 'status_code', 'headers', 'cache', 'capture_id', 'fetched_at'}
+                  cache 为 hit / revalidated / miss / stale / replay / bypass
+
+        Raises:
+            LookupError: 回放模式下没有对应的存档
+            requests.RequestException: 源站请求失败且没有可用的缓存
+        """
+        key = self._url_key(url)
+        with self.lock:
+            meta = json.loads(json.dumps(self.entries[key])) if key in self.entries else None
+
+        if replay or capture_id or self.mode == 'replay':
+            if meta is None:
+                raise LookupError(f"缓存中没有该网址的存档: {url}")
+            capture_id = capture_id or meta['capture_id']
+            if capture_id not in [c['capture_id'] for c in meta['captures']]:
+                raise LookupError(f"缓存中没有抓取记录 {capture_id}: {url}")
+            content = self._read_capture(capture_id)
+            self._touch(key, 'replays')
+            print(f"🗄️ 回放网页存档 {capture_id[:12]}: {url}")
+            return self._result(meta, content, 'replay', capture_id)
+
+        if self.mode == 'off':
+            response = requests.get(url, headers=headers, timeout=timeout)
+            response.raise_for_status()
+            with self.lock:
+                self.counters['bypassed'] += 1
+            return {'content': response.content, 'url': url, 'final_url': response.url or url,
+                    'status_code': response.status_code, 'headers': dict(response.headers),
+                    'cache': 'bypass', 'capture_id': None, 'fetched_at': time.time()}
+
+        cached_content = None
+        if meta is not None:
+            try:
+                cached_content = self._read_capture(meta['capture_id'])
+            except OSError:
+                meta = None
+
+        if meta is not None and time.time() < meta['fresh_until']:
+            self._touch(key, 'hits')
+            return self._result(meta, cached_content, 'hit', meta['capture_id'])
+
+        request_headers = dict(headers or {})
+        if meta is not None:
+            if meta.get('etag'):
+                request_headers['If-None-Match'] = meta['etag']
+            if meta.get('last_modified'):
+                request_headers['If-Modified-Since'] = meta['last_modified']
+
+        try:
+            request_started = time.time()
+            response = requests.get(url, headers=request_headers, timeout=timeout)
+            if response.status_code == 304 and meta is not None:
+                meta = self._refresh(key, response) or meta
+                self._touch(key, 'revalidated')
+                return self._result(meta, cached_content, 'revalidated', meta['capture_id'])
+            response.raise_for_status()
+        except requests.RequestException as e:
+            directives = self.parse_cache_control(meta['headers'].get('cache-control')) if meta else {}
+            if meta is None or 'must-revalidate' in directives or 'proxy-revalidate' in directives:
+                raise
+            print(f"⚠️ 源站请求失败，使用过期的网页缓存: {url} ({str(e)})")
+            self._touch(key, 'stale')
+            return self._result(meta, cached_content, 'stale', meta['capture_id'])
+
+        content = response.content
+        with self.lock:
+            self.counters['misses'] += 1
+        stored = self._store(key, url, response, content, round(time.time() - request_started, 3))
+        if stored is None:
+            return {'content': content, 'url': url, 'final_url': response.url or url,
+                    'status_code': response.status_code, 'headers': dict(response.headers),
+                    'cache': 'miss', 'capture_id': None, 'fetched_at': time.time()}
+        return self._result(stored, content, 'miss', stored['capture_id'])
+
+    def captures(self, url):
+        """列出某个网址保存的历次抓取，供回放时选择 capture_id"""
+        with self.lock:
+            meta = self.entries.get(self._url_key(url))
+            return [dict(c) for c in meta['captures']] if meta else []
+
+    def stats(self):
+        with self.lock:
+            lookups = self.counters['hits'] + self.counters['revalidated'] + self.counters['misses']
+            return {
+                'mode': self.mode,
+                'entries': len(self.entries),
+                'captures': len(self.capture_refs),
+                'total_bytes': self.total_bytes,
+                'max_bytes': self.max_bytes,
+                **self.counters,
+                'hit_rate': round((self.counters['hits'] + self.counters['revalidated']) / lookups, 4) if lookups else 0.0
+            }
+
+web_fetch_cache = WebFetchCache()
+
 # ========== 原有的Google翻译功能 ==========
 
 def sanitize_title(title):
@@ -85,19 +765,6 @@ def print_to_pdf(driver, pdf_path, paper_width=8.27, paper_height=11.7, margins=
         f.write(pdf_data)
     print(f"已保存 PDF: {pdf_path}")
 
-def setup_chrome(disable_js=False):
-    """创建 Chrome WebDriver 实例"""
-    options = Options()
-    options.add_argument("--headless")
-    options.add_argument("--window-size=1280,800")
-    options.add_argument("--no-sandbox")
-    options.add_argument("--disable-setuid-sandbox")
-    if disable_js:
-        prefs = {"profile.managed_default_content_settings.javascript": 2}
-        options.add_experimental_option("prefs", prefs)
-    driver = webdriver.Chrome(options=options)
-    return driver
-
 def hide_google_translate_toolbar(driver):
     """移除 Google Translate 顶部工具栏"""
     try:
@@ -114,28 +781,23 @@ def hide_google_translate_toolbar(driver):
     except Exception as e:
         print(f"移除顶部工具栏时出错：{e}")
 
-def capture_translated_pdf_for_api(url, base_dir, wait_time=5):
-    """使用 Google Translate 强制将页面翻译成英文"""
-    try:
-        driver = setup_chrome(disable_js=False)
+def capture_translated_pdf_for_api(url, base_dir, wait_time=None):
+    """使用 Google Translate 强制将页面翻译成英文（wait_time 为等待翻译完成的最长秒数）"""
+    with chrome_pool.lease() as driver:
         translate_url = f"https://translate.google.com/translate?hl=en&sl=zh-CN&u={url}&prev=search"
         driver.get(translate_url)
-        time.sleep(wait_time)
+        chrome_pool.count_page(driver)
+        wait_for_page_ready(driver, timeout=wait_time, google_translate=True)
         hide_google_translate_toolbar(driver)
-        time.sleep(1)
+        wait_for_paint(driver)
         title = sanitize_title(driver.title)
         out_folder = os.path.join(base_dir, "translated_snapshot")
         os.makedirs(out_folder, exist_ok=True)
         pdf_path = os.path.join(out_folder, f"{title}.pdf")
         small_margins = {"top": 0.05, "bottom": 0.05, "left": 0.05, "right": 0.05}
         print_to_pdf(driver, pdf_path, margins=small_margins, scale=0.7)
-        driver.quit()
         
         return pdf_path, f"{title}.pdf"
-    except Exception as e:
-        if 'driver' in locals():
-            driver.quit()
-        raise e
 
 # ========== 海报翻译类（增强版）==========
 
@@ -1077,6 +1739,12 @@ Output complete LaTeX source code that the user can compile directly without any
 class WebTranslationWorkflow:
     """网页翻译工作流程类（增强版）"""
     
+    # 文本节点模式下不翻译这些元素中的内容
+    SKIP_TEXT_PARENTS = ['script', 'style', 'noscript', 'code', 'pre', 'textarea', 'template', 'svg', 'math']
+    # 需要翻译的属性
+    TRANSLATABLE_ATTRIBUTES = ('alt', 'title', 'placeholder')
+    CJK_PATTERN = re.compile(r'[\u3400-\u9fff\uf900-\ufaff]')
+    
     def __init__(self, api_key=None, output_dir="web_translation_output"):
         """初始化工作流程"""
         self.api_key = api_key or self._load_api_key()
@@ -1088,6 +1756,11 @@ class WebTranslationWorkflow:
         self.max_retries = 3
         self.retry_delay = 2
         self.pdf_timeout = 30
+        
+        # HTML翻译方式：text_nodes（只翻译文本节点和属性，本地写回DOM）或 raw（整页HTML交给模型）
+        self.html_translate_mode = os.getenv('HTML_TRANSLATE_MODE', 'text_nodes')
+        self.html_batch_chars = int(os.getenv('HTML_TRANSLATE_BATCH_CHARS', '3000'))
+        self.html_translate_workers = int(os.getenv('HTML_TRANSLATE_WORKERS', '4'))
 
     def log_status(self, message, level="INFO"):
         """详细状态日志"""
@@ -1155,62 +1828,6 @@ class WebTranslationWorkflow:
         folder = re.sub(r'[^0-9A-Za-z]+', '_', url)
         return folder.strip('_')
 
-    def setup_chrome_enhanced(self, disable_js=False, headless=True):
-        """创建增强的Chrome WebDriver实例"""
-        self.log_status("正在初始化Chrome WebDriver...", "INFO")
-        
-        options = Options()
-        
-        # 基本配置
-        if headless:
-            options.add_argument("--headless")
-            self.log_status("启用无头模式", "DEBUG")
-        
-        # 增强稳定性配置
-        options.add_argument("--window-size=1280,800")
-        options.add_argument("--no-sandbox")
-        options.add_argument("--disable-setuid-sandbox")
-        options.add_argument("--disable-dev-shm-usage")  # 解决内存问题
-        options.add_argument("--disable-gpu")  # 禁用GPU加速
-        options.add_argument("--disable-extensions")  # 禁用扩展
-        options.add_argument("--disable-plugins")  # 禁用插件
-        options.add_argument("--disable-images")  # 禁用图片加载以提高速度
-        options.add_argument("--disable-javascript") if disable_js else None
-        
-        # 文件访问权限
-        options.add_argument("--allow-file-access-from-files")
-        options.add_argument("--disable-web-security")
-        
-        # 网络配置
-        options.add_argument("--disable-features=TranslateUI")
-        options.add_argument("--disable-ipc-flooding-protection")
-        
-        if disable_js:
-            prefs = {"profile.managed_default_content_settings.javascript": 2}
-            options.add_experimental_option("prefs", prefs)
-            self.log_status("已禁用JavaScript", "DEBUG")
-        
-        # 设置页面加载策略
-        options.page_load_strategy = 'normal'
-        
-        try:
-            # 尝试创建WebDriver
-            service = Service()
-            driver = webdriver.Chrome(service=service, options=options)
-            
-            # 设置超时
-            driver.set_page_load_timeout(self.pdf_timeout)
-            driver.implicitly_wait(10)
-            
-            self.log_status("Chrome WebDriver初始化成功", "SUCCESS")
-            self.log_status(f"Chrome版本: {driver.capabilities['browserVersion']}", "DEBUG")
-            
-            return driver
-            
-        except Exception as e:
-            self.log_status(f"Chrome WebDriver初始化失败: {str(e)}", "ERROR")
-            raise Exception(f"Chrome WebDriver初始化失败: {e}")
-
     def print_to_pdf_with_retry(self, driver, pdf_path, paper_width=8.27, paper_height=11.7):
         """使用重试机制的PDF生成"""
         self.log_status(f"开始生成PDF: {pdf_path}", "INFO")
@@ -1235,9 +1852,9 @@ class WebTranslationWorkflow:
                 if not self.check_chrome_status(driver):
                     raise Exception("Chrome浏览器状态异常")
                 
-                # 等待页面完全加载
+                # 等待页面完全加载（已就绪的页面立即返回）
                 self.log_status("等待页面加载完成...", "DEBUG")
-                time.sleep(3)
+                wait_for_page_ready(driver)
                 
                 # 检查页面状态
                 page_title = driver.title
@@ -1282,8 +1899,14 @@ class WebTranslationWorkflow:
         
         return False
 
-    def fetch_webpage_simple(self, url, wait_time=3):
-        """简化的网页获取方法（仅获取HTML内容，不下载资源）"""
+    def fetch_webpage_simple(self, url, replay=False, capture_id=None):
+        """
+        简化的网页获取方法（仅获取HTML内容，不下载资源）
+
+        页面HTML经由网页抓取缓存获取，这一步不启动浏览器；原始页面PDF在翻译完成后
+        与译文PDF一起由 generate_pdfs_in_session 在同一个浏览器标签页中生成。
+        replay/capture_id 时使用存档中的原始字节。
+        """
         self.log_status(f"开始获取网页: {url}", "INFO")
         
         folder_name = self.sanitize_url_to_foldername(url)
@@ -1293,29 +1916,22 @@ class WebTranslationWorkflow:
         
         self.log_status(f"输出目录: {snapshot_dir}", "DEBUG")
 
-        driver = None
         try:
-            driver = self.setup_chrome_enhanced(disable_js=True)
-            
-            self.log_status(f"访问URL: {url}", "INFO")
-            driver.get(url)
-            
-            self.log_status(f"等待页面加载 {wait_time} 秒...", "DEBUG")
-            time.sleep(wait_time)
+            page = web_fetch_cache.fetch(url, headers={'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'},
+                                         timeout=30, replay=replay, capture_id=capture_id)
+            self.log_status(f"网页缓存: {page['cache']}", "DEBUG")
+
+            # 加上 <base> 使相对地址仍指向源站（渲染和下载的HTML都依赖它）
+            soup = BeautifulSoup(page['content'], 'html.parser')
+            if soup.head is not None and soup.find('base') is None:
+                soup.head.insert(0, soup.new_tag('base', href=page['final_url']))
+            html_content = soup.decode()
 
-            # 获取页面信息
-            title = sanitize_title(driver.title)
+            title = sanitize_title(soup.title.get_text() if soup.title else '')
             self.log_status(f"页面标题: {title}", "DEBUG")
-            
-            # 生成原始PDF
-            pdf_path = os.path.join(snapshot_dir, f"{title}_original.pdf")
-            self.print_to_pdf_with_retry(driver, pdf_path)
 
             # 保存HTML内容
-            self.log_status("保存HTML内容...", "DEBUG")
-            html_content = driver.page_source
             html_path = os.path.join(snapshot_dir, "index.html")
-            
             with open(html_path, "w", encoding="utf-8") as f:
                 f.write(html_content)
             
@@ -1328,8 +1944,11 @@ class WebTranslationWorkflow:
                 "base_dir": base_dir,
                 "snapshot_dir": snapshot_dir,
                 "html_path": html_path,
-                "original_pdf_path": pdf_path,
-                "title": title
+                "html_content": html_content,
+                "original_pdf_path": os.path.join(snapshot_dir, f"{title}_original.pdf"),
+                "title": title,
+                "fetch_cache": page['cache'],
+                "capture_id": page['capture_id']
             }
 
         except Exception as e:
@@ -1339,14 +1958,6 @@ class WebTranslationWorkflow:
                 "error": str(e),
                 "url": url
             }
-        finally:
-            if driver:
-                try:
-                    self.log_status("关闭Chrome浏览器...", "DEBUG")
-                    driver.quit()
-                    self.log_status("Chrome浏览器已关闭", "SUCCESS")
-                except Exception as e:
-                    self.log_status(f"关闭浏览器时出错: {str(e)}", "WARNING")
 
     def translate_html(self, html_path, output_path=None):
         """使用GPT翻译HTML内容"""
@@ -1384,25 +1995,10 @@ class WebTranslationWorkflow:
             content_size = len(html_content)
             self.log_status(f"HTML内容大小: {content_size} 字符", "DEBUG")
 
-            user_prompt = (
-                "Please translate the following HTML content from Chinese to English. "
-                "Keep the HTML structure and any existing English text as is. "
-                "Only translate the Chinese text into English. "
-                "Preserve all HTML tags, attributes, and formatting:\n\n"
-                + html_content
-            )
-
-            self.log_status("调用OpenAI API进行翻译...", "INFO")
-            completion = self.client.chat.completions.create(
-                model="gpt-4o",
-                messages=[{
-                    "role": "user",
-                    "content": user_prompt
-                }],
-                temperature=0.3
-            )
-
-            translated_text = completion.choices[0].message.content
+            if self.html_translate_mode == 'raw':
+                translated_text, stats = self._translate_html_raw(html_content), {"mode": "raw"}
+            else:
+                translated_text, stats = self._translate_html_text_nodes(html_content)
             translated_size = len(translated_text)
             self.log_status(f"翻译完成，大小: {translated_size} 字符", "DEBUG")
 
@@ -1411,12 +2007,13 @@ class WebTranslationWorkflow:
 
             if self.check_file_status(output_path):
                 self.log_status("HTML翻译完成", "SUCCESS")
-                return {
+                return dict(stats, **{
                     "success": True,
                     "translated_path": output_path,
+                    "translated_html": translated_text,
                     "original_length": content_size,
                     "translated_length": translated_size
-                }
+                })
             else:
                 raise Exception("翻译文件保存失败")
 
@@ -1427,68 +2024,205 @@ class WebTranslationWorkflow:
                 "error": f"翻译失败: {str(e)}"
             }
 
-    def generate_pdf_from_html_simple(self, html_path, pdf_output=None):
-        """从HTML生成PDF（带详细检查）"""
-        self.log_status(f"开始PDF生成流程: {html_path}", "INFO")
-        
-        if not self.check_file_status(html_path):
-            return {
-                "success": False,
-                "error": f"HTML文件不存在或无效: {html_path}"
-            }
+    def _translate_html_raw(self, html_content):
+        """整页HTML交给模型翻译（旧方式，标记也计入token）"""
+        user_prompt = (
+            "Please translate the following HTML content from Chinese to English. "
+            "Keep the HTML structure and any existing English text as is. "
+            "Only translate the Chinese text into English. "
+            "Preserve all HTML tags, attributes, and formatting:\n\n"
+            + html_content
+        )
 
-        if not pdf_output:
-            dir_path = os.path.dirname(html_path)
-            base_name = os.path.splitext(os.path.basename(html_path))[0]
-            pdf_output = os.path.join(dir_path, f"{base_name}.pdf")
+        self.log_status("调用OpenAI API进行翻译...", "INFO")
+        completion = self.client.chat.completions.create(
+            model="gpt-4o",
+            messages=[{
+                "role": "user",
+                "content": user_prompt
+            }],
+            temperature=0.3
+        )
+        return completion.choices[0].message.content
 
-        self.log_status(f"PDF输出路径: {pdf_output}", "DEBUG")
+    def _collect_segments(self, soup):
+        """
+        收集需要翻译的文本节点和属性
 
-        driver = None
-        try:
-            driver = self.setup_chrome_enhanced()
-            
-            local_file = os.path.abspath(html_path)
-            self.log_status(f"本地文件路径: {local_file}", "DEBUG")
-            
-            # 修复Windows文件路径问题
-            if os.name == 'nt':  # Windows
-                file_url = f"file:///{local_file.replace(os.sep, '/')}"
-            else:  # Unix/Linux/Mac
-                file_url = f"file://{local_file}"
-            
-            self.log_status(f"访问本地文件URL: {file_url}", "INFO")
-            
-            # 设置更长的超时时间
-            driver.set_page_load_timeout(60)
-            
-            try:
-                driver.get(file_url)
-                self.log_status("本地HTML文件加载成功", "SUCCESS")
-            except TimeoutException:
-                self.log_status("页面加载超时，但继续尝试生成PDF", "WARNING")
-            
-            # 检查页面状态
+        Returns:
+            tuple: (去重后的待翻译文本列表, 写回目标列表 [(节点, 属性名或None, 文本序号, 前导空白, 尾随空白)])
+        """
+        texts = []
+        index_of = {}
+        targets = []
+
+        def register(text):
+            if text not in index_of:
+                index_of[text] = len(texts)
+                texts.append(text)
+            return index_of[text]
+
+        for node in soup.find_all(string=True):
+            # 注释、CDATA、doctype 等都是 NavigableString 的子类，只处理普通文本
+            if type(node) is not NavigableString or node.find_parent(self.SKIP_TEXT_PARENTS):
+                continue
+            raw = str(node)
+            stripped = raw.strip()
+            if not stripped or not self.CJK_PATTERN.search(stripped):
+                continue
+            leading = raw[:len(raw) - len(raw.lstrip())]
+            trailing = raw[len(raw.rstrip()):]
+            targets.append((node, None, register(stripped), leading, trailing))
+
+        for tag in soup.find_all(True):
+            for attr in self.TRANSLATABLE_ATTRIBUTES:
+                value = tag.get(attr)
+                if isinstance(value, str) and self.CJK_PATTERN.search(value):
+                    targets.append((tag, attr, register(value.strip()), '', ''))
+
+        return texts, targets
+
+    def _batch_segments(self, texts):
+        """按字符数把片段分批，每批是片段序号列表"""
+        batches, current, size = [], [], 0
+        for index, text in enumerate(texts):
+            if current and size + len(text) > self.html_batch_chars:
+                batches.append(current)
+                current, size = [], 0
+            current.append(index)
+            size += len(text)
+        if current:
+            batches.append(current)
+        return batches
+
+    def _translate_segment_batch(self, indices, texts):
+        """翻译一批片段，返回 {片段序号: 译文}；模型漏掉的片段不返回"""
+        payload = {str(number): texts[index] for number, index in enumerate(indices, 1)}
+        messages = [
+            {
+                "role": "system",
+                "content": (
+                    "You translate text segments taken from a Chinese web page into English. "
+                    "The user sends a JSON object mapping ids to segments. Reply with a JSON object "
+                    "mapping the same ids to their English translations. Translate each segment on its own, "
+                    "do not merge or split segments, and keep existing English text, numbers and URLs unchanged."
+                )
+            },
+            {"role": "user", "content": json.dumps(payload, ensure_ascii=False)}
+        ]
+
+        for attempt in range(self.max_retries):
             try:
-                page_title = driver.title
-                self.log_status(f"页面标题: {page_title}", "DEBUG")
-                
-                # 检查页面内容
-                page_source_size = len(driver.page_source)
-                self.log_status(f"页面源码大小: {page_source_size} 字符", "DEBUG")
-                
-                if page_source_size < 100:
-                    self.log_status("警告：页面内容过少，可能加载失败", "WARNING")
-                
+                completion = self.client.chat.completions.create(
+                    model="gpt-4o",
+                    messages=messages,
+                    temperature=0.3,
+                    response_format={"type": "json_object"}
+                )
+                data = json.loads(completion.choices[0].message.content)
+                return {
+                    index: str(data[str(number)]) for number, index in enumerate(indices, 1)
+                    if isinstance(data.get(str(number)), (str, int, float)) and str(data[str(number)]).strip()
+                }
             except Exception as e:
-                self.log_status(f"获取页面信息时出错: {str(e)}", "WARNING")
-            
-            # 生成PDF
-            self.print_to_pdf_with_retry(driver, pdf_output)
-            
+                if attempt == self.max_retries - 1:
+                    raise
+                self.log_status(f"批量翻译失败，{self.retry_delay} 秒后重试: {str(e)}", "WARNING")
+                time.sleep(self.retry_delay)
+
+    def _translate_html_text_nodes(self, html_content):
+        """
+        只翻译文本节点和 alt/title/placeholder 属性，译文在本地写回DOM
+
+        部分批次失败时保留这些片段的原文；所有批次都失败或没有任何片段得到译文时抛出异常，
+        translate_html 返回失败，不写出未翻译的页面。
+        """
+        soup = BeautifulSoup(html_content, 'html.parser')
+        texts, targets = self._collect_segments(soup)
+        batches = self._batch_segments(texts)
+        self.log_status(
+            f"提取 {len(texts)} 个待翻译片段（{sum(len(t) for t in texts)} 字符），分 {len(batches)} 批翻译", "INFO"
+        )
+
+        translations = {}
+        failed_batches = 0
+        with ThreadPoolExecutor(max_workers=max(1, min(self.html_translate_workers, len(batches)))) as executor:
+            futures = [executor.submit(self._translate_segment_batch, batch, texts) for batch in batches]
+            for future in futures:
+                try:
+                    translations.update(future.result())
+                except Exception as e:
+                    failed_batches += 1
+                    self.log_status(f"一批片段翻译失败，保留原文: {str(e)}", "ERROR")
+
+        for node, attr, index, leading, trailing in targets:
+            translated = translations.get(index)
+            if translated is None:
+                continue
+            if attr is None:
+                node.replace_with(NavigableString(leading + translated + trailing))
+            else:
+                node[attr] = translated
+
+        untranslated = len(texts) - len(translations)
+        if batches and failed_batches == len(batches):
+            raise Exception(f"全部 {len(batches)} 批片段翻译失败")
+        if texts and untranslated == len(texts):
+            raise Exception(f"{len(texts)} 个片段都没有得到译文")
+        if untranslated:
+            self.log_status(f"{untranslated} 个片段未翻译，保留原文", "WARNING")
+        return str(soup), {
+            "mode": "text_nodes",
+            "segments": len(texts),
+            "batches": len(batches),
+            "failed_batches": failed_batches,
+            "untranslated_segments": untranslated
+        }
+
+    def load_html_in_tab(self, driver, html_content, wait_time=None):
+        """
+        把HTML直接写入当前标签页（Page.setDocumentContent），不经过磁盘和 file:// 导航
+
+        文档中的 <base> 决定相对地址的解析，图片、样式仍按租用时的拦截规则从源站加载。
+        """
+        driver.get("about:blank")
+        frame_id = driver.execute_cdp_cmd("Page.getFrameTree", {})["frameTree"]["frame"]["id"]
+        driver.execute_cdp_cmd("Page.setDocumentContent", {"frameId": frame_id, "html": html_content})
+        chrome_pool.count_page(driver)
+        readiness = wait_for_page_ready(driver, timeout=wait_time)
+        self.log_status(f"页面等待 {readiness['waited']} 秒", "DEBUG")
+        return readiness
+
+    def generate_pdfs_in_session(self, fetch_result, translated_html, pdf_output=None, wait_time=None, block='snapshot'):
+        """
+        在同一次浏览器租用中依次生成原始页面PDF和译文PDF
+
+        两份HTML都在内存中，通过 load_html_in_tab 注入同一个标签页；本次租用禁用JavaScript，
+        与获取网页时的静态快照一致。回放存档时拦截所有网络请求，不访问源站。
+        """
+        snapshot_dir = fetch_result["snapshot_dir"]
+        original_pdf = fetch_result["original_pdf_path"]
+        if not pdf_output:
+            pdf_output = os.path.join(snapshot_dir, "index_translated.pdf")
+        self.log_status(f"开始PDF生成流程: {pdf_output}", "INFO")
+
+        try:
+            with chrome_pool.lease(disable_js=True, block=block) as driver:
+                if fetch_result.get("fetch_cache") == "replay":
+                    driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": ["http://*", "https://*"]})
+
+                self.log_status("渲染原始页面...", "INFO")
+                self.load_html_in_tab(driver, fetch_result["html_content"], wait_time)
+                self.print_to_pdf_with_retry(driver, original_pdf)
+
+                self.log_status("渲染译文页面...", "INFO")
+                self.load_html_in_tab(driver, translated_html, wait_time)
+                self.print_to_pdf_with_retry(driver, pdf_output)
+
             return {
                 "success": True,
                 "pdf_path": pdf_output,
+                "original_pdf_path": original_pdf,
                 "file_size": os.path.getsize(pdf_output)
             }
 
@@ -1498,14 +2232,6 @@ class WebTranslationWorkflow:
                 "success": False,
                 "error": f"PDF生成失败: {str(e)}"
             }
-        finally:
-            if driver:
-                try:
-                    self.log_status("关闭Chrome浏览器...", "DEBUG")
-                    driver.quit()
-                    self.log_status("Chrome浏览器已关闭", "SUCCESS")
-                except Exception as e:
-                    self.log_status(f"关闭浏览器时出错: {str(e)}", "WARNING")
 
 # ========== 百度图片翻译类 ==========
 
@@ -1975,7 +2701,9 @@ def webpage_gpt_translate():
         workflow = WebTranslationWorkflow(api_key=api_key)
         
         # 步骤1: 获取网页
-        fetch_result = workflow.fetch_webpage_simple(url)
+        fetch_result = workflow.fetch_webpage_simple(
+            url, replay=bool(data.get('replay')), capture_id=data.get('capture_id')
+        )
         if not fetch_result["success"]:
             return jsonify({
                 'success': False,
@@ -1990,8 +2718,12 @@ def webpage_gpt_translate():
                 'error': f'翻译失败: {translate_result["error"]}'
             }), 500
         
-        # 步骤3: 生成PDF
-        pdf_result = workflow.generate_pdf_from_html_simple(translate_result["translated_path"])
+        # 步骤3: 在同一个浏览器标签页中生成原始页面PDF和译文PDF
+        translated_html = translate_result.get("translated_html")
+        if translated_html is None:
+            with open(translate_result["translated_path"], "r", encoding="utf-8") as f:
+                translated_html = f.read()
+        pdf_result = workflow.generate_pdfs_in_session(fetch_result, translated_html)
         if not pdf_result["success"]:
             return jsonify({
                 'success': False,
@@ -2011,7 +2743,9 @@ def webpage_gpt_translate():
             'download_url': f'/download/workflow/{fetch_result["folder_name"]}/{os.path.basename(pdf_result["pdf_path"])}',
             'file_size': pdf_result['file_size'],
             'original_pdf_url': f'/download/workflow/{fetch_result["folder_name"]}/{os.path.basename(fetch_result["original_pdf_path"])}',
-            'html_url': f'/download/workflow/{fetch_result["folder_name"]}/index_translated.html'
+            'html_url': f'/download/workflow/{fetch_result["folder_name"]}/index_translated.html',
+            'fetch_cache': fetch_result['fetch_cache'],
+            'capture_id': fetch_result['capture_id']
         })
         
     except Exception as e:
@@ -2939,8 +3673,8 @@ def test_pdf_preview():
 def check_chrome_availability():
     """检查Chrome是否可用"""
     try:
-        driver = setup_chrome()
-        driver.quit()
+        with chrome_pool.lease():
+            pass
         return True
     except Exception as e:
         print(f"Chrome检查失败: {str(e)}")
@@ -426,6 +426,7 @@ const SinglePreview = ({ material }) => {
 
 // LaTeX PDF预览组件
 const LatexPdfPreview = ({ material }) => {
+  const { actions } = useApp();
   const [pdfLoadError, setPdfLoadError] = useState(false);
   const [isLoading, setIsLoading] = useState(true);
 
@@ -441,6 +442,29 @@ const LatexPdfPreview = ({ material }) => {
     }
   }, [material.latexTranslationResult]);
 
+  // 草稿预览：正式LaTeX版本在后台生成，轮询直到结果替换草稿或出现错误
+  const isDraft = Boolean(latexResult?.draft) && !material.latexTranslationError;
+  useEffect(() => {
+    if (!isDraft || !material.clientId) return undefined;
+
+    const timer = setInterval(async () => {
+      try {
+        const materialsData = await materialAPI.getMaterials(material.clientId);
+        const latest = (materialsData.materials || []).find(m => m.id === material.id);
+        if (latest && (latest.latexTranslationResult !== material.latexTranslationResult || latest.latexTranslationError)) {
+          actions.updateMaterial(material.id, {
+            latexTranslationResult: latest.latexTranslationResult,
+            latexTranslationError: latest.latexTranslationError
+          });
+        }
+      } catch (error) {
+        console.error('查询LaTeX正式版本失败:', error);
+      }
+    }, 3000);
+
+    return () => clearInterval(timer);
+  }, [isDraft, material.id, material.clientId, material.latexTranslationResult, actions]);
+
   // 构建PDF预览URL
   const pdfPreviewUrl = React.useMemo(() => {
     if (!latexResult?.pdf_file) return null;
@@ -506,6 +530,9 @@ const LatexPdfPreview = ({ material }) => {
 
   return (
     <div className={styles.latexPdfPreview}>
+      {isDraft && (
+        <div className={styles.draftNotice}>草稿预览，正式LaTeX版本生成中...</div>
+      )}
       <div className={styles.pdfContainer}>
         {isLoading && (
           <div className={styles.pdfLoading}>
@@ -146,6 +146,16 @@ export const materialAPI = {
     return await api.post(`/api/materials/${materialId}/edit`, { description });
   },
 
+  // 按行范围修改LaTeX并重新编译
+  patchLatex: async (materialId, startLine, endLine, replacement, baseHash) => {
+    return await api.post(`/api/materials/${materialId}/latex/patch`, {
+      start_line: startLine,
+      end_line: endLine,
+      replacement,
+      base_hash: baseHash,
+    });
+  },
+
   // 选择翻译结果
   selectResult: async (materialId, resultType) => {
     return await api.post(`/api/materials/${materialId}/select`, { resultType });
@@ -157,8 +167,45 @@ export const materialAPI = {
   },
   
   // 开始翻译
-  startTranslation: async (clientId) => {
-    return await api.post(`/api/clients/${clientId}/materials/translate`);
+  startTranslation: async (clientId, options = {}) => {
+    return await api.post(`/api/clients/${clientId}/materials/translate`, options);
+  },
+
+  // 批量翻译网页材料：服务端每完成一个网址返回一行JSON，逐行回调 onResult
+  translateWebpages: async (clientId, { urls, materialIds, engine = 'gpt', contentMode } = {}, onResult) => {
+    const response = await fetch(`${api.defaults.baseURL}/api/clients/${clientId}/materials/webpages/translate`, {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+        Authorization: `Bearer ${localStorage.getItem('auth_token')}`,
+      },
+      body: JSON.stringify({ urls, material_ids: materialIds, engine, content_mode: contentMode }),
+    });
+    if (!response.ok) {
+      throw new Error((await response.json()).error || `HTTP ${response.status}`);
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    const lines = [];
+    let buffer = '';
+    for (;;) {
+      const { done, value } = await reader.read();
+      buffer += decoder.decode(value || new Uint8Array(), { stream: !done });
+      const parts = buffer.split('\n');
+      buffer = done ? '' : parts.pop();
+      parts.filter(Boolean).forEach((part) => {
+        const line = JSON.parse(part);
+        lines.push(line);
+        if (onResult) onResult(line);
+      });
+      if (done) return lines;
+    }
+  },
+
+  // 查询LaTeX离线批量任务状态（startTranslation 传入 { latex_mode: 'bulk' } 时返回 job_id）
+  getLatexBatchStatus: async (jobId) => {
+    return await api.get(`/api/latex/batches/${jobId}`);
   },
   
   // 取消上传
@@ -218,9 +265,9 @@ export const translationAPI = {
     return await api.post('/api/webpage-google-translate', { url });
   },
 
-  // 网页翻译（GPT）
-  translateWebpageGPT: async (url) => {
-    return await api.post('/api/webpage-gpt-translate', { url });
+  // 网页翻译（GPT）；contentMode 为 'main'（只翻译正文）或 'full'（整页），不传时使用服务端默认值
+  translateWebpageGPT: async (url, contentMode) => {
+    return await api.post('/api/webpage-gpt-translate', { url, content_mode: contentMode });
   },
 };
 